@@ -5,8 +5,9 @@ from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
 import os
+from app.database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 migrate = Migrate()
 login = LoginManager()
 csrf = CSRFProtect()
@@ -25,11 +26,35 @@ def create_app(config_class=Config):
     except OSError:
         pass
 
+    # Pool options must be in place before the engine is created; the SQLite
+    # pragmas hook onto the engine once it exists.
+    from app import database, sharding
+    database.configure_engine_options(app)
+    sharding.configure_binds(app)
     db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            database.install_sqlite_pragmas(engine, app.config)
     migrate.init_app(app, db)
     login.init_app(app)
     csrf.init_app(app)
 
+    from app import assets, compression, events, heatmap, identity, ingest, jsonprovider, metrics, passwords, profiling
+    identity.init_app(app)
+    passwords.init_app(app)
+    # Before profiling, which times whatever app.json.dumps is at that point.
+    jsonprovider.init_app(app)
+    profiling.init_app(app)
+    metrics.init_app(app)
+    # After profiling and metrics: their hooks run later, so they count the
+    # compression time and see the final response.
+    compression.init_app(app)
+    events.init_app(app)
+    heatmap.init_app(app)
+    ingest.init_app(app)
+    sharding.init_app(app)
+    assets.init_app(app)
+
     # Register blueprints
     from app.auth import bp as auth_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
@@ -37,4 +62,10 @@ def create_app(config_class=Config):
     from app.routes import bp as main_bp
     app.register_blueprint(main_bp)
 
+    from app.cli import bp as cli_bp
+    app.register_blueprint(cli_bp)
+
+    from app.bench import bp as bench_bp
+    app.register_blueprint(bench_bp)
+
     return app
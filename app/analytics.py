@@ -0,0 +1,137 @@
+"""Aggregations over a girl's plot history: time buckets and downsampling."""
+from datetime import timezone
+
+import numpy as np
+from sqlalchemy import func, select
+
+from app import db
+from app.models import Plot
+
+
+BUCKETS = ("day", "week", "month")
+# Rows fetched per round trip when streaming a plot series.
+SERIES_CHUNK_SIZE = 5000
+# Ids per IN list when fetching the sampled rows (old SQLite allows 999 parameters).
+ID_CHUNK_SIZE = 500
+
+
+def bucket_start(bucket, dialect_name):
+    """SQL expression for the ``YYYY-MM-DD`` start of the bucket holding a plot.
+
+    Weeks start on Monday.
+    """
+    if dialect_name == "postgresql":
+        return func.to_char(func.date_trunc(bucket, Plot.plot_date), "YYYY-MM-DD")
+    if bucket == "day":
+        return func.strftime("%Y-%m-%d", Plot.plot_date)
+    if bucket == "week":
+        # Jump forward to the week's Sunday, then back six days to its Monday.
+        return func.strftime("%Y-%m-%d", Plot.plot_date, "weekday 0", "-6 days")
+    return func.strftime("%Y-%m-01", Plot.plot_date)
+
+
+def bucketed_scores(girl_id, bucket, filters=()):
+    """Return mean/min/max/count of both scores per time bucket, oldest first."""
+    start = bucket_start(bucket, db.engine.dialect.name).label("start")
+    statement = (
+        select(
+            start,
+            func.count(Plot.id),
+            func.avg(Plot.hot_score),
+            func.min(Plot.hot_score),
+            func.max(Plot.hot_score),
+            func.avg(Plot.crazy_score),
+            func.min(Plot.crazy_score),
+            func.max(Plot.crazy_score),
+        )
+        .where(Plot.girl_id == girl_id, *filters)
+        .group_by(start)
+        .order_by(start)
+    )
+    return [
+        {
+            "start": row[0],
+            "count": row[1],
+            "hot": {"mean": round(row[2], 2), "min": row[3], "max": row[4]},
+            "crazy": {"mean": round(row[5], 2), "min": row[6], "max": row[7]},
+        }
+        for row in db.session.execute(statement)
+    ]
+
+
+def lttb(times, values, threshold):
+    """Pick ``threshold`` indices that preserve the shape of a series.
+
+    Largest-Triangle-Three-Buckets: keep the first and last points, split
+    the rest into equal buckets and, from each, keep the point forming the
+    largest triangle with the previously kept point and the average of the
+    next bucket. ``values`` may have several columns (here hot and crazy);
+    their triangle areas are summed so both series keep their shape.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64).reshape(len(times), -1)
+    count = len(times)
+    if threshold >= count or threshold < 3:
+        return np.arange(count)
+
+    edges = np.linspace(1, count - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = count - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_stop = edges[bucket + 2] if bucket + 2 < len(edges) else count
+        next_time = times[stop:next_stop].mean()
+        next_values = values[stop:next_stop].mean(axis=0)
+
+        candidate_times = times[start:stop]
+        candidate_values = values[start:stop]
+        areas = np.abs(
+            (times[previous] - next_time) * (candidate_values - values[previous])
+            - (times[previous] - candidate_times)[:, None] * (next_values - values[previous])
+        ).sum(axis=1)
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def _plot_series(girl_id, filters):
+    """Stream ``(ids, times, values)`` of a girl's plots, oldest first, as NumPy arrays.
+
+    Only the ids, dates and scores are read, a chunk at a time, so notes and
+    row objects for the whole history never sit in memory at once.
+    """
+    result = db.session.execute(
+        select(Plot.id, Plot.plot_date, Plot.hot_score, Plot.crazy_score)
+        .where(Plot.girl_id == girl_id, *filters)
+        .order_by(Plot.plot_date, Plot.id)
+        .execution_options(yield_per=SERIES_CHUNK_SIZE)
+    )
+    ids, times, values = [], [], []
+    for chunk in result.partitions():
+        ids.append(np.array([row.id for row in chunk], dtype=np.int64))
+        # Dates are stored as naive UTC; timestamp() alone would read them as local time.
+        times.append(np.array([row.plot_date.replace(tzinfo=timezone.utc).timestamp() for row in chunk]))
+        values.append(np.array([(row.hot_score, row.crazy_score) for row in chunk], dtype=np.float64))
+    if not ids:
+        return np.empty(0, dtype=np.int64), np.empty(0), np.empty((0, 2))
+    return np.concatenate(ids), np.concatenate(times), np.concatenate(values)
+
+
+def downsampled_plots(girl_id, max_points, filters=()):
+    """Return ``(plots, total)`` where ``plots`` is an LTTB sample of at most ``max_points`` rows."""
+    columns = (Plot.id, Plot.hot_score, Plot.crazy_score, Plot.notes, Plot.plot_date)
+    ids, times, values = _plot_series(girl_id, filters)
+    if len(ids) <= max_points:
+        rows = db.session.execute(
+            select(*columns).where(Plot.girl_id == girl_id, *filters).order_by(Plot.plot_date, Plot.id)
+        ).all()
+        return rows, len(rows)
+
+    selected = ids[lttb(times, values, max_points)].tolist()
+    by_id = {}
+    for start in range(0, len(selected), ID_CHUNK_SIZE):
+        chunk = selected[start:start + ID_CHUNK_SIZE]
+        by_id.update((row.id, row) for row in db.session.execute(select(*columns).where(Plot.id.in_(chunk))))
+    return [by_id[plot_id] for plot_id in selected if plot_id in by_id], len(ids)
@@ -0,0 +1,267 @@
+"""Fingerprinted, precompressed static assets.
+
+``flask assets build`` (run by boot.sh before the workers start) copies
+every file under ``app/static`` into ``ASSETS_DIST_DIR`` under a name that
+includes a hash of its content (``js/main.3f9c2a1b7d4e.js``), next to
+``.gz`` and, when the brotli package is installed, ``.br`` copies of the
+text files. The zone artwork also gets a pre-inverted ``.dark.png``
+variant, so the dashboard no longer inverts every image on a canvas at
+each page load. ``manifest.json`` maps the original names to the hashed
+ones and is written last, so a half-finished build is never used.
+
+Templates link assets through ``asset_url``. Hashed files are served from
+``/assets/`` with ``Cache-Control: immutable`` for a year: any change gets
+a new name, so browsers never need to revalidate them. Without a build
+``asset_url`` falls back to the plain static route.
+"""
+import fnmatch
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import struct
+import zlib
+
+from flask import Blueprint, abort, current_app, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+from app import zones
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional, gzip is always built
+    brotli = None
+
+
+MANIFEST = "manifest.json"
+IMMUTABLE = "public, max-age=31536000, immutable"
+COMPRESSIBLE = {".css", ".ico", ".js", ".json", ".svg", ".txt", ".webmanifest"}
+# Zone artwork drawn on the chart; each gets a dark-theme variant.
+INVERTED = "images/*-zone.png"
+# Variants only worth keeping if they save at least this share of the bytes.
+MIN_SAVING = 0.05
+
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+
+bp = Blueprint("assets", __name__)
+
+
+def dark_name(name):
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.dark{ext}"
+
+
+def fingerprint(name, data):
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def _png_chunks(data):
+    if data[:8] != b"\x89PNG\r\n\x1a\n":
+        raise ValueError("not a PNG file")
+    offset = 8
+    while offset < len(data):
+        (length,) = struct.unpack(">I", data[offset:offset + 4])
+        kind = data[offset + 4:offset + 8]
+        yield kind, data[offset + 8:offset + 8 + length]
+        offset += length + 12
+
+
+def _png_chunk(kind, body):
+    return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+
+
+def _unfilter(raw, width, height, bpp):
+    """Undo the per-row PNG filters; returns the rows without filter bytes."""
+    stride = width * bpp
+    rows = []
+    previous = bytearray(stride)
+    offset = 0
+    for _ in range(height):
+        kind = raw[offset]
+        row = bytearray(raw[offset + 1:offset + 1 + stride])
+        offset += stride + 1
+        for i in range(stride):
+            left = row[i - bpp] if i >= bpp else 0
+            up = previous[i]
+            if kind == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif kind == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif kind == 3:
+                row[i] = (row[i] + (left + up) // 2) & 0xFF
+            elif kind == 4:
+                upper_left = previous[i - bpp] if i >= bpp else 0
+                estimate = left + up - upper_left
+                distances = (abs(estimate - left), abs(estimate - up), abs(estimate - upper_left))
+                row[i] = (row[i] + (left, up, upper_left)[distances.index(min(distances))]) & 0xFF
+        rows.append(row)
+        previous = row
+    return rows
+
+
+def invert_png(data):
+    """Invert the colours of a PNG, keeping its alpha, like the dashboard used to on a canvas.
+
+    Handles palette images and 8-bit grey/RGB images with or without alpha,
+    not interlaced; raises ``ValueError`` for anything else.
+    """
+    chunks = list(_png_chunks(data))
+    width, height, depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", chunks[0][1])
+    if color_type == 3:
+        output = []
+        for kind, body in chunks:
+            if kind == b"PLTE":
+                body = bytes(255 - value for value in body)
+            output.append(_png_chunk(kind, body))
+        return data[:8] + b"".join(output)
+
+    channels = {0: 1, 2: 3, 4: 2, 6: 4}.get(color_type)
+    if channels is None or depth != 8 or interlace:
+        raise ValueError(f"unsupported PNG (colour type {color_type}, depth {depth}, interlace {interlace})")
+    colors = 3 if color_type in (2, 6) else 1
+    rows = _unfilter(zlib.decompress(b"".join(body for kind, body in chunks if kind == b"IDAT")),
+                     width, height, channels)
+    raw = bytearray()
+    for row in rows:
+        for start in range(0, len(row), channels):
+            for i in range(start, start + colors):
+                row[i] = 255 - row[i]
+        raw += b"\x00" + row
+
+    output = []
+    for kind, body in chunks:
+        if kind == b"IDAT":
+            if output and output[-1][4:8] == b"IDAT":
+                continue
+            body = zlib.compress(bytes(raw), 9)
+        output.append(_png_chunk(kind, body))
+    return data[:8] + b"".join(output)
+
+
+def _variants(data):
+    """``{suffix: bytes}`` of the precompressed copies worth keeping."""
+    variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(data, quality=11)
+    return {
+        suffix: compressed
+        for suffix, compressed in variants.items()
+        if len(compressed) <= len(data) * (1 - MIN_SAVING)
+    }
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as handle:
+        handle.write(data)
+
+
+def _sources(static_dir, output_dir):
+    output_dir = os.path.abspath(output_dir)
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root) == output_dir:
+            dirs[:] = []
+            continue
+        dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != output_dir)
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            with open(path, "rb") as handle:
+                yield os.path.relpath(path, static_dir).replace(os.sep, "/"), handle.read()
+
+
+def build(static_dir, output_dir, clean=False):
+    """Write the hashed and precompressed assets and their manifest; returns the manifest.
+
+    Files of earlier builds stay unless ``clean`` is set, so pages rendered
+    before a deploy can still load theirs.
+    """
+    manifest = {}
+    written = {MANIFEST}
+    for name, data in _sources(static_dir, output_dir):
+        files = [(name, data)]
+        if fnmatch.fnmatch(name, INVERTED):
+            try:
+                files.append((dark_name(name), invert_png(data)))
+            except ValueError as error:
+                current_app.logger.warning("Not inverting %s: %s", name, error)
+        for logical, content in files:
+            hashed = fingerprint(logical, content)
+            manifest[logical] = hashed
+            _write(os.path.join(output_dir, hashed), content)
+            written.add(hashed)
+            if os.path.splitext(logical)[1] in COMPRESSIBLE:
+                for suffix, compressed in _variants(content).items():
+                    _write(os.path.join(output_dir, hashed + suffix), compressed)
+                    written.add(hashed + suffix)
+
+    tmp_path = os.path.join(output_dir, MANIFEST + ".tmp")
+    with open(tmp_path, "w") as handle:
+        json.dump(manifest, handle, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(output_dir, MANIFEST))
+
+    if clean:
+        for root, _, files in os.walk(output_dir):
+            for filename in files:
+                path = os.path.join(root, filename)
+                if os.path.relpath(path, output_dir).replace(os.sep, "/") not in written:
+                    os.unlink(path)
+    return manifest
+
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST)) as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return {}
+
+
+def asset_url(name):
+    """URL of a static file: its hashed build when there is one, else the plain static route."""
+    hashed = current_app.extensions["assets"].get(name)
+    if hashed is None:
+        return url_for("static", filename=name)
+    return url_for("assets.serve", filename=hashed)
+
+
+def zone_images():
+    """Light and dark artwork URLs per zone; ``dark`` is ``None`` without a build."""
+    manifest = current_app.extensions["assets"]
+    images = {}
+    for zone in zones.ZONES:
+        name = f"images/{zone.key}.png"
+        images[zone.key] = {
+            "light": asset_url(name),
+            "dark": asset_url(dark_name(name)) if dark_name(name) in manifest else None,
+        }
+    return images
+
+
+@bp.route("/assets/<path:filename>")
+def serve(filename):
+    """Serve a hashed asset, precompressed when the client accepts it."""
+    directory = current_app.config["ASSETS_DIST_DIR"]
+    if filename == MANIFEST:
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        path = safe_join(directory, filename + suffix)
+        if request.accept_encodings[encoding] and path is not None and os.path.isfile(path):
+            response = send_from_directory(directory, filename + suffix, mimetype=mimetype)
+            response.content_encoding = encoding
+            break
+    else:
+        response = send_from_directory(directory, filename, mimetype=mimetype)
+    response.headers["Cache-Control"] = IMMUTABLE
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def init_app(app):
+    """Load the manifest of the last build and register ``asset_url`` for templates."""
+    app.extensions["assets"] = load_manifest(app.config["ASSETS_DIST_DIR"])
+    app.add_template_global(asset_url)
+    app.add_template_global(zone_images)
+    app.register_blueprint(bp)
@@ -1,6 +1,6 @@
 from flask import Blueprint, render_template, redirect, url_for, flash
 from flask_login import login_user, logout_user, current_user, login_required
-from app import db
+from app import db, deletion, passwords, sharding
 from app.models import User
 from app.forms import LoginForm, RegistrationForm, DeleteAccountForm
 
@@ -13,9 +13,13 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
-        if user is None or not user.check_password(form.password.data):
+        if user is None or user.pending_deletion or not user.check_password(form.password.data):
             flash('Invalid username or password')
             return redirect(url_for('auth.login'))
+        if passwords.needs_rehash(user.password_hash):
+            # Hashing settings changed since this hash was made; upgrade it.
+            user.set_password(form.password.data)
+            db.session.commit()
         login_user(user, remember=form.remember_me.data)
         return redirect(url_for('main.dashboard'))
     return render_template('login.html', title='Sign In', form=form)
@@ -34,6 +38,9 @@ def register():
         user = User(username=form.username.data)
         user.set_password(form.password.data)
         db.session.add(user)
+        if sharding.enabled():
+            db.session.flush()
+            user.shard_id = sharding.home_shard(user.id)
         db.session.commit()
         flash('Congratulations, you are now a registered user!')
         return redirect(url_for('auth.login'))
@@ -44,22 +51,19 @@ def register():
 def delete_account():
     form = DeleteAccountForm()
     if form.validate_on_submit():
-        if not current_user.check_password(form.password.data):
+        # Check against the stored hash rather than the cached identity.
+        user_to_delete = db.session.get(User, current_user.id)
+        if user_to_delete is None or not user_to_delete.check_password(form.password.data):
             flash('Incorrect password. Account not deleted.')
             return redirect(url_for('auth.delete_account'))
-        
-        # Get the actual user object from the database BEFORE logging out.
-        user_to_delete = User.query.get(current_user.id)
+
         logout_user()
-        
-        # Delete the user object we retrieved earlier.
-        if user_to_delete:
-            db.session.delete(user_to_delete)
-            db.session.commit()
+
+        # Large accounts are marked here and removed by a background job.
+        if deletion.delete_account(user_to_delete.id):
             flash('Your account has been permanently deleted.')
         else:
-            # This case should ideally not be reached
-            flash('An error occurred. Could not find user to delete.')
+            flash('Your account is being deleted. This may take a few minutes.')
 
         return redirect(url_for('auth.login'))
         
@@ -0,0 +1,466 @@
+"""``flask bench``: synthetic data and reproducible API benchmarks.
+
+``seed`` fills the configured database with generated users, girls and
+plots. ``run`` does the same on a scratch database, then drives every API
+route through the Flask test client and reports latency percentiles, SQL
+statements per request and peak RSS as JSON, so runs on different commits
+can be compared with ``compare``. ``first-paint`` measures the static bytes
+a dashboard visit downloads, with and without ``flask assets build``.
+"""
+from datetime import datetime, timedelta
+import json
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import click
+from flask import Blueprint
+import numpy as np
+from sqlalchemy import event, func, insert, select
+
+from app import db
+
+
+bp = Blueprint("bench", __name__, cli_group="bench")
+
+
+# Each case is replayed ``--requests`` times. Placeholders are filled from the
+# seeded data; ``etag`` cases send back the ETag of a first plain request.
+BENCH_CASES = [
+    ("girls", "GET", "/api/girls", None),
+    ("girls_304", "GET", "/api/girls", "etag"),
+    ("plots", "GET", "/api/girls/{girl_id}/plots", None),
+    ("plots_page", "GET", "/api/girls/{girl_id}/plots?limit=100", None),
+    ("plots_batch", "GET", "/api/plots?girl_ids={girl_ids}", None),
+    ("plots_columnar", "GET", "/api/plots?girl_ids={girl_ids}&format=columnar", None),
+    ("averages", "GET", "/api/averages?girl_ids={girl_ids}", None),
+    ("rolling", "GET", "/api/rolling?girl_ids={girl_ids}&plots=20&days=30", None),
+    ("zones", "GET", "/api/zones?girl_ids={girl_ids}", None),
+    ("trend_week", "GET", "/api/girls/{girl_id}/trend?bucket=week", None),
+    ("trend_lttb", "GET", "/api/girls/{girl_id}/trend?mode=lttb&max_points=200", None),
+    ("search", "GET", "/api/search?q=fine&limit=50", None),
+    ("heatmap", "GET", "/api/heatmap?girl_ids={girl_ids}&hot_bins=40&crazy_bins=24", None),
+    ("export", "GET", "/api/export", None),
+    ("create_plot", "POST", "/api/plots", {"girl_id": "{girl_id}", "hot_score": 7.2, "crazy_score": 6.1}),
+    ("update_plot", "PUT", "/api/plots/{plot_id}", {"hot_score": 6.4}),
+]
+
+
+def _generate_plots(rng, girl_ids, plots_per_girl, now):
+    """Build plot rows with per-girl tendencies and a spread of dates over two years."""
+    rows = []
+    for girl_id in girl_ids:
+        hot_center = rng.uniform(3, 9)
+        crazy_center = rng.uniform(5, 9)
+        hot = np.clip(rng.normal(hot_center, 1.2, plots_per_girl), 0, 10).round(1)
+        crazy = np.clip(rng.normal(crazy_center, 0.9, plots_per_girl), 4, 10).round(1)
+        first_seen = rng.uniform(30, 730)
+        ages = np.sort(rng.uniform(0, first_seen, plots_per_girl))[::-1]
+        notes = rng.random(plots_per_girl) < 0.3
+        for index in range(plots_per_girl):
+            rows.append(
+                {
+                    "girl_id": girl_id,
+                    "hot_score": float(hot[index]),
+                    "crazy_score": float(crazy[index]),
+                    "notes": f"Observation {index}: seemed fine at the time." if notes[index] else None,
+                    "plot_date": now - timedelta(days=float(ages[index])),
+                }
+            )
+    return rows
+
+
+def seed_data(users, girls, plots, seed=0, prefix="bench"):
+    """Insert ``users`` x ``girls`` x ``plots`` synthetic rows; returns the new user ids."""
+    from app import rolling, sharding, stats
+    from app.models import Girl, GirlStats, Plot, User
+
+    rng = np.random.default_rng(seed)
+    now = datetime.utcnow()
+    template = User(username=f"{prefix}-template")
+    template.set_password("benchmark-password")
+
+    user_ids = []
+    for user_index in range(users):
+        user = User(username=f"{prefix}-{seed}-{user_index}", password_hash=template.password_hash)
+        db.session.add(user)
+        db.session.flush()
+        user_ids.append(user.id)
+        if sharding.enabled():
+            user.shard_id = sharding.home_shard(user.id)
+
+        with sharding.use_shard(user.shard_id):
+            girl_rows = [
+                Girl(name=f"Subject {girl_index:03d}", user_id=user.id, stats=GirlStats())
+                for girl_index in range(girls)
+            ]
+            db.session.add_all(girl_rows)
+            db.session.flush()
+
+            rows = _generate_plots(rng, [girl.id for girl in girl_rows], plots, now)
+            for start in range(0, len(rows), 5000):
+                db.session.execute(insert(Plot), rows[start:start + 5000])
+            for girl in girl_rows:
+                stats.recompute(girl.id)
+                rolling.recompute(girl.id)
+            db.session.commit()
+    return user_ids
+
+
+def _peak_rss_kib():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _fill(template, ids):
+    if isinstance(template, dict):
+        return {key: _fill(value, ids) for key, value in template.items()}
+    if isinstance(template, str):
+        value = template.format(**ids)
+        return int(value) if template.startswith("{") and value.isdigit() else value
+    return template
+
+
+def run_case(app, client, method, path, body, requests):
+    """Replay one request ``requests`` times; returns latency and query statistics."""
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    headers = {}
+    if body == "etag":
+        headers["If-None-Match"] = client.get(path).headers.get("ETag", "")
+        body = None
+
+    timings = []
+    status_codes = {}
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = client.open(path, method=method, json=body, headers=headers)
+            response.get_data()
+            timings.append(time.perf_counter() - start)
+            status_codes[response.status_code] = status_codes.get(response.status_code, 0) + 1
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    milliseconds = np.array(timings) * 1000
+    return {
+        "requests": requests,
+        "p50_ms": round(float(np.percentile(milliseconds, 50)), 3),
+        "p95_ms": round(float(np.percentile(milliseconds, 95)), 3),
+        "p99_ms": round(float(np.percentile(milliseconds, 99)), 3),
+        "mean_ms": round(float(milliseconds.mean()), 3),
+        "queries_per_request": round(statements[0] / requests, 2),
+        "status_codes": {str(code): seen for code, seen in sorted(status_codes.items())},
+        "peak_rss_kib": _peak_rss_kib(),
+    }
+
+
+@bp.cli.command("seed")
+@click.option("--users", default=10, show_default=True)
+@click.option("--girls", default=20, show_default=True, help="Girls per user.")
+@click.option("--plots", default=200, show_default=True, help="Plots per girl.")
+@click.option("--seed", default=0, show_default=True, help="Random seed; the same seed gives the same data.")
+def seed(users, girls, plots, seed):
+    """Add synthetic users, girls and plots to the configured database."""
+    start = time.perf_counter()
+    user_ids = seed_data(users, girls, plots, seed=seed)
+    click.echo(f"Seeded {len(user_ids)} users x {girls} girls x {plots} plots "
+               f"in {time.perf_counter() - start:.1f}s.")
+
+
+@bp.cli.command("run")
+@click.option("--girls", default=20, show_default=True, help="Girls for the benchmarked user.")
+@click.option("--plots", default=500, show_default=True, help="Plots per girl.")
+@click.option("--other-users", default=5, show_default=True, help="Extra users seeded alongside, as background data.")
+@click.option("--requests", default=100, show_default=True, help="Requests per case.")
+@click.option("--seed", default=0, show_default=True)
+@click.option("--case", "only", multiple=True, help="Run only these cases (repeatable).")
+@click.option("--output", type=click.File("w"), default=None, help="Write the JSON report here.")
+def run(girls, plots, other_users, requests, seed, only, output):
+    """Benchmark every API route against a freshly seeded scratch database."""
+    from app.cli import logged_in_client, scratch_app
+    from app.models import Girl, Plot
+
+    with scratch_app("bench") as app:
+        with app.app_context():
+            seed_data(other_users, girls, plots, seed=seed + 1, prefix="background")
+            user_id = seed_data(1, girls, plots, seed=seed)[0]
+            girl_ids = [girl.id for girl in Girl.query.filter_by(user_id=user_id).order_by(Girl.id)]
+            plot_id = Plot.query.filter_by(girl_id=girl_ids[0]).first().id
+        ids = {
+            "girl_id": girl_ids[0],
+            "girl_ids": ",".join(str(girl_id) for girl_id in girl_ids),
+            "plot_id": plot_id,
+        }
+        client = logged_in_client(app, user_id)
+
+        results = {}
+        for name, method, path, body in BENCH_CASES:
+            if only and name not in only:
+                continue
+            results[name] = run_case(app, client, method, _fill(path, ids), _fill(body, ids), requests)
+            result = results[name]
+            click.echo(f"{name:<14} p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  "
+                       f"p99 {result['p99_ms']:>8.2f} ms  {result['queries_per_request']:>5} q/req")
+
+        report = {
+            "commit": _git_commit(),
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "params": {"girls": girls, "plots": plots, "other_users": other_users,
+                       "requests": requests, "seed": seed},
+            "peak_rss_kib": _peak_rss_kib(),
+            "results": results,
+        }
+        click.echo(f"Peak RSS {report['peak_rss_kib'] / 1024:.1f} MiB")
+        if output is not None:
+            json.dump(report, output, indent=2)
+            output.write("\n")
+
+
+@bp.cli.command("compare")
+@click.argument("baseline", type=click.File("r"))
+@click.argument("candidate", type=click.File("r"))
+def compare(baseline, candidate):
+    """Show per-case p50/p95 and query changes between two ``run`` reports."""
+    before = json.load(baseline)
+    after = json.load(candidate)
+    click.echo(f"{before.get('commit') or '?'}  ->  {after.get('commit') or '?'}")
+    for name, new in after["results"].items():
+        old = before["results"].get(name)
+        if old is None:
+            click.echo(f"{name:<14} (new)")
+            continue
+        deltas = []
+        for key in ("p50_ms", "p95_ms"):
+            change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            deltas.append(f"{key[:3]} {old[key]:.2f} -> {new[key]:.2f} ms ({change:+.0f}%)")
+        deltas.append(f"q/req {old['queries_per_request']} -> {new['queries_per_request']}")
+        click.echo(f"{name:<14} " + "  ".join(deltas))
+
+
+@bp.cli.command("zones")
+@click.option("--points", default=1_000_000, show_default=True, help="Number of random points to classify.")
+@click.option("--repeat", default=5, show_default=True, help="Number of timed runs.")
+def bench_zones(points, repeat):
+    """Time zones.classify on uniformly random points across the matrix."""
+    from app import zones
+
+    rng = np.random.default_rng(0)
+    hot = rng.uniform(0, 10, points)
+    crazy = rng.uniform(4, 10, points)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = zones.classify(hot, crazy)
+        timings.append(time.perf_counter() - start)
+
+    distribution = np.bincount(result + 1, minlength=len(zones.ZONES) + 1)
+    click.echo(f"Classified {points:,} points: best {min(timings) * 1000:.1f} ms, "
+               f"median {sorted(timings)[len(timings) // 2] * 1000:.1f} ms over {repeat} runs")
+    click.echo(f"  unclassified: {distribution[0]:,}")
+    for zone, count in zip(zones.ZONES, distribution[1:]):
+        click.echo(f"  {zone.label}: {count:,}")
+
+
+def _percentiles(timings):
+    milliseconds = np.array(timings or [0.0]) * 1000
+    return {f"p{q}_ms": round(float(np.percentile(milliseconds, q)), 2) for q in (50, 95, 99)}
+
+
+@bp.cli.command("login")
+@click.option("--users", default=20, show_default=True, help="Accounts to log in as.")
+@click.option("--login-threads", default=8, show_default=True, help="Threads logging in back to back.")
+@click.option("--api-threads", default=4, show_default=True, help="Threads calling /api/girls meanwhile.")
+@click.option("--duration", default=10.0, show_default=True, help="Seconds to run.")
+@click.option("--hash-workers", type=int, default=None, help="Override PASSWORD_HASH_WORKERS (0 hashes inline).")
+@click.option("--hash-method", default=None, help="Override PASSWORD_HASH_METHOD.")
+def bench_login(users, login_threads, api_threads, duration, hash_workers, hash_method):
+    """Measure login throughput and API tail latency under mixed load."""
+    import threading
+
+    from app.cli import logged_in_client, scratch_app
+
+    overrides = {}
+    if hash_workers is not None:
+        overrides["PASSWORD_HASH_WORKERS"] = hash_workers
+    if hash_method is not None:
+        overrides["PASSWORD_HASH_METHOD"] = hash_method
+    with scratch_app("login", **overrides) as app:
+        with app.app_context():
+            user_ids = seed_data(users, 5, 50, prefix="login")
+        usernames = [f"login-0-{index}" for index in range(users)]
+
+        logins, rejected, api_calls = [], [], []
+        deadline = time.perf_counter() + duration
+
+        def log_in_repeatedly(index):
+            client = app.test_client()
+            form = {"username": usernames[index % users], "password": "benchmark-password"}
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = client.post("/auth/login", data=form)
+                elapsed = time.perf_counter() - start
+                if response.status_code == 503:
+                    rejected.append(elapsed)
+                else:
+                    logins.append(elapsed)
+                    client.get("/auth/logout")
+
+        def call_api(index):
+            client = logged_in_client(app, user_ids[index % users])
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                client.get("/api/girls").get_data()
+                api_calls.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=log_in_repeatedly, args=(index,)) for index in range(login_threads)]
+        threads += [threading.Thread(target=call_api, args=(index,)) for index in range(api_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        config = app.config
+        click.echo(f"{config['PASSWORD_HASH_METHOD']}, {config['PASSWORD_HASH_WORKERS']} hash workers, "
+                   f"{login_threads} login + {api_threads} API threads for {duration:.0f}s")
+        login_stats = _percentiles(logins)
+        click.echo(f"logins  {len(logins) / duration:>7.1f}/s  p50 {login_stats['p50_ms']:>8.2f} ms  "
+                   f"p95 {login_stats['p95_ms']:>8.2f} ms  rejected {len(rejected)}")
+        api_stats = _percentiles(api_calls)
+        click.echo(f"api     {len(api_calls) / duration:>7.1f}/s  p50 {api_stats['p50_ms']:>8.2f} ms  "
+                   f"p95 {api_stats['p95_ms']:>8.2f} ms  p99 {api_stats['p99_ms']:>8.2f} ms")
+
+
+@bp.cli.command("clicks")
+@click.option("--threads", default=16, show_default=True, help="Users clicking at once, one thread each.")
+@click.option("--duration", default=10.0, show_default=True, help="Seconds to run.")
+@click.option("--write-behind/--no-write-behind", default=False, show_default=True,
+              help="Journal plots and flush them in the background (INGEST_WRITE_BEHIND).")
+@click.option("--shards", default=0, show_default=True, help="Spread the users over this many shards (SHARD_COUNT).")
+def bench_clicks(threads, duration, write_behind, shards):
+    """Measure plot creation under a burst of chart clicks from many users."""
+    import threading
+
+    from app import sharding
+    from app.cli import logged_in_client, scratch_app
+    from app.models import Girl, Plot
+
+    overrides = {"INGEST_WRITE_BEHIND": write_behind, "SHARD_COUNT": shards}
+    with scratch_app("clicks", **overrides) as app:
+        with app.app_context():
+            user_ids = seed_data(threads, 2, 50, prefix="clicks")
+            girl_ids = []
+            for user_id in user_ids:
+                with sharding.use_user_shard(user_id):
+                    girl_ids.append(db.session.scalar(select(Girl.id).where(Girl.user_id == user_id)))
+
+        acknowledged, failed = [], []
+        deadline = time.perf_counter() + duration
+
+        def click_repeatedly(index):
+            client = logged_in_client(app, user_ids[index])
+            rng = np.random.default_rng(index)
+            while time.perf_counter() < deadline:
+                body = {"girl_id": girl_ids[index], "hot_score": round(float(rng.uniform(0, 10)), 1),
+                        "crazy_score": round(float(rng.uniform(4, 10)), 1), "client_id": str(uuid.uuid4())}
+                start = time.perf_counter()
+                response = client.post("/api/plots", json=body)
+                (acknowledged if response.status_code in (201, 202) else failed).append(time.perf_counter() - start)
+
+        workers = [threading.Thread(target=click_repeatedly, args=(index,)) for index in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        # Write-behind: wait for the flusher, so throughput counts saved plots.
+        def saved():
+            total = 0
+            for _ in sharding.each_shard():
+                total += db.session.scalar(select(func.count()).select_from(Plot).where(Plot.client_id.is_not(None)))
+            db.session.rollback()
+            return total
+
+        with app.app_context():
+            while saved() < len(acknowledged):
+                time.sleep(0.05)
+        elapsed = time.perf_counter() - deadline + duration
+
+        mode = "write-behind" if write_behind else "synchronous"
+        if shards:
+            mode += f", {shards} shards"
+        ack_stats = _percentiles(acknowledged)
+        click.echo(f"{mode}, {threads} threads for {duration:.0f}s")
+        click.echo(f"plots   {len(acknowledged) / elapsed:>7.1f}/s saved  p50 {ack_stats['p50_ms']:>8.2f} ms  "
+                   f"p95 {ack_stats['p95_ms']:>8.2f} ms  p99 {ack_stats['p99_ms']:>8.2f} ms  failed {len(failed)}")
+
+
+_ASSET_LINK = re.compile(r'<(?:link|script)\b[^>]*?\b(?:href|src)="(/[^"]+)"')
+_ZONE_IMAGES = re.compile(r'<script id="zone-images" type="application/json">(.*?)</script>', re.S)
+
+
+def _page_assets(html):
+    """Local URLs a page loads before its first paint: linked files and zone artwork."""
+    urls = [url for url in _ASSET_LINK.findall(html) if url.startswith(("/static/", "/assets/"))]
+    match = _ZONE_IMAGES.search(html)
+    inverted_here = 0
+    if match:
+        for images in json.loads(match.group(1)).values():
+            urls.append(images["light"])
+            if images["dark"]:
+                urls.append(images["dark"])
+            else:
+                inverted_here += 1
+    return urls, inverted_here
+
+
+@bp.cli.command("first-paint")
+def bench_first_paint():
+    """Compare the static bytes of a first and repeat dashboard visit with and without `flask assets build`."""
+    from app import assets
+    from app.cli import logged_in_client, scratch_app
+
+    with tempfile.TemporaryDirectory() as dist_dir, scratch_app("first-paint") as plain_app:
+        with plain_app.app_context():
+            assets.build(plain_app.static_folder, dist_dir)
+        with scratch_app("first-paint", ASSETS_DIST_DIR=dist_dir) as built_app:
+            for label, app in (("plain", plain_app), ("built", built_app)):
+                with app.app_context():
+                    user_id = seed_data(1, 5, 20, prefix=f"first-paint-{label}")[0]
+                client = logged_in_client(app, user_id)
+                html = client.get("/").get_data(as_text=True)
+                urls, inverted_here = _page_assets(html)
+
+                first_bytes = raw_bytes = revalidations = 0
+                for url in urls:
+                    response = client.get(url, headers={"Accept-Encoding": "gzip, br"})
+                    first_bytes += len(response.get_data())
+                    raw_bytes += len(client.get(url).get_data())
+                    # A repeat visit only skips the request when the file may be reused unchecked.
+                    if "immutable" not in response.headers.get("Cache-Control", ""):
+                        revalidations += 1
+                click.echo(f"{label:<6} {len(urls):>3} files  {first_bytes:>8} bytes sent ({raw_bytes} uncompressed)  "
+                           f"repeat visit: {revalidations} revalidations  inverted in browser: {inverted_here}")
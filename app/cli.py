@@ -0,0 +1,403 @@
+from contextlib import contextmanager
+import os
+import tempfile
+
+import click
+from flask import Blueprint, current_app
+from flask_migrate import upgrade
+from sqlalchemy import event, select
+
+from app import db
+from app.database import shard_bind_key
+from config import Config
+
+
+bp = Blueprint("cli", __name__, cli_group=None)
+
+
+# Requests replayed by ``flask check query-plans``. Every statement they send
+# to the database must be answered from an index.
+PLAN_CHECK_REQUESTS = [
+    ("GET", "/api/girls"),
+    ("GET", "/api/girls/{girl_id}/plots"),
+    ("GET", "/api/girls/{girl_id}/plots?limit=1&from=2000-01-01T00:00:00Z"),
+    ("GET", "/api/girls/{girl_id}/trend?bucket=week"),
+    ("GET", "/api/girls/{girl_id}/trend?mode=lttb&max_points=3"),
+    ("GET", "/api/plots?girl_ids={girl_id},{other_girl_id}"),
+    ("GET", "/api/plots?girl_ids={girl_id},{other_girl_id}&from=2000-01-01T00:00:00Z"),
+    ("GET", "/api/plots?girl_ids={girl_id},{other_girl_id}&format=columnar"),
+    ("GET", "/api/girls/{girl_id}/plots?format=columnar"),
+    ("GET", "/api/averages?girl_ids={girl_id},{other_girl_id}"),
+    ("GET", "/api/rolling?girl_ids={girl_id},{other_girl_id}&plots=5&days=30"),
+    ("GET", "/api/zones?girl_ids={girl_id},{other_girl_id}"),
+    ("GET", "/api/zones?girl_ids={girl_id},{other_girl_id}&histogram=1"),
+    ("GET", "/api/search?q=first*"),
+    ("GET", "/api/search?q=first*&sort=newest"),
+    ("GET", "/api/heatmap"),
+    ("GET", "/api/heatmap?girl_ids={girl_id}&from=2000-01-01T00:00:00Z"),
+    ("POST", "/api/plots"),
+    ("PUT", "/api/plots/{plot_id}"),
+    ("DELETE", "/api/plots/{plot_id}"),
+    ("PUT", "/api/girls/{girl_id}"),
+    ("DELETE", "/api/girls/{girl_id}"),
+]
+
+
+def find_table_scans(connection, statement, parameters):
+    """Return the ``EXPLAIN QUERY PLAN`` lines of a statement that scan a table.
+
+    A virtual table "scan" with an index constraint (an FTS5 MATCH) is an
+    index lookup, not a scan.
+    """
+    plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return [
+        row[-1]
+        for row in plan
+        if row[-1].startswith("SCAN")
+        and not row[-1].startswith("SCAN CONSTANT")
+        and "VIRTUAL TABLE INDEX" not in row[-1]
+    ]
+
+
+@contextmanager
+def scratch_app(name, **overrides):
+    """An app on a fresh, fully migrated SQLite file (and shards) in a temporary directory.
+
+    ``overrides`` are extra config values. The directory, with the write-behind
+    journal and asset build that default to it, is removed when the block ends.
+    """
+    from app import create_app
+
+    with tempfile.TemporaryDirectory(prefix=f"{name}-") as workdir:
+        config_class = type(
+            "ScratchConfig",
+            (Config,),
+            {
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(workdir, f"{name}.db"),
+                "SHARD_URL_TEMPLATE": "sqlite:///" + os.path.join(workdir, f"{name}-shard-{{}}.db"),
+                "INGEST_JOURNAL_DIR": os.path.join(workdir, "ingest"),
+                "ASSETS_DIST_DIR": os.path.join(workdir, "dist"),
+                "WTF_CSRF_ENABLED": False,
+                **overrides,
+            },
+        )
+        app = create_app(config_class)
+        with app.app_context():
+            upgrade()
+            init_shards()
+        try:
+            yield app
+        finally:
+            with app.app_context():
+                db.session.remove()
+                for engine in db.engines.values():
+                    engine.dispose()
+
+
+def init_shards():
+    """Create the schema of every configured shard; returns how many there are."""
+    from app import sharding
+
+    count = current_app.config["SHARD_COUNT"]
+    for shard in range(count):
+        sharding.create_schema(db.engines[shard_bind_key(shard)])
+    return count
+
+
+def logged_in_client(app, user_id):
+    """Return a test client whose session is already logged in as ``user_id``."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user_id)
+        session["_fresh"] = True
+    return client
+
+
+@bp.cli.group()
+def check():
+    """Consistency checks for the database layer."""
+
+
+def query_plan_failures():
+    """Replay ``PLAN_CHECK_REQUESTS`` against a scratch database.
+
+    Returns ``(statement count, failures)``, one failure per table scan.
+    """
+    from app import rolling, stats as girl_stats
+    from app.models import Girl, Plot, User
+
+    with scratch_app("plans") as app:
+
+        with app.app_context():
+            user = User(username="plan-check")
+            user.set_password("plan-check")
+            girl = Girl(name="Subject", owner=user)
+            other_girl = Girl(name="Control", owner=user)
+            plot = Plot(hot_score=7.5, crazy_score=5.5, notes="First impressions", girl=girl)
+            db.session.add_all([user, girl, other_girl, plot, Plot(hot_score=6, crazy_score=6, girl=girl)])
+            db.session.flush()
+            for seeded in (girl, other_girl):
+                girl_stats.recompute(seeded.id)
+                rolling.recompute(seeded.id)
+            db.session.commit()
+            ids = {"girl_id": girl.id, "other_girl_id": other_girl.id, "plot_id": plot.id}
+            user_id = user.id
+
+            captured = []
+
+            def capture(conn, cursor, statement, parameters, context, executemany):
+                if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                    captured.append((route, statement, parameters))
+
+            client = logged_in_client(app, user_id)
+
+            event.listen(db.engine, "before_cursor_execute", capture)
+            try:
+                for method, path in PLAN_CHECK_REQUESTS:
+                    route = f"{method} {path}"
+                    json_body = {
+                        "PUT": {"name": "Renamed", "hot_score": 8},
+                        # Backdated, so the moving averages are refolded from it.
+                        "POST": {"girl_id": ids["girl_id"], "hot_score": 6, "crazy_score": 7,
+                                 "plot_date": "2000-01-01T00:00:00Z"},
+                    }.get(method)
+                    response = client.open(path.format(**ids), method=method, json=json_body)
+                    if response.status_code >= 400:
+                        raise click.ClickException(f"{route} returned {response.status_code}")
+            finally:
+                event.remove(db.engine, "before_cursor_execute", capture)
+
+            failures = []
+            with db.engine.connect() as connection:
+                for route, statement, parameters in captured:
+                    for scan in find_table_scans(connection, statement, parameters):
+                        failures.append(f"{route}: {scan}\n    {' '.join(statement.split())}")
+        return len(captured), failures
+
+
+@check.command("query-plans")
+def check_query_plans():
+    """Replay the API against a scratch database and fail on any table scan."""
+    count, failures = query_plan_failures()
+    if failures:
+        raise click.ClickException("Table scans found:\n" + "\n".join(failures))
+    click.echo(f"Checked {count} statements from {len(PLAN_CHECK_REQUESTS)} requests: no table scans.")
+
+
+def _fts_objects(engine):
+    """``{name: normalized sql}`` of the notes index and its triggers."""
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(
+            "SELECT name, sql FROM sqlite_master WHERE name = 'plot_fts' OR (type = 'trigger' AND tbl_name = 'plot')"
+        ).all()
+    # SQLite keeps the statement as written, IF NOT EXISTS included.
+    return {name: " ".join(sql.replace(" IF NOT EXISTS", "").split()) for name, sql in rows}
+
+
+def fts_schema_differences():
+    """Compare the notes index a shard gets from ``search.FTS_SCHEMA`` with the migrated one.
+
+    Returns a list of differences, empty when they match.
+    """
+    with scratch_app("fts-schema", SHARD_COUNT=1) as app:
+        with app.app_context():
+            migrated = _fts_objects(db.engines[None])
+            shard = _fts_objects(db.engines[shard_bind_key(0)])
+        differences = []
+        for name in sorted(set(migrated) | set(shard)):
+            if name not in shard:
+                differences.append(f"{name}: created by the migrations, missing from search.FTS_SCHEMA")
+            elif name not in migrated:
+                differences.append(f"{name}: in search.FTS_SCHEMA, not created by the migrations")
+            elif migrated[name] != shard[name]:
+                differences.append(f"{name}:\n    migrations: {migrated[name]}\n    FTS_SCHEMA: {shard[name]}")
+        return differences
+
+
+@check.command("fts-schema")
+def check_fts_schema():
+    """Fail if search.FTS_SCHEMA no longer matches the index the migrations create."""
+    differences = fts_schema_differences()
+    if differences:
+        raise click.ClickException("Shard full-text schema differs:\n" + "\n".join(differences))
+    click.echo("search.FTS_SCHEMA matches the migrated full-text index.")
+
+
+@bp.cli.group()
+def stats():
+    """Maintenance of the girl_stats summary table."""
+
+
+@stats.command("rebuild")
+def rebuild_stats():
+    """Recompute every girl's summary row and moving averages from her plots."""
+    from app import rolling, sharding, stats as girl_stats
+
+    count = 0
+    for _ in sharding.each_shard():
+        count += girl_stats.rebuild()
+        rolling.rebuild()
+        db.session.commit()
+    click.echo(f"Rebuilt statistics for {count} girls.")
+
+
+@bp.cli.group()
+def data():
+    """Import and export of user data."""
+
+
+@data.command("export")
+@click.argument("username")
+@click.option("--format", "export_format", type=click.Choice(["ndjson", "csv"]), default="ndjson", show_default=True)
+@click.option("--output", type=click.File("w"), default="-", help="File to write to (defaults to stdout).")
+def export_data(username, export_format, output):
+    """Stream every girl and plot of USERNAME as NDJSON or CSV."""
+    from app import dataio, sharding
+    from app.models import User
+
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"No user named {username!r}.")
+    with sharding.use_user_shard(user.id):
+        for chunk in dataio.iter_export(user.id, export_format):
+            output.write(chunk)
+
+
+@data.command("import")
+@click.argument("username")
+@click.argument("source", type=click.File("rb"))
+@click.option("--format", "import_format", type=click.Choice(["ndjson", "csv"]), default="ndjson", show_default=True)
+def import_data(username, source, import_format):
+    """Bulk-insert plots for USERNAME from an NDJSON or CSV SOURCE file ('-' for stdin)."""
+    from app import dataio, sharding
+    from app.models import User
+
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"No user named {username!r}.")
+
+    with sharding.use_user_shard(user.id):
+        report = dataio.import_plots(user.id, dataio.read_import(source, import_format))
+    click.echo(f"Inserted {report['inserted']} plots, skipped {report['skipped']} rows, "
+               f"rejected {report['error_count']} rows.")
+    for error in report["errors"]:
+        click.echo(f"  row {error['row']}: {error['error']}", err=True)
+
+
+@bp.cli.group()
+def jobs():
+    """Background maintenance jobs."""
+
+
+@jobs.command("purge-accounts")
+def purge_accounts():
+    """Delete every account marked pending_deletion, in batches."""
+    from app import deletion
+
+    count = deletion.purge_pending_accounts()
+    click.echo(f"Purged {count} accounts.")
+
+
+@jobs.command("flush-ingest")
+def flush_ingest():
+    """Insert the journaled plots of write-behind workers that are gone."""
+    from app import ingest
+
+    inserted = ingest.replay_orphaned_segments(
+        current_app.config["INGEST_JOURNAL_DIR"], current_app.config["INGEST_BATCH_SIZE"]
+    )
+    click.echo(f"Inserted {inserted} journaled plots.")
+
+
+@bp.cli.group()
+def shards():
+    """Per-user sharding of girls and plots (SHARD_COUNT)."""
+
+
+@shards.command("init")
+def shards_init():
+    """Create any missing tables in every shard; does nothing when sharding is off."""
+    count = init_shards()
+    click.echo(f"Initialized {count} shards.")
+
+
+@shards.command("status")
+def shards_status():
+    """Show how many users and plots live on each shard."""
+    from app import sharding
+
+    if not sharding.enabled():
+        raise click.ClickException("Sharding is off (SHARD_COUNT=0).")
+    for shard, users in sharding.shard_loads().items():
+        click.echo(f"shard {shard}: {len(users)} users, {sum(users.values())} plots")
+
+
+@shards.command("move")
+@click.argument("username")
+@click.argument("shard", type=int)
+def shards_move(username, shard):
+    """Move USERNAME's girls and plots to SHARD."""
+    from app import sharding
+    from app.models import User
+
+    if not 0 <= shard < current_app.config["SHARD_COUNT"]:
+        raise click.ClickException(f"No shard {shard}.")
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"No user named {username!r}.")
+    moved = sharding.move_user(user.id, shard)
+    if moved is None:
+        click.echo(f"{username} is already on shard {shard}.")
+    else:
+        click.echo(f"Moved {username} ({moved} plots) to shard {shard}.")
+
+
+@shards.command("rebalance")
+@click.option("--tolerance", type=float, default=0.1, show_default=True,
+              help="Allowed difference between shards, as a fraction of the mean plot count.")
+@click.option("--dry-run", is_flag=True, help="Only print the moves.")
+def shards_rebalance(tolerance, dry_run):
+    """Move users between shards until their plot counts are even."""
+    from app import sharding
+
+    if not sharding.enabled():
+        raise click.ClickException("Sharding is off (SHARD_COUNT=0).")
+    moves = sharding.plan_rebalance(sharding.shard_loads(), tolerance)
+    for user_id, source, target, plots in moves:
+        click.echo(f"user {user_id}: shard {source} -> {target} ({plots} plots)")
+        if not dry_run:
+            sharding.move_user(user_id, target)
+    click.echo(f"{'Planned' if dry_run else 'Made'} {len(moves)} moves.")
+
+
+@shards.command("import-catalog")
+def shards_import_catalog():
+    """Move girls and plots stored in the main database into their users' shards.
+
+    Run once, with the app stopped, after turning sharding on for an
+    existing database.
+    """
+    from app import sharding
+    from app.models import Girl
+
+    if not sharding.enabled():
+        raise click.ClickException("Sharding is off (SHARD_COUNT=0).")
+    with db.engines[None].connect() as connection:
+        user_ids = connection.scalars(select(Girl.user_id).distinct()).all()
+    plots = sum(sharding.import_from_catalog(user_id) for user_id in user_ids)
+    click.echo(f"Moved {len(user_ids)} users ({plots} plots) out of the main database.")
+
+
+@bp.cli.group()
+def assets():
+    """Fingerprinted, precompressed static files."""
+
+
+@assets.command("build")
+@click.option("--clean", is_flag=True, help="Also remove files left by earlier builds.")
+def assets_build(clean):
+    """Write hashed and precompressed copies of app/static to ASSETS_DIST_DIR."""
+    from app import assets as static_assets
+
+    manifest = static_assets.build(current_app.static_folder, current_app.config["ASSETS_DIST_DIR"], clean=clean)
+    click.echo(f"Built {len(manifest)} assets into {current_app.config['ASSETS_DIST_DIR']}.")
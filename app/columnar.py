@@ -0,0 +1,89 @@
+"""Columnar plot payloads for ``?format=columnar``.
+
+Instead of one ``{"id", "x", "y", "notes", "date"}`` object per plot, a
+history is sent as parallel arrays::
+
+    {"ids": [...], "hot": [...], "crazy": [...], "dates": [...], "notes": [...]}
+
+with ``dates`` in milliseconds since the Unix epoch (UTC). When write-behind
+plots are still pending (see ``app.ingest``) they come last with a ``null``
+id, and a ``client_ids`` array (``null`` for saved plots) is added. The rows come
+from a Core ``select`` of just these columns, so no ORM objects are built,
+and the payload repeats no keys.
+"""
+from datetime import datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from flask import abort, request
+from sqlalchemy import select
+
+from app import db
+from app.models import Girl, Plot
+
+
+FORMATS = ("rows", "columnar")
+COLUMNS = (Plot.id, Plot.hot_score, Plot.crazy_score, Plot.plot_date, Plot.notes)
+
+_EPOCH = datetime(1970, 1, 1)
+_MILLISECOND = timedelta(milliseconds=1)
+
+
+def wants_columnar():
+    """Read the ``format`` query parameter; ``rows`` is the default."""
+    response_format = request.args.get("format", "rows")
+    if response_format not in FORMATS:
+        abort(400, description="Invalid format. Must be one of: " + ", ".join(FORMATS))
+    return response_format == "columnar"
+
+
+def to_columns(rows):
+    """Transpose ``(id, hot, crazy, plot_date, notes)`` rows into parallel arrays."""
+    if not rows:
+        return {"ids": [], "hot": [], "crazy": [], "dates": [], "notes": []}
+    ids, hot, crazy, dates, notes = zip(*rows)
+    return {
+        "ids": list(ids),
+        "hot": list(hot),
+        "crazy": list(crazy),
+        "dates": [(date - _EPOCH) // _MILLISECOND for date in dates],
+        "notes": list(notes),
+    }
+
+
+def with_pending(columns, records):
+    """Append journaled, not yet saved plots to a girl's columns."""
+    if not records:
+        return columns
+    count = len(columns["ids"])
+    columns["ids"] += [None] * len(records)
+    columns["hot"] += [record["hot_score"] for record in records]
+    columns["crazy"] += [record["crazy_score"] for record in records]
+    columns["dates"] += [
+        (datetime.fromisoformat(record["plot_date"]) - _EPOCH) // _MILLISECOND for record in records
+    ]
+    columns["notes"] += [record["notes"] for record in records]
+    columns["client_ids"] = [None] * count + [record["client_id"] for record in records]
+    return columns
+
+
+def plot_columns(girl_id, filters=()):
+    """One girl's plots, oldest first, as columns."""
+    rows = db.session.execute(
+        select(*COLUMNS).where(Plot.girl_id == girl_id, *filters).order_by(Plot.plot_date, Plot.id)
+    ).all()
+    return to_columns(rows)
+
+
+def plot_columns_by_girl(user_id, girl_ids, filters=()):
+    """Columns per girl id for those of ``girl_ids`` owned by ``user_id``."""
+    rows = db.session.execute(
+        select(Plot.girl_id, *COLUMNS)
+        .join(Girl)
+        .where(Girl.user_id == user_id, Plot.girl_id.in_(girl_ids), *filters)
+        .order_by(Plot.girl_id, Plot.plot_date, Plot.id)
+    ).all()
+    return {
+        girl_id: to_columns([row[1:] for row in girl_rows])
+        for girl_id, girl_rows in groupby(rows, key=itemgetter(0))
+    }
@@ -0,0 +1,123 @@
+"""Gzip/Brotli compression of API responses.
+
+Plot arrays, notes included, shrink several times over when compressed. An
+``after_request`` hook compresses API payloads (JSON, NDJSON, CSV) with
+the best encoding the client accepts: Brotli when the brotli package
+is installed, else gzip. Bodies smaller than ``COMPRESSION_MIN_SIZE`` bytes
+are sent as they are, since the savings wouldn't pay for the CPU.
+
+Streamed responses such as ``/api/export`` are compressed chunk by chunk
+as they are sent, never buffered. Server-Sent Events, files (already
+handled by ``flask assets build``) and responses that already carry a
+``Content-Encoding`` are left alone. So are HTML pages: they hold the
+CSRF token next to echoed form input, which is what BREACH needs to
+recover the token from compressed sizes.
+
+Responses with an ETag (the ``versioning.conditional`` views) keep their
+compressed bodies in a per-process LRU of ``COMPRESSION_CACHE_SIZE``
+entries, keyed by the ETag. The ETag covers the user, the data version and
+the full path, so a repeated identical payload is only compressed once.
+"""
+import gzip
+import zlib
+
+from flask import current_app, request
+
+from app.heatmap import ResultCache
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional, gzip is always available
+    brotli = None
+
+
+COMPRESSIBLE = {"application/json", "application/x-ndjson", "text/csv"}
+# Larger compressed bodies aren't worth a cache slot.
+CACHE_MAX_BYTES = 256 * 1024
+
+
+def _encoding():
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return request.accept_encodings.best_match(offered)
+
+
+def _compress(encoding, data, config):
+    if encoding == "br":
+        return brotli.compress(data, quality=config["COMPRESSION_BROTLI_QUALITY"])
+    return gzip.compress(data, compresslevel=config["COMPRESSION_GZIP_LEVEL"], mtime=0)
+
+
+def _compress_stream(encoding, chunks, config, charset="utf-8"):
+    """Compress a response iterable (bytes or str chunks) incrementally."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=config["COMPRESSION_BROTLI_QUALITY"])
+        compress, finish = compressor.process, compressor.finish
+    else:
+        # wbits 31: a zlib stream with a gzip header and trailer.
+        compressor = zlib.compressobj(config["COMPRESSION_GZIP_LEVEL"], zlib.DEFLATED, 31)
+        compress, finish = compressor.compress, compressor.flush
+    try:
+        for chunk in chunks:
+            output = compress(chunk.encode(charset) if isinstance(chunk, str) else chunk)
+            if output:
+                yield output
+        yield finish()
+    finally:
+        # Runs the cleanup of stream_with_context and similar generators.
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def _cached_compress(encoding, response, data, config):
+    etag, _ = response.get_etag()
+    cache = current_app.extensions.get("compression_cache")
+    if cache is None or etag is None:
+        return _compress(encoding, data, config)
+    key = (etag, encoding, response.mimetype)
+    compressed = cache.get(key)
+    if compressed is None:
+        compressed = _compress(encoding, data, config)
+        if len(compressed) <= CACHE_MAX_BYTES:
+            cache.put(key, compressed)
+    return compressed
+
+
+def compress_response(response):
+    if (
+        response.mimetype not in COMPRESSIBLE
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or "no-transform" in response.headers.get("Cache-Control", "")
+    ):
+        return response
+    # Whatever this client gets, caches must not hand it to one that accepts less.
+    response.vary.add("Accept-Encoding")
+    encoding = _encoding()
+    if encoding is None:
+        return response
+    config = current_app.config
+
+    if response.is_streamed:
+        response.response = _compress_stream(encoding, response.response, config)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < config["COMPRESSION_MIN_SIZE"]:
+            return response
+        compressed = _cached_compress(encoding, response, data, config)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+    response.content_encoding = encoding
+    return response
+
+
+def init_app(app):
+    """Register the compression hook unless ``COMPRESSION_ENABLED`` is off."""
+    if not app.config.get("COMPRESSION_ENABLED"):
+        return
+    if app.config.get("COMPRESSION_CACHE_SIZE"):
+        app.extensions["compression_cache"] = ResultCache(app.config["COMPRESSION_CACHE_SIZE"])
+    app.after_request(compress_response)
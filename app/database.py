@@ -0,0 +1,97 @@
+"""Engine configuration: connection pool options and SQLite pragmas.
+
+Pool settings come from the ``DB_POOL_*`` config keys and are merged into
+``SQLALCHEMY_ENGINE_OPTIONS`` before Flask-SQLAlchemy builds the engine.
+For SQLite, every new DBAPI connection gets the ``SQLITE_*`` pragmas: WAL
+lets readers run alongside the single writer, and ``busy_timeout`` makes a
+writer wait for the lock instead of failing with "database is locked".
+Foreign key enforcement is switched on too, so ``ON DELETE CASCADE`` works.
+Any other backend (e.g. a PostgreSQL ``DATABASE_URL``) is left untouched.
+
+``RoutingSession`` is the class behind ``db.session``; with sharding on it
+sends statements on sharded tables to the selected shard (see
+``app.sharding``).
+"""
+from functools import partial
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.util import find_tables
+
+
+POOL_OPTIONS = {
+    "DB_POOL_SIZE": "pool_size",
+    "DB_MAX_OVERFLOW": "max_overflow",
+    "DB_POOL_TIMEOUT": "pool_timeout",
+    "DB_POOL_RECYCLE": "pool_recycle",
+    "DB_POOL_PRE_PING": "pool_pre_ping",
+}
+
+
+def _is_sqlite_memory(url):
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def configure_engine_options(app):
+    """Merge pool settings into ``SQLALCHEMY_ENGINE_OPTIONS``; call before ``db.init_app``."""
+    options = app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {})
+    # In-memory SQLite uses a single shared connection, which takes no pool sizing.
+    if _is_sqlite_memory(make_url(app.config["SQLALCHEMY_DATABASE_URI"])):
+        return
+    for key, option in POOL_OPTIONS.items():
+        value = app.config.get(key)
+        if value is not None:
+            options.setdefault(option, value)
+
+
+def _set_sqlite_pragmas(config, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}")
+        cursor.execute(f"PRAGMA journal_mode = {config['SQLITE_JOURNAL_MODE']}")
+        cursor.execute(f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}")
+        # A negative cache_size is in KiB rather than pages.
+        cursor.execute(f"PRAGMA cache_size = -{int(config['SQLITE_CACHE_SIZE_KIB'])}")
+        cursor.execute(f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}")
+        # Off by default in SQLite; needed for the ON DELETE CASCADE foreign keys.
+        cursor.execute("PRAGMA foreign_keys = ON")
+    finally:
+        cursor.close()
+
+
+def install_sqlite_pragmas(engine, config):
+    """Apply the configured pragmas to every new connection of a SQLite engine."""
+    if engine.dialect.name != "sqlite":
+        return
+    event.listen(engine, "connect", partial(_set_sqlite_pragmas, config))
+
+
+# Tables that live in the per-user shards rather than the catalog.
+SHARDED_TABLES = frozenset({"girl", "plot", "girl_stats", "plot_fts", "user_data_version", "moved_girl"})
+
+
+def shard_bind_key(shard):
+    return f"shard{shard}"
+
+
+def _touches_shard(mapper, clause):
+    if mapper is not None and sa.inspect(mapper).local_table.name in SHARDED_TABLES:
+        return True
+    if clause is not None:
+        return any(table.name in SHARDED_TABLES for table in find_tables(clause, include_crud=True))
+    return False
+
+
+class RoutingSession(Session):
+    """Session that routes sharded tables to the shard selected in ``g.shard``."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and shard_bind_key(0) in self._db.engines and _touches_shard(mapper, clause):
+            shard = g.get("shard") if has_app_context() else None
+            if shard is None:
+                raise RuntimeError("No shard selected for a query on a sharded table; see app.sharding.use_shard.")
+            return self._db.engines[shard_bind_key(shard)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
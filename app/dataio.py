@@ -0,0 +1,235 @@
+"""Streaming export and bulk import of a user's girls and plots as NDJSON or CSV.
+
+Export rows are read with ``yield_per`` so the database driver hands them over
+in batches from a server-side cursor, and each batch is encoded and yielded
+before the next one is fetched. Memory use stays flat no matter how many
+plots a user has, and the first bytes go out as soon as the first batch is
+read.
+
+Imports go the other way in chunks: each chunk of records is validated with
+the same rules as ``POST /api/plots``, ownership is checked once per distinct
+girl, and the valid rows are written with a single executemany INSERT and
+committed before the next chunk is read. A bad row is reported and skipped
+rather than aborting the load.
+"""
+from collections import defaultdict
+import csv
+from datetime import datetime
+from itertools import islice
+import io
+import json
+
+from sqlalchemy import insert, select
+
+from app import db, rolling, stats, versioning
+from app.models import Girl, Plot
+from app.validation import collect_plot_errors, format_plot_errors, parse_plot_date
+
+
+EXPORT_COLUMNS = ("girl_id", "girl_name", "plot_id", "hot_score", "crazy_score", "notes", "plot_date")
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+EXPORT_BATCH_SIZE = 1000
+
+
+def export_rows(user_id, batch_size=EXPORT_BATCH_SIZE):
+    """Yield one tuple per plot, in ``EXPORT_COLUMNS`` order.
+
+    Girls without plots are included once, with the plot columns set to None.
+    """
+    statement = (
+        select(
+            Girl.id,
+            Girl.name,
+            Plot.id,
+            Plot.hot_score,
+            Plot.crazy_score,
+            Plot.notes,
+            Plot.plot_date,
+        )
+        .select_from(Girl)
+        .outerjoin(Plot, Plot.girl_id == Girl.id)
+        .where(Girl.user_id == user_id)
+        .order_by(Girl.id, Plot.plot_date, Plot.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for partition in db.session.execute(statement).partitions():
+        for row in partition:
+            yield tuple(row)
+
+
+def _format_date(value):
+    return value.isoformat() if value is not None else None
+
+
+def iter_ndjson(rows, batch_size=EXPORT_BATCH_SIZE):
+    lines = []
+    for row in rows:
+        record = dict(zip(EXPORT_COLUMNS, row))
+        record["plot_date"] = _format_date(record["plot_date"])
+        lines.append(json.dumps(record))
+        if len(lines) >= batch_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def iter_csv(rows, batch_size=EXPORT_BATCH_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    pending = 0
+    for row in rows:
+        writer.writerow(row[:-1] + (_format_date(row[-1]),))
+        pending += 1
+        if pending >= batch_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+def iter_export(user_id, export_format):
+    """Yield the encoded export of a user's data in ``export_format``."""
+    encoder = iter_csv if export_format == "csv" else iter_ndjson
+    return encoder(export_rows(user_id))
+
+
+IMPORT_CHUNK_SIZE = 1000
+
+# Only the first errors are itemised so a badly broken file can't produce an
+# unbounded response; ``error_count`` always has the full total.
+MAX_REPORTED_ERRORS = 1000
+
+
+def iter_ndjson_records(text_stream):
+    """Yield ``(record, error)`` pairs for each non-blank NDJSON line."""
+    for line in text_stream:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield None, "Invalid JSON."
+            continue
+        if not isinstance(record, dict):
+            yield None, "Each line must be a JSON object."
+            continue
+        yield record, None
+
+
+def iter_csv_records(text_stream):
+    """Yield ``(record, error)`` pairs for each CSV row; empty cells count as missing."""
+    for row in csv.DictReader(text_stream):
+        yield {key: value for key, value in row.items() if value not in ("", None)}, None
+
+
+IMPORT_READERS = {
+    "ndjson": iter_ndjson_records,
+    "csv": iter_csv_records,
+}
+
+
+def _is_plotless(record):
+    # Girl-only rows produced by the export carry no plot to import.
+    return record.get("hot_score") is None and record.get("crazy_score") is None
+
+
+def _owned_girl_ids(user_id, girl_ids, known):
+    """Resolve ownership for ids not seen before with one query, caching the answers."""
+    unknown = {girl_id for girl_id in girl_ids if girl_id not in known}
+    if unknown:
+        owned = db.session.execute(
+            select(Girl.id).where(Girl.user_id == user_id, Girl.id.in_(unknown))
+        ).scalars()
+        owned = set(owned)
+        for girl_id in unknown:
+            known[girl_id] = girl_id in owned
+    return known
+
+
+def import_plots(user_id, records, chunk_size=IMPORT_CHUNK_SIZE):
+    """Insert ``(record, error)`` pairs as plots for ``user_id`` in chunked transactions.
+
+    Returns a report with the inserted and skipped counts and one entry per
+    rejected row, numbered from 1 in input order.
+    """
+    report = {"inserted": 0, "skipped": 0, "error_count": 0, "errors": []}
+    ownership = {}
+    numbered = enumerate(records, start=1)
+
+    def reject(row_number, message):
+        report["error_count"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"row": row_number, "error": message})
+
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            break
+
+        candidates = []
+        for row_number, (record, error) in chunk:
+            if error:
+                reject(row_number, error)
+                continue
+            if _is_plotless(record):
+                report["skipped"] += 1
+                continue
+            cleaned, errors = collect_plot_errors(record)
+            try:
+                girl_id = int(record["girl_id"])
+            except (KeyError, TypeError, ValueError):
+                errors.setdefault("girl_id", "girl_id must be an integer.")
+            if errors:
+                reject(row_number, format_plot_errors(errors))
+                continue
+            candidates.append((row_number, girl_id, cleaned, record.get("plot_date")))
+
+        _owned_girl_ids(user_id, {girl_id for _, girl_id, _, _ in candidates}, ownership)
+
+        rows = []
+        points_by_girl = defaultdict(list)
+        for row_number, girl_id, cleaned, plot_date_str in candidates:
+            if not ownership[girl_id]:
+                reject(row_number, f"girl_id: Girl {girl_id} not found.")
+                continue
+            plot_date = parse_plot_date(plot_date_str) if plot_date_str else datetime.utcnow()
+            rows.append(
+                {
+                    "girl_id": girl_id,
+                    "hot_score": cleaned["hot_score"],
+                    "crazy_score": cleaned["crazy_score"],
+                    "notes": cleaned.get("notes"),
+                    "plot_date": plot_date,
+                }
+            )
+            points_by_girl[girl_id].append((cleaned["hot_score"], cleaned["crazy_score"], plot_date))
+
+        if rows:
+            rows_by_girl = defaultdict(list)
+            for row in rows:
+                rows_by_girl[row["girl_id"]].append(row)
+            for girl_id, girl_rows in rows_by_girl.items():
+                rolling.plots_added(girl_id, girl_rows)
+            db.session.execute(insert(Plot), rows)
+            for girl_id, points in points_by_girl.items():
+                stats.plots_added(girl_id, points)
+            versioning.bump(user_id, points_by_girl)
+            db.session.commit()
+            report["inserted"] += len(rows)
+
+    report["errors"].sort(key=lambda error: error["row"])
+    return report
+
+
+def read_import(byte_stream, import_format):
+    """Decode a binary upload and yield ``(record, error)`` pairs."""
+    text_stream = io.TextIOWrapper(byte_stream, encoding="utf-8-sig", newline="")
+    return IMPORT_READERS[import_format](text_stream)
@@ -0,0 +1,120 @@
+"""Set-based deletion of girls and whole accounts.
+
+Deletes are plain ``DELETE ... WHERE`` statements, children first, so they
+don't depend on the database enforcing ``ON DELETE CASCADE`` and never load
+rows into the session. Accounts with more than
+``ACCOUNT_DELETE_INLINE_MAX_PLOTS`` plots are only marked
+``pending_deletion`` by the request; a background thread then removes their
+plots ``ACCOUNT_PURGE_BATCH_SIZE`` at a time, committing between batches so
+other writers get the database in between. ``flask jobs purge-accounts``
+finishes any purge a restart interrupted.
+
+With sharding on, the caller selects the user's shard; the user row itself
+is deleted from the catalog in the same commit, which isn't atomic across
+the two databases (a crash in between leaves orphaned rows in the shard).
+"""
+from datetime import datetime
+import threading
+
+from flask import current_app
+from sqlalchemy import delete, func, select, update
+
+from app import db, identity, sharding
+from app.models import Girl, GirlStats, Plot, User
+
+
+def delete_girl(girl_id):
+    """Delete a girl with her plots and summary row; the caller commits."""
+    db.session.execute(delete(Plot).where(Plot.girl_id == girl_id))
+    db.session.execute(delete(GirlStats).where(GirlStats.girl_id == girl_id))
+    db.session.execute(delete(Girl).where(Girl.id == girl_id))
+
+
+def _delete_user_rows(user_id):
+    girl_ids = select(Girl.id).where(Girl.user_id == user_id)
+    db.session.execute(delete(Plot).where(Plot.girl_id.in_(girl_ids)))
+    db.session.execute(delete(GirlStats).where(GirlStats.girl_id.in_(girl_ids)))
+    db.session.execute(delete(Girl).where(Girl.user_id == user_id))
+    if sharding.enabled():
+        db.session.execute(
+            delete(sharding.user_data_version).where(sharding.user_data_version.c.user_id == user_id)
+        )
+    db.session.execute(delete(User).where(User.id == user_id))
+
+
+def account_plot_count(user_id):
+    return db.session.scalar(
+        select(func.coalesce(func.sum(GirlStats.plot_count), 0))
+        .join(Girl, Girl.id == GirlStats.girl_id)
+        .where(Girl.user_id == user_id)
+    )
+
+
+def delete_account(user_id):
+    """Delete an account now, or mark it for the background purge if it is large.
+
+    Commits. Returns ``True`` when the account is already gone.
+    """
+    if account_plot_count(user_id) <= current_app.config["ACCOUNT_DELETE_INLINE_MAX_PLOTS"]:
+        _delete_user_rows(user_id)
+        db.session.commit()
+        identity.invalidate(user_id)
+        return True
+
+    db.session.execute(update(User).where(User.id == user_id).values(pending_deletion=datetime.utcnow()))
+    db.session.commit()
+    identity.invalidate(user_id)
+    start_background_purge()
+    return False
+
+
+def purge_account(user_id, batch_size):
+    """Delete a pending account's plots in committed batches, then the rest of it."""
+    girl_ids = select(Girl.id).where(Girl.user_id == user_id)
+    batches = 0
+    while True:
+        batch = select(Plot.id).where(Plot.girl_id.in_(girl_ids)).limit(batch_size)
+        deleted = db.session.execute(delete(Plot).where(Plot.id.in_(batch))).rowcount
+        db.session.commit()
+        batches += 1
+        if deleted < batch_size:
+            break
+    _delete_user_rows(user_id)
+    db.session.commit()
+    return batches
+
+
+def purge_pending_accounts():
+    """Purge every account marked for deletion; returns how many were removed."""
+    batch_size = current_app.config["ACCOUNT_PURGE_BATCH_SIZE"]
+    user_ids = db.session.scalars(
+        select(User.id).where(User.pending_deletion.is_not(None)).order_by(User.pending_deletion)
+    ).all()
+    for user_id in user_ids:
+        with sharding.use_user_shard(user_id):
+            purge_account(user_id, batch_size)
+    return len(user_ids)
+
+
+_purge_lock = threading.Lock()
+
+
+def _purge_in_background(app):
+    with app.app_context():
+        try:
+            # Loop so accounts marked while a purge was running aren't left behind.
+            while purge_pending_accounts():
+                pass
+        except Exception:
+            app.logger.exception("Background account purge failed; run `flask jobs purge-accounts`.")
+        finally:
+            db.session.remove()
+            _purge_lock.release()
+
+
+def start_background_purge():
+    """Start the purge thread unless this process already runs one."""
+    if not _purge_lock.acquire(blocking=False):
+        return
+    app = current_app._get_current_object()
+    threading.Thread(target=_purge_in_background, args=(app,), name="account-purge", daemon=True).start()
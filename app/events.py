@@ -0,0 +1,213 @@
+"""Per-user live update events, streamed to dashboards over Server-Sent Events.
+
+Write views ``publish`` a small JSON delta after they commit (a plot was
+created, a girl renamed, ...). Every ``/api/stream`` connection of that user
+receives it and patches its chart in place instead of refetching.
+
+``LocalBroker`` fans events out to streams in the same process. Gunicorn
+runs several workers, so with ``EVENTS_SPOOL_DIR`` set ``SpoolBroker`` is
+used instead: events are appended to one file per user in a shared
+directory and every stream tails its user's file. A message-bus backed
+broker (e.g. Redis pub/sub) would slot in behind the same two methods.
+
+A stream holds a thread for as long as it is open, so each process serves
+at most ``EVENTS_MAX_STREAMS`` of them (others get a 503 and the page falls
+back to refetching), and each one ends after ``EVENTS_STREAM_SECONDS``;
+EventSource reconnects by itself.
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+from flask import Response, abort, current_app
+
+
+class LocalBroker:
+    """Fan out events to the subscribers of this process."""
+
+    def __init__(self, max_backlog=100):
+        self.max_backlog = max_backlog
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, user_id, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # A stream this far behind can't catch up from deltas.
+                subscriber.overflowed = True
+
+    def subscribe(self, user_id):
+        subscription = _LocalSubscription(self, user_id, self.max_backlog)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.user_id, None)
+
+
+class _LocalSubscription(queue.Queue):
+    def __init__(self, broker, user_id, max_backlog):
+        super().__init__(max_backlog)
+        self.broker = broker
+        self.user_id = user_id
+        self.overflowed = False
+
+    def get_message(self, timeout):
+        """Return the next message, ``None`` on timeout, or ``RESYNC``."""
+        if self.overflowed:
+            self.overflowed = False
+            with self.mutex:
+                self.queue.clear()
+            return RESYNC
+        try:
+            return self.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker._unsubscribe(self)
+
+
+class SpoolBroker:
+    """Cross-process stand-in: one append-only event file per user."""
+
+    def __init__(self, directory, poll_interval=0.25, max_file_bytes=1024 * 1024):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.max_file_bytes = max_file_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, user_id):
+        return os.path.join(self.directory, f"{int(user_id)}.events")
+
+    def publish(self, user_id, message):
+        path = self.path(user_id)
+        try:
+            if os.path.getsize(path) > self.max_file_bytes:
+                # Readers notice the new inode and switch over.
+                os.replace(path, path + ".old")
+        except FileNotFoundError:
+            pass
+        # One write of a short line with O_APPEND, so concurrent publishers
+        # don't interleave.
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, (message + "\n").encode())
+        finally:
+            os.close(fd)
+
+    def subscribe(self, user_id):
+        return _SpoolSubscription(self, user_id)
+
+
+class _SpoolSubscription:
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.path = broker.path(user_id)
+        self.handle = None
+        self.inode = None
+        self.pending = []
+        self._open(at_end=True)
+
+    def _open(self, at_end):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+        try:
+            self.handle = open(self.path, "rb")
+        except FileNotFoundError:
+            self.inode = None
+            return
+        self.inode = os.fstat(self.handle.fileno()).st_ino
+        if at_end:
+            self.handle.seek(0, os.SEEK_END)
+
+    def _read_new(self):
+        if self.handle is None:
+            self._open(at_end=False)
+        if self.handle is not None:
+            for line in self.handle.readlines():
+                if line.endswith(b"\n"):
+                    self.pending.append(line.decode().rstrip("\n"))
+                else:
+                    # A line still being written; read it again next time.
+                    self.handle.seek(-len(line), os.SEEK_CUR)
+        try:
+            rotated = os.stat(self.path).st_ino != self.inode
+        except FileNotFoundError:
+            rotated = False
+        if rotated:
+            self._open(at_end=False)
+
+    def get_message(self, timeout):
+        deadline = time.monotonic() + timeout
+        while not self.pending:
+            self._read_new()
+            if self.pending or time.monotonic() >= deadline:
+                break
+            time.sleep(self.broker.poll_interval)
+        return self.pending.pop(0) if self.pending else None
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+
+
+# Sent when a stream lost events; the client reloads everything.
+RESYNC = json.dumps({"type": "resync"})
+
+
+def publish(user_id, event_type, **data):
+    """Send an event to every open stream of ``user_id``."""
+    broker = current_app.extensions.get("events")
+    if broker is not None:
+        broker.publish(user_id, json.dumps(dict(data, type=event_type), default=str))
+
+
+def _stream(app, user_id):
+    broker = app.extensions["events"]
+    keepalive = app.config["EVENTS_KEEPALIVE_SECONDS"]
+    deadline = time.monotonic() + app.config["EVENTS_STREAM_SECONDS"]
+    subscription = broker.subscribe(user_id)
+    try:
+        # Ask EventSource to reconnect after 2 s when the stream ends.
+        yield "retry: 2000\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            message = subscription.get_message(min(keepalive, remaining))
+            yield ": keep-alive\n\n" if message is None else f"data: {message}\n\n"
+    finally:
+        subscription.close()
+
+
+def stream_response(user_id):
+    """Open an SSE stream for ``user_id``, or abort with 503 if none are free."""
+    slots = current_app.extensions["event_stream_slots"]
+    if not slots.acquire(blocking=False):
+        abort(503, description="Too many live update streams; try again later.")
+    response = Response(_stream(current_app._get_current_object(), user_id), mimetype="text/event-stream")
+    # Runs even if the client goes away before the body is started.
+    response.call_on_close(slots.release)
+    response.headers["Cache-Control"] = "no-cache"
+    # Stop nginx and similar proxies from buffering the stream.
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+def init_app(app):
+    directory = app.config.get("EVENTS_SPOOL_DIR")
+    app.extensions["events"] = SpoolBroker(directory) if directory else LocalBroker()
+    app.extensions["event_stream_slots"] = threading.BoundedSemaphore(app.config["EVENTS_MAX_STREAMS"])
@@ -0,0 +1,120 @@
+"""Binned 2D density of a user's plots and how they spread over the zones.
+
+Drawing every point hides the distribution once a user has thousands of
+them. The database bins the plots into the requested grid and classifies
+them into zones itself (``zones.sql_classify``), grouping by ``(cell,
+zone)``, so the result has at most a few rows per grid cell however many
+plots there are and whatever scores the API or an import stored. Results
+are cached per process, keyed by the user's ``data_version``, so a repeated
+request costs one version lookup and an edit never serves a stale grid.
+"""
+from collections import OrderedDict
+import threading
+
+from flask import current_app
+import numpy as np
+from sqlalchemy import Integer, cast, func, select
+
+from app import db, zones
+from app.models import Girl, Plot
+
+
+# The axes ``validate_plot_data`` enforces.
+HOT_RANGE = (0.0, 10.0)
+CRAZY_RANGE = (4.0, 10.0)
+MAX_BINS = 100
+# Scores on a bin edge (e.g. crazy 4.3 with 0.06-wide bins) can land a hair
+# below it in floating point; this nudges them into the bin they start.
+BIN_EPSILON = 1e-9
+
+
+class ResultCache:
+    """Small thread-safe LRU of computed results."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+def _bin(column, value_range, bins, dialect_name):
+    """SQL expression for the 0-based bin of ``column``; the top edge gives ``bins``."""
+    low, high = value_range
+    position = (column - low) * bins / (high - low) + BIN_EPSILON
+    if dialect_name == "postgresql":
+        return func.floor(position)
+    # Validated scores are never below the range, so truncating is flooring.
+    return cast(position, Integer)
+
+
+def score_heatmap(user_id, girl_ids, hot_bins, crazy_bins, filters=()):
+    """Grid and zone counts of a user's plots, optionally limited to ``girl_ids``."""
+    conditions = [Girl.user_id == user_id, *filters]
+    if girl_ids:
+        conditions.append(Plot.girl_id.in_(girl_ids))
+    dialect_name = db.engine.dialect.name
+    hot_bin = _bin(Plot.hot_score, HOT_RANGE, hot_bins, dialect_name).label("hot_bin")
+    crazy_bin = _bin(Plot.crazy_score, CRAZY_RANGE, crazy_bins, dialect_name).label("crazy_bin")
+    zone = zones.sql_classify(Plot.hot_score, Plot.crazy_score).label("zone")
+    rows = db.session.execute(
+        select(hot_bin, crazy_bin, zone, func.count())
+        .join(Girl)
+        .where(*conditions)
+        .group_by(hot_bin, crazy_bin, zone)
+    ).all()
+    cells = np.array(rows, dtype=np.int64).reshape(-1, 4)
+    hot_index, crazy_index, zone_index, weights = cells.T
+
+    # Like np.histogram2d: the top edge of each axis belongs to the last bin,
+    # so hot = 10 and crazy = 10 are counted.
+    in_range = (hot_index >= 0) & (hot_index <= hot_bins) & (crazy_index >= 0) & (crazy_index <= crazy_bins)
+    hot_index = np.minimum(hot_index, hot_bins - 1)
+    crazy_index = np.minimum(crazy_index, crazy_bins - 1)
+    counts = np.zeros((crazy_bins, hot_bins), dtype=np.int64)
+    np.add.at(counts, (crazy_index[in_range], hot_index[in_range]), weights[in_range])
+
+    zone_counts = np.bincount(zone_index + 1, weights=weights, minlength=len(zones.ZONES) + 1).astype(np.int64)
+    return {
+        "hot": {"min": HOT_RANGE[0], "max": HOT_RANGE[1], "bins": hot_bins},
+        "crazy": {"min": CRAZY_RANGE[0], "max": CRAZY_RANGE[1], "bins": crazy_bins},
+        "counts": counts.tolist(),
+        "max": int(counts.max()) if counts.size else 0,
+        "total": int(weights.sum()),
+        "zones": {zone_def.key: int(count) for zone_def, count in zip(zones.ZONES, zone_counts[1:])},
+        "unclassified": int(zone_counts[0]),
+    }
+
+
+def cached_heatmap(version, user_id, girl_ids, hot_bins, crazy_bins, filters=(), filter_key=()):
+    """``score_heatmap`` through the cache; ``version`` must change on every write.
+
+    ``filter_key`` identifies ``filters`` (e.g. the raw ``from``/``to`` values).
+    """
+    cache = current_app.extensions.get("heatmap_cache")
+    key = (version, tuple(sorted(set(girl_ids))), hot_bins, crazy_bins, tuple(filter_key))
+    result = cache.get(key) if cache is not None else None
+    if result is None:
+        result = score_heatmap(user_id, girl_ids, hot_bins, crazy_bins, filters)
+        if cache is not None:
+            cache.put(key, result)
+    return result
+
+
+def init_app(app):
+    """Create the result cache unless ``HEATMAP_CACHE_SIZE`` is 0."""
+    if app.config.get("HEATMAP_CACHE_SIZE"):
+        app.extensions["heatmap_cache"] = ResultCache(app.config["HEATMAP_CACHE_SIZE"])
@@ -0,0 +1,199 @@
+"""Cache of logged-in user identities for Flask-Login's user loader.
+
+Without it every ``@login_required`` request starts with a SELECT of the
+user row. Entries hold the columns a request needs (``id``, ``username``,
+``password_hash``, ``shard_id``) and are turned back into a detached ``User`` without
+touching the database. ``data_version`` is left out on purpose: ETags must
+never be computed from a stale copy, so ``versioning.user_version`` reads it
+itself.
+
+Entries live in a per-process LRU for ``IDENTITY_CACHE_TTL`` seconds. With
+``IDENTITY_CACHE_DIR`` set, a directory shared by all Gunicorn workers acts
+as the shared backend: a worker fills it on a miss, invalidations delete
+from it, and a worker only trusts its local entry while the shared file it
+was read from is unchanged (one ``stat`` per request), so a password change
+or account deletion in one worker is seen by all of them immediately.
+"""
+from collections import OrderedDict
+import json
+import os
+import tempfile
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+
+from app import db
+from app.database import RoutingSession
+
+
+CACHED_COLUMNS = ("id", "username", "password_hash", "shard_id")
+
+
+class FileBackend:
+    """Shared identity store: one JSON file per user in a common directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, user_id):
+        return os.path.join(self.directory, f"{int(user_id)}.json")
+
+    def token(self, user_id):
+        """Identify the current version of a user's file, or ``None`` if absent."""
+        try:
+            stat = os.stat(self._path(user_id))
+        except FileNotFoundError:
+            return None
+        # Every write replaces the file, so the inode changes even when two
+        # writes land within the same mtime tick.
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def get(self, user_id):
+        """Return ``(entry, token)`` or ``None``."""
+        path = self._path(user_id)
+        try:
+            with open(path) as handle:
+                stat = os.fstat(handle.fileno())
+                entry = json.load(handle)
+        except (FileNotFoundError, ValueError):
+            return None
+        return entry, (stat.st_ino, stat.st_mtime_ns)
+
+    def set(self, user_id, entry):
+        """Store ``entry`` atomically and return its token."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as handle:
+            json.dump(entry, handle)
+        os.replace(tmp_path, self._path(user_id))
+        return self.token(user_id)
+
+    def delete(self, user_id):
+        try:
+            os.unlink(self._path(user_id))
+        except FileNotFoundError:
+            pass
+
+
+class IdentityCache:
+    """In-process TTL/LRU cache, optionally kept consistent through a shared backend."""
+
+    def __init__(self, ttl, max_size, backend=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        now = time.time()
+        with self._lock:
+            cached = self._entries.get(user_id)
+        if cached is not None:
+            entry, token = cached
+            if entry["cached_at"] + self.ttl > now and (
+                self.backend is None or self.backend.token(user_id) == token
+            ):
+                with self._lock:
+                    if user_id in self._entries:
+                        self._entries.move_to_end(user_id)
+                return entry
+            with self._lock:
+                self._entries.pop(user_id, None)
+
+        if self.backend is not None:
+            found = self.backend.get(user_id)
+            if found is not None and found[0]["cached_at"] + self.ttl > now:
+                self._remember(user_id, *found)
+                return found[0]
+        return None
+
+    def put(self, user_id, values):
+        entry = dict(values, cached_at=time.time())
+        token = self.backend.set(user_id, entry) if self.backend is not None else None
+        self._remember(user_id, entry, token)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+        if self.backend is not None:
+            self.backend.delete(user_id)
+
+    def _remember(self, user_id, entry, token):
+        with self._lock:
+            self._entries[user_id] = (entry, token)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+def _cache():
+    return current_app.extensions.get("identity_cache")
+
+
+def load_user(user_id):
+    """Return the ``User`` for a session, from the cache when possible."""
+    from app.models import User
+
+    cache = _cache()
+    entry = cache.get(user_id) if cache is not None else None
+    # Entries written before a column was added to CACHED_COLUMNS are misses.
+    if entry is None or any(column not in entry for column in CACHED_COLUMNS):
+        user = db.session.get(User, user_id)
+        if user is not None and user.pending_deletion is not None:
+            return None
+        if user is not None and cache is not None:
+            cache.put(user_id, {column: getattr(user, column) for column in CACHED_COLUMNS})
+        return user
+
+    user = User(**{column: entry[column] for column in CACHED_COLUMNS})
+    # Detached with a persistent identity: no SQL now, and any column that
+    # wasn't cached (data_version) raises instead of silently being None.
+    make_transient_to_detached(user)
+    return user
+
+
+def invalidate(user_id):
+    """Forget a user's cached identity, e.g. after a password change or deletion."""
+    cache = _cache()
+    if cache is not None and user_id is not None:
+        cache.invalidate(user_id)
+
+
+_STALE = "identity_stale"
+
+
+def invalidate_on_commit(user_id):
+    """Forget a user's cached identity once the current transaction commits.
+
+    Invalidating before the commit would let a concurrent request re-cache
+    the old row in between.
+    """
+    if user_id is not None:
+        db.session.info.setdefault(_STALE, set()).add(user_id)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _invalidate_stale(session):
+    for user_id in session.info.pop(_STALE, ()):
+        invalidate(user_id)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _forget_stale(session):
+    session.info.pop(_STALE, None)
+
+
+def init_app(app):
+    """Create the identity cache unless ``IDENTITY_CACHE_TTL`` is 0."""
+    if not app.config.get("IDENTITY_CACHE_TTL"):
+        return
+    directory = app.config.get("IDENTITY_CACHE_DIR")
+    app.extensions["identity_cache"] = IdentityCache(
+        ttl=app.config["IDENTITY_CACHE_TTL"],
+        max_size=app.config["IDENTITY_CACHE_SIZE"],
+        backend=FileBackend(directory) if directory else None,
+    )
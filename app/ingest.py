@@ -0,0 +1,430 @@
+"""Write-behind ingestion of new plots (``INGEST_WRITE_BEHIND=1``).
+
+Clicking around the chart creates plots in bursts, and on SQLite every
+``create_plot`` commit queues for the single writer lock. In write-behind
+mode a validated plot is appended to an on-disk journal and acknowledged
+with ``202`` and its client-generated ``client_id``. A background thread in
+each process inserts the journaled plots every ``INGEST_FLUSH_INTERVAL_MS``
+(sooner once ``INGEST_BATCH_SIZE`` are waiting) in one transaction, with one
+stats update per girl and one version bump per user (one transaction per
+shard when sharding is on).
+
+Each process appends JSON lines to its own segment files, one per user, in
+``INGEST_JOURNAL_DIR/u<user id>/``, and holds an exclusive ``flock`` on each.
+A flush starts new segments, commits the old ones' plots and renames them to
+``.flushed``. A segment nobody holds a lock on belongs to a dead process;
+the flusher replays those on startup, as does ``flask jobs flush-ingest``.
+``plot.client_id`` is unique, so replaying a segment whose plots were
+already committed inserts nothing twice. Records name the shard their
+``girl_id`` belongs to; if the user is moved to another shard before they
+are flushed, ``sharding.group_journaled`` sends them on with the girl's
+new id.
+
+Pending plots stay visible to their owner: the plot list endpoints merge in
+journaled plots the database doesn't have yet, and ``pending_token`` goes
+into the user's ETag version so a 304 never hides one. Flushed segments are
+kept for ``INGEST_RETAIN_SECONDS`` so a request whose database snapshot
+predates a flush still finds those plots in the journal. Splitting segments
+by user keeps those reads to the requesting user's own files, however long
+the queue is. Aggregates (averages, zones, heatmap, search) catch up when
+the plots are flushed.
+"""
+from collections import defaultdict
+from datetime import datetime, timezone
+import fcntl
+import glob
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import zlib
+
+from flask import abort, current_app, g
+from sqlalchemy import insert, select
+
+from app import db, events, metrics, rolling, sharding, stats, versioning
+from app.models import Girl, Plot
+
+
+CLIENT_ID_RE = re.compile(r"^[A-Za-z0-9-]{8,36}$")
+
+
+def parse_client_id(value, required=False):
+    """Validate a client-generated plot id; one is made up if none is required."""
+    if value is None:
+        return str(uuid.uuid4()) if required else None
+    if not isinstance(value, str) or not CLIENT_ID_RE.match(value):
+        abort(400, description="client_id must be 8 to 36 letters, digits or dashes.")
+    return value
+
+
+def _naive_utc(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def user_directory(directory, user_id):
+    return os.path.join(directory, f"u{int(user_id)}")
+
+
+class Journal:
+    """This process's append-only segments of journaled plots, one per user."""
+
+    def __init__(self, directory, fsync=True):
+        self.directory = directory
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._segments = {}
+        self._records = []
+
+    def _open_segment(self, user_id):
+        directory = user_directory(self.directory, user_id)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}-{time.time_ns()}.journal")
+        handle = open(path, "ab")
+        # Held until the segment is flushed; tells recovery its owner is alive.
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return path, handle
+
+    def append(self, record):
+        """Durably add a record; returns how many are waiting in this process."""
+        line = (json.dumps(record) + "\n").encode()
+        with self._lock:
+            segment = self._segments.get(record["user_id"])
+            if segment is None:
+                segment = self._segments[record["user_id"]] = self._open_segment(record["user_id"])
+            handle = segment[1]
+            handle.write(line)
+            handle.flush()
+            if self.fsync:
+                os.fsync(handle.fileno())
+            self._records.append(record)
+            return len(self._records)
+
+    def take(self):
+        """Hand the current segments and their records to the flusher, or ``None``."""
+        with self._lock:
+            if not self._records:
+                return None
+            taken = (list(self._segments.values()), self._records)
+            self._segments, self._records = {}, []
+            return taken
+
+
+def read_segment(path):
+    """Records in a segment file; a line still being written is skipped."""
+    try:
+        with open(path, "rb") as handle:
+            lines = handle.read().split(b"\n")
+    except FileNotFoundError:
+        return []
+    # The last element is either empty or an incomplete line.
+    return [json.loads(line) for line in lines[:-1] if line]
+
+
+def _segment_paths(directory, *suffixes, user_id=None):
+    """Segment files of one user, or of everyone (``user_id=None``)."""
+    if user_id is not None:
+        patterns = [os.path.join(user_directory(directory, user_id), "*")]
+    else:
+        # Top-level segments were written before the journal was split by user.
+        patterns = [os.path.join(directory, "*"), os.path.join(directory, "u*", "*")]
+    paths = []
+    for pattern in patterns:
+        for suffix in suffixes:
+            paths.extend(glob.glob(pattern + suffix))
+    return paths
+
+
+def _retire_segment(path):
+    os.replace(path, path[: -len(".journal")] + ".flushed")
+
+
+def write_records(records):
+    """Insert journaled plots the database doesn't have yet, then commit.
+
+    Plots whose girl is gone (or changed owner) are dropped. Returns the
+    ``(girl_id, plot_id, record)`` triples that were inserted.
+    """
+    by_client_id = {}
+    for record in records:
+        by_client_id.setdefault(record["client_id"], record)
+    client_ids = list(by_client_id)
+    existing = set(db.session.scalars(select(Plot.client_id).where(Plot.client_id.in_(client_ids))))
+    girl_ids = {record["girl_id"] for record in by_client_id.values()}
+    owners = dict(db.session.execute(select(Girl.id, Girl.user_id).where(Girl.id.in_(girl_ids))).all())
+    fresh = [
+        record
+        for client_id, record in by_client_id.items()
+        if client_id not in existing and owners.get(record["girl_id"]) == record["user_id"]
+    ]
+    if not fresh:
+        db.session.rollback()
+        return []
+
+    rows = []
+    points_by_girl = defaultdict(list)
+    girls_by_user = defaultdict(set)
+    for record in fresh:
+        plot_date = datetime.fromisoformat(record["plot_date"])
+        rows.append(
+            {
+                "client_id": record["client_id"],
+                "girl_id": record["girl_id"],
+                "hot_score": record["hot_score"],
+                "crazy_score": record["crazy_score"],
+                "notes": record["notes"],
+                "plot_date": plot_date,
+            }
+        )
+        points_by_girl[record["girl_id"]].append((record["hot_score"], record["crazy_score"], plot_date))
+        girls_by_user[record["user_id"]].add(record["girl_id"])
+
+    rows_by_girl = defaultdict(list)
+    for row in rows:
+        rows_by_girl[row["girl_id"]].append(row)
+    for girl_id, girl_rows in rows_by_girl.items():
+        rolling.plots_added(girl_id, girl_rows)
+    db.session.execute(insert(Plot), rows)
+    for girl_id, points in points_by_girl.items():
+        stats.plots_added(girl_id, points)
+    for user_id, user_girl_ids in girls_by_user.items():
+        versioning.bump(user_id, user_girl_ids)
+    db.session.commit()
+
+    ids = dict(
+        db.session.execute(
+            select(Plot.client_id, Plot.id).where(Plot.client_id.in_([record["client_id"] for record in fresh]))
+        ).all()
+    )
+    return [(record["girl_id"], ids[record["client_id"]], record) for record in fresh]
+
+
+def serialize_record(record, plot_id=None):
+    """A journaled plot in the API's plot shape, with its ``client_id``."""
+    return {
+        "id": plot_id,
+        "client_id": record["client_id"],
+        "x": record["hot_score"],
+        "y": record["crazy_score"],
+        "notes": record["notes"],
+        "date": record["plot_date"],
+    }
+
+
+def _publish_saved(inserted):
+    """Tell each user's dashboards which pending plots now have ids."""
+    by_user = defaultdict(list)
+    for girl_id, plot_id, record in inserted:
+        by_user[record["user_id"]].append({"girl_id": girl_id, "plot": serialize_record(record, plot_id)})
+    for user_id, plots in by_user.items():
+        girl_ids = {plot["girl_id"] for plot in plots}
+        events.publish(
+            user_id, "plots_saved",
+            plots=plots, averages={girl_id: stats.girl_summary(girl_id) for girl_id in girl_ids},
+        )
+
+
+def _write_by_shard(records):
+    """``write_records`` and ``_publish_saved`` once per shard the records' users live on."""
+    inserted = []
+    for shard, shard_records in sharding.group_journaled(records).items():
+        with sharding.use_shard(shard):
+            saved = write_records(shard_records)
+            _publish_saved(saved)
+        inserted.extend(saved)
+    return inserted
+
+
+def replay_orphaned_segments(directory, batch_size):
+    """Flush the segments of processes that died; returns how many plots were inserted."""
+    inserted = 0
+    for path in _segment_paths(directory, ".journal"):
+        try:
+            handle = open(path, "rb")
+        except FileNotFoundError:
+            continue
+        with handle:
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue  # its process is still alive
+            records = read_segment(path)
+            for start in range(0, len(records), batch_size):
+                inserted += len(_write_by_shard(records[start:start + batch_size]))
+            _retire_segment(path)
+    return inserted
+
+
+class Flusher:
+    """Background thread that group-commits one process's journal."""
+
+    def __init__(self, app, journal):
+        self.app = app
+        self.journal = journal
+        self.interval = app.config["INGEST_FLUSH_INTERVAL_MS"] / 1000
+        self.batch_size = app.config["INGEST_BATCH_SIZE"]
+        self.retain = app.config["INGEST_RETAIN_SECONDS"]
+        self._wake = threading.Event()
+        self._backlog = []
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def ensure_running(self):
+        # Started on first use, so each forked Gunicorn worker gets its own thread.
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="ingest-flush", daemon=True)
+                self._thread.start()
+
+    def notify(self, waiting):
+        if waiting >= self.batch_size:
+            self._wake.set()
+
+    def _run(self):
+        with self.app.app_context():
+            try:
+                replay_orphaned_segments(self.journal.directory, self.batch_size)
+            except Exception:
+                self.app.logger.exception("Replaying orphaned ingest segments failed.")
+            finally:
+                db.session.remove()
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            with self.app.app_context():
+                try:
+                    self.flush()
+                    self._remove_retired()
+                except Exception:
+                    # The segments stay on disk and in the backlog; retry next round.
+                    db.session.rollback()
+                    self.app.logger.exception("Flushing journaled plots failed.")
+                finally:
+                    db.session.remove()
+
+    def flush(self):
+        taken = self.journal.take()
+        if taken is not None:
+            self._backlog.append(taken)
+        while self._backlog:
+            segments, records = self._backlog[0]
+            for start in range(0, len(records), self.batch_size):
+                inserted = _write_by_shard(records[start:start + self.batch_size])
+                now = time.time()
+                for _, _, record in inserted:
+                    metrics.INGEST_FLUSH_LAG.observe(now - record["queued_at"])
+                metrics.INGEST_FLUSHED.inc(len(inserted))
+            self._backlog.pop(0)
+            metrics.INGEST_QUEUE_DEPTH.dec(len(records))
+            for path, handle in segments:
+                _retire_segment(path)
+                handle.close()
+
+    def _remove_retired(self):
+        cutoff = time.time() - self.retain
+        for path in _segment_paths(self.journal.directory, ".flushed"):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+def _flusher():
+    return current_app.extensions.get("ingest")
+
+
+def enabled():
+    return _flusher() is not None
+
+
+def enqueue(user_id, girl_id, cleaned, plot_date, client_id):
+    """Journal a validated plot for the flusher and return its record."""
+    flusher = _flusher()
+    record = {
+        "client_id": client_id,
+        "user_id": user_id,
+        "girl_id": girl_id,
+        "shard": g.get("shard"),
+        "hot_score": cleaned["hot_score"],
+        "crazy_score": cleaned["crazy_score"],
+        "notes": cleaned.get("notes"),
+        "plot_date": _naive_utc(plot_date).isoformat(),
+        "queued_at": time.time(),
+    }
+    flusher.ensure_running()
+    waiting = flusher.journal.append(record)
+    metrics.INGEST_QUEUE_DEPTH.inc()
+    flusher.notify(waiting)
+    return record
+
+
+def _journaled(user_id, *suffixes):
+    directory = _flusher().journal.directory
+    return [
+        record
+        for path in _segment_paths(directory, *suffixes, user_id=user_id)
+        for record in read_segment(path)
+    ]
+
+
+def pending_token(user_id):
+    """Changes whenever a plot of ``user_id`` is journaled; ``""`` when disabled.
+
+    Built from the names and sizes of the user's open segments, so it costs
+    a few ``stat`` calls and never parses them.
+    """
+    if not enabled():
+        return ""
+    state = []
+    for path in sorted(_segment_paths(_flusher().journal.directory, ".journal", user_id=user_id)):
+        try:
+            state.append(f"{os.path.basename(path)}:{os.path.getsize(path)}")
+        except FileNotFoundError:
+            pass  # flushed meanwhile; the version bump covers it
+    return f".p{zlib.crc32(';'.join(state).encode()):08x}" if state else ".p0"
+
+
+def pending_plots(user_id, girl_ids, date_from=None, date_to=None):
+    """Journaled plots of ``girl_ids`` that this session's snapshot doesn't have yet.
+
+    Returns ``{girl_id: [record, ...]}`` ordered by date.
+    """
+    if not enabled():
+        return {}
+    girl_ids = set(girl_ids)
+    candidates = {}
+    for record in _journaled(user_id, ".journal", ".flushed"):
+        plot_date = datetime.fromisoformat(record["plot_date"])
+        # Ids journaled before a move refer to girls on the old shard.
+        if record["girl_id"] not in girl_ids or record.get("shard") not in (None, g.get("shard")):
+            continue
+        if (date_from is not None and plot_date < _naive_utc(date_from)) or (
+            date_to is not None and plot_date >= _naive_utc(date_to)
+        ):
+            continue
+        candidates.setdefault(record["client_id"], record)
+    if not candidates:
+        return {}
+
+    saved = set(db.session.scalars(select(Plot.client_id).where(Plot.client_id.in_(list(candidates)))))
+    pending = defaultdict(list)
+    for client_id, record in candidates.items():
+        if client_id not in saved:
+            pending[record["girl_id"]].append(record)
+    for records in pending.values():
+        records.sort(key=lambda record: record["plot_date"])
+    return dict(pending)
+
+
+def init_app(app):
+    if app.config.get("INGEST_WRITE_BEHIND"):
+        journal = Journal(app.config["INGEST_JOURNAL_DIR"], fsync=app.config["INGEST_FSYNC"])
+        app.extensions["ingest"] = Flusher(app, journal)
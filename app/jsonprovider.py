@@ -0,0 +1,39 @@
+"""orjson-backed JSON provider, used when orjson is installed.
+
+``jsonify`` output is the same as with Flask's default provider (sorted
+keys, ``default()`` for dates, decimals and the like), only encoded several
+times faster. Calls asking for stdlib-only options such as ``indent`` fall
+back to the default implementation.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    # Datetimes go through ``default`` so they render as HTTP dates, exactly
+    # like the stdlib provider; integer dict keys (plots grouped by girl id)
+    # become strings like in the stdlib encoder.
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        default = kwargs.pop("default", self.default)
+        sort_keys = kwargs.pop("sort_keys", self.sort_keys)
+        # orjson always writes compact UTF-8, which is what these ask for or
+        # an equivalent encoding of it.
+        kwargs.pop("ensure_ascii", None)
+        if kwargs.get("separators") == (",", ":"):
+            del kwargs["separators"]
+        if kwargs:
+            return super().dumps(obj, default=default, sort_keys=sort_keys, **kwargs)
+        option = self.options | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(obj, default=default, option=option).decode()
+
+
+def init_app(app):
+    """Switch ``app.json`` to orjson when it is available."""
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
@@ -0,0 +1,184 @@
+"""Prometheus metrics served at ``/metrics``.
+
+Exposed series:
+
+* ``http_requests_total`` and ``http_request_duration_seconds``, labelled by
+  endpoint (``blueprint.view``) rather than raw path, so plot and girl ids
+  don't multiply the series;
+* ``db_pool_checkout_wait_seconds``, the time spent waiting for a pooled
+  connection, plus ``db_pool_checked_out``/``db_pool_overflow`` gauges,
+  labelled by database (``main`` or the shard's bind key);
+* ``ingest_queue_depth``, ``ingest_flush_lag_seconds`` and
+  ``ingest_plots_flushed_total`` for write-behind plot creation;
+* ``app_users``, ``app_girls`` and ``app_plots``, refreshed at most every
+  ``METRICS_COUNT_TTL`` seconds from ``girl_stats`` instead of counting plots.
+
+The endpoint is off unless ``METRICS_ENABLED`` is set. With ``METRICS_TOKEN``
+set, scrapes must send it as ``Authorization: Bearer <token>``; otherwise keep
+``/metrics`` unreachable from outside (e.g. block it at the proxy).
+
+Under Gunicorn each worker is its own process, so ``boot.sh`` sets
+``PROMETHEUS_MULTIPROC_DIR``: prometheus_client then keeps values in per-process
+files there, ``/metrics`` merges them on scrape, and ``gunicorn.conf.py``
+drops a worker's live gauges when it exits.
+"""
+import hmac
+import os
+import time
+
+from flask import Blueprint, Response, abort, current_app, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event, func, select
+
+from app import db
+
+
+bp = Blueprint("metrics", __name__)
+
+
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled.", ["method", "endpoint", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time to produce a response, streaming bodies excluded.",
+    ["method", "endpoint"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the SQLAlchemy pool.",
+    ["database"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Connections currently checked out.", ["database"], multiprocess_mode="livesum"
+)
+POOL_OVERFLOW = Gauge(
+    "db_pool_overflow", "Connections open beyond pool_size.", ["database"], multiprocess_mode="livesum"
+)
+INGEST_QUEUE_DEPTH = Gauge(
+    "ingest_queue_depth", "Journaled plots waiting to be flushed.", multiprocess_mode="livesum"
+)
+INGEST_FLUSH_LAG = Histogram(
+    "ingest_flush_lag_seconds",
+    "Time from acknowledging a write-behind plot to committing it.",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+INGEST_FLUSHED = Counter("ingest_plots_flushed_total", "Journaled plots inserted by the flusher.")
+ROW_COUNTS = {
+    name: Gauge(f"app_{name}", f"Total {name}.", multiprocess_mode="mostrecent")
+    for name in ("users", "girls", "plots")
+}
+
+_counts_refreshed_at = None
+
+
+def _refresh_row_counts():
+    """Update the row count gauges if the last refresh is older than the TTL."""
+    global _counts_refreshed_at
+    from app import sharding
+    from app.models import GirlStats, User
+
+    now = time.monotonic()
+    if _counts_refreshed_at is not None and now - _counts_refreshed_at < current_app.config["METRICS_COUNT_TTL"]:
+        return
+    # girl_stats has one row per girl and already knows each girl's plot count.
+    girls = plots = 0
+    for _ in sharding.each_shard():
+        shard_girls, shard_plots = db.session.execute(
+            select(func.count(), func.coalesce(func.sum(GirlStats.plot_count), 0)).select_from(GirlStats)
+        ).one()
+        girls += shard_girls
+        plots += shard_plots
+    users = db.session.scalar(select(func.count()).select_from(User).where(User.pending_deletion.is_(None)))
+    ROW_COUNTS["users"].set(users)
+    ROW_COUNTS["girls"].set(girls)
+    ROW_COUNTS["plots"].set(plots)
+    _counts_refreshed_at = now
+
+
+def _registry():
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+@bp.route("/metrics")
+def metrics():
+    token = current_app.config.get("METRICS_TOKEN")
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        abort(401)
+    _refresh_row_counts()
+    return Response(generate_latest(_registry()), mimetype=CONTENT_TYPE_LATEST)
+
+
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+def _record_request(response):
+    start = g.pop("metrics_start", None)
+    if start is None:
+        return response
+    # Unmatched URLs share one label instead of one series per scanned path.
+    endpoint = request.url_rule.endpoint if request.url_rule else "unmatched"
+    REQUESTS.labels(request.method, endpoint, str(response.status_code)).inc()
+    REQUEST_LATENCY.labels(request.method, endpoint).observe(time.perf_counter() - start)
+    return response
+
+
+def _instrument_pool(engine, database):
+    raw_connection = engine.raw_connection
+    checkout_wait = POOL_CHECKOUT_WAIT.labels(database)
+    checked_out_gauge = POOL_CHECKED_OUT.labels(database)
+    overflow_gauge = POOL_OVERFLOW.labels(database)
+
+    def timed_raw_connection():
+        start = time.perf_counter()
+        try:
+            return raw_connection()
+        finally:
+            checkout_wait.observe(time.perf_counter() - start)
+
+    engine.raw_connection = timed_raw_connection
+
+    def checked_out(*args):
+        checked_out_gauge.inc()
+        update_overflow()
+
+    def checked_in(*args):
+        checked_out_gauge.dec()
+        update_overflow()
+
+    def update_overflow():
+        # Only QueuePool has overflow; SQLite memory/static pools don't.
+        if hasattr(engine.pool, "overflow"):
+            overflow_gauge.set(max(engine.pool.overflow(), 0))
+
+    event.listen(engine, "checkout", checked_out)
+    event.listen(engine, "checkin", checked_in)
+
+
+def init_app(app):
+    """Register ``/metrics`` and the request and pool instrumentation."""
+    if not app.config.get("METRICS_ENABLED"):
+        return
+    with app.app_context():
+        # Every shard has its own engine and pool.
+        for bind_key, engine in db.engines.items():
+            _instrument_pool(engine, bind_key or "main")
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.register_blueprint(bp)
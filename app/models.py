@@ -1,34 +1,77 @@
-from app import db, login
-from werkzeug.security import generate_password_hash, check_password_hash
+from app import db, identity, login, passwords
 from flask_login import UserMixin
 from datetime import datetime
 
 @login.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    return identity.load_user(int(id))
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), index=True, unique=True)
     password_hash = db.Column(db.String(256))
-    girls = db.relationship('Girl', backref='owner', lazy='dynamic', cascade="all, delete-orphan")
+    # Bumped by every write to the user's data; API ETags are derived from it.
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Set when the account is being deleted in the background (see app.deletion).
+    pending_deletion = db.Column(db.DateTime)
+    # Shard holding the user's girls and plots when sharding is on (see app.sharding).
+    shard_id = db.Column(db.Integer)
+    # The database cascades deletes (ON DELETE CASCADE); passive_deletes stops
+    # the ORM from loading every child just to delete it row by row.
+    girls = db.relationship('Girl', backref='owner', lazy='dynamic', cascade="all, delete-orphan",
+                            passive_deletes=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash_password(password)
+        identity.invalidate_on_commit(self.id)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify_password(self.password_hash, password)
 
 class Girl(db.Model):
+    __table_args__ = (db.Index('ix_girl_user_id_name', 'user_id', 'name'),)
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), index=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    plots = db.relationship('Plot', backref='girl', lazy='dynamic', cascade="all, delete-orphan")
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'))
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    plots = db.relationship('Plot', backref='girl', lazy='dynamic', cascade="all, delete-orphan",
+                            passive_deletes=True)
+    stats = db.relationship('GirlStats', backref='girl', uselist=False, cascade="all, delete-orphan",
+                            passive_deletes=True)
 
 class Plot(db.Model):
+    __table_args__ = (db.Index('ix_plot_girl_id_plot_date', 'girl_id', 'plot_date'),)
+
     id = db.Column(db.Integer, primary_key=True)
     hot_score = db.Column(db.Float, nullable=False)
     crazy_score = db.Column(db.Float, nullable=False)
     notes = db.Column(db.Text)
     plot_date = db.Column(db.DateTime, index=True, default=datetime.utcnow)
-    girl_id = db.Column(db.Integer, db.ForeignKey('girl.id'))
+    girl_id = db.Column(db.Integer, db.ForeignKey('girl.id', ondelete='CASCADE'))
+    # Id chosen by the client, so retried and write-behind creates are idempotent.
+    client_id = db.Column(db.String(36), index=True, unique=True)
+    # EWMA of the girl's scores right after this plot (see app.rolling).
+    ewma_hot = db.Column(db.Float)
+    ewma_crazy = db.Column(db.Float)
+
+
+class GirlStats(db.Model):
+    """Running aggregates of a girl's plots, maintained by ``app.stats`` on every write."""
+    __tablename__ = 'girl_stats'
+
+    girl_id = db.Column(db.Integer, db.ForeignKey('girl.id', ondelete='CASCADE'), primary_key=True)
+    plot_count = db.Column(db.Integer, nullable=False, default=0)
+    hot_sum = db.Column(db.Float, nullable=False, default=0.0)
+    hot_sq_sum = db.Column(db.Float, nullable=False, default=0.0)
+    crazy_sum = db.Column(db.Float, nullable=False, default=0.0)
+    crazy_sq_sum = db.Column(db.Float, nullable=False, default=0.0)
+    hot_min = db.Column(db.Float)
+    hot_max = db.Column(db.Float)
+    crazy_min = db.Column(db.Float)
+    crazy_max = db.Column(db.Float)
+    last_plot_date = db.Column(db.DateTime)
+    # EWMA state after the girl's latest plot, and that plot's date (see app.rolling).
+    ewma_hot = db.Column(db.Float)
+    ewma_crazy = db.Column(db.Float)
+    ewma_plot_date = db.Column(db.DateTime)
@@ -0,0 +1,98 @@
+"""Keyset pagination over plots ordered by ``(plot_date, id)``.
+
+A cursor names the last (or first) row a client has already seen, so each
+page is one index range read on ``ix_plot_girl_id_plot_date`` no matter how
+deep into the history it is, unlike OFFSET.
+
+Journaled plots (``INGEST_WRITE_BEHIND``) have no id yet. ``page_window``
+gives the dates of the ones that belong on a page: they sort after saved
+plots of the same date, as they will once flushed, so each shows up on
+exactly one page, which may then hold more than ``limit`` plots.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from flask import abort, request
+from sqlalchemy import tuple_
+
+from app.models import Plot
+
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+PAGINATION_PARAMS = ("limit", "after", "before")
+
+
+def encode_cursor(plot):
+    raw = f"{plot.plot_date.isoformat()}|{plot.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        plot_date, plot_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(plot_date), int(plot_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        abort(400, description="Invalid pagination cursor.")
+
+
+def wants_page():
+    return any(param in request.args for param in PAGINATION_PARAMS)
+
+
+def page_limit():
+    try:
+        limit = int(request.args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        abort(400, description="limit must be an integer.")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        abort(400, description=f"limit must be between 1 and {MAX_PAGE_SIZE}.")
+    return limit
+
+
+def paginate_plots(query):
+    """Apply ``after``/``before``/``limit`` from the request to a plot query.
+
+    Returns ``(plots, next_cursor, prev_cursor)`` with ``plots`` in ascending
+    date order. ``next_cursor`` is set when later plots exist and
+    ``prev_cursor`` when earlier ones may exist.
+    """
+    if "after" in request.args and "before" in request.args:
+        abort(400, description="Use either after or before, not both.")
+    limit = page_limit()
+    key = tuple_(Plot.plot_date, Plot.id)
+
+    if "before" in request.args:
+        query = query.filter(key < tuple_(*decode_cursor(request.args["before"])))
+        plots = query.order_by(Plot.plot_date.desc(), Plot.id.desc()).limit(limit + 1).all()
+        has_more = len(plots) > limit
+        plots = plots[:limit][::-1]
+        next_cursor = encode_cursor(plots[-1]) if plots else None
+        prev_cursor = encode_cursor(plots[0]) if has_more else None
+        return plots, next_cursor, prev_cursor
+
+    if "after" in request.args:
+        query = query.filter(key > tuple_(*decode_cursor(request.args["after"])))
+    plots = query.order_by(Plot.plot_date.asc(), Plot.id.asc()).limit(limit + 1).all()
+    has_more = len(plots) > limit
+    plots = plots[:limit]
+    next_cursor = encode_cursor(plots[-1]) if has_more else None
+    prev_cursor = encode_cursor(plots[0]) if plots and "after" in request.args else None
+    return plots, next_cursor, prev_cursor
+
+
+def page_window(plots, next_cursor, prev_cursor):
+    """``(from, to)`` dates (inclusive, exclusive; ``None`` if open) a page of ``paginate_plots`` covers."""
+    date_from = date_to = None
+    if "after" in request.args:
+        date_from = decode_cursor(request.args["after"])[0]
+    elif prev_cursor is not None:
+        date_from = plots[0].plot_date
+    if "before" in request.args:
+        date_to = decode_cursor(request.args["before"])[0]
+    elif next_cursor is not None:
+        date_to = plots[-1].plot_date
+    return date_from, date_to
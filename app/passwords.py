@@ -0,0 +1,103 @@
+"""Password hashing on a bounded worker pool.
+
+Hashing is deliberately slow, and a burst of logins used to occupy every
+Gunicorn worker with it. Hashes now run on a small per-process thread pool
+(``hashlib.scrypt`` and ``pbkdf2_hmac`` release the GIL), so at most
+``PASSWORD_HASH_WORKERS`` cores per process hash at once. The request
+thread waits for its hash, so the pool doesn't free it: what keeps a burst
+from taking every request thread is that only ``PASSWORD_HASH_MAX_PENDING``
+hashes per process may be running or queued. Any more get a 503 with
+``Retry-After`` straight away instead of queueing.
+
+``PASSWORD_HASH_METHOD`` takes Werkzeug's method strings, e.g.
+``scrypt:32768:8:1`` or ``pbkdf2:sha256:600000``. Stored hashes made with
+other parameters are replaced on the next successful login.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from flask import current_app, has_app_context
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class HashingBusy(ServiceUnavailable):
+    description = "Too many sign-ins at once. Please try again in a moment."
+
+
+def normalize_method(method):
+    """Spell out Werkzeug's defaults, so the result matches a hash's prefix."""
+    name, *params = method.split(":")
+    if name == "scrypt":
+        defaults = ["32768", "8", "1"]
+    elif name == "pbkdf2":
+        defaults = ["sha256", str(DEFAULT_PBKDF2_ITERATIONS)]
+    else:
+        raise ValueError(f"Unsupported password hash method: {method!r}")
+    return ":".join([name] + params + defaults[len(params):])
+
+
+class PasswordHasher:
+    def __init__(self, method, workers, max_pending):
+        self.method = normalize_method(method)
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _pool(self):
+        # Created on first use, so each forked Gunicorn worker gets its own threads.
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="password-hash")
+            return self._executor
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy(retry_after=1)
+        try:
+            return self._pool().submit(function, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split("$", 1)[0] != self.method
+
+
+def _hasher():
+    if has_app_context():
+        return current_app.extensions.get("password_hasher")
+    return None
+
+
+def hash_password(password):
+    hasher = _hasher()
+    return hasher.hash(password) if hasher is not None else generate_password_hash(password)
+
+
+def verify_password(password_hash, password):
+    hasher = _hasher()
+    if hasher is None:
+        return check_password_hash(password_hash, password)
+    return hasher.verify(password_hash, password)
+
+
+def needs_rehash(password_hash):
+    hasher = _hasher()
+    return hasher is not None and hasher.needs_rehash(password_hash)
+
+
+def init_app(app):
+    app.extensions["password_hasher"] = PasswordHasher(
+        method=app.config["PASSWORD_HASH_METHOD"],
+        workers=app.config["PASSWORD_HASH_WORKERS"],
+        max_pending=app.config["PASSWORD_HASH_MAX_PENDING"],
+    )
@@ -0,0 +1,141 @@
+"""Opt-in per-request profiling.
+
+With ``PROFILING_ENABLED`` set, every request records:
+
+* ``sql``: number of statements and time spent executing them, from engine
+  events;
+* named phases such as ``validate`` and ``serialize`` (JSON encoding), timed
+  with ``phase()``;
+* ``app``: the rest of the view, which is mostly ORM hydration and Python.
+
+They are sent back in a ``Server-Timing`` header, which browser dev tools
+show next to each request, and logged as one JSON line per request. If
+``PROFILE_DIR`` is also set, requests slower than ``PROFILE_SLOW_MS`` leave
+a cProfile ``.pstats`` dump there for ``python -m pstats`` or snakeviz.
+"""
+from contextlib import contextmanager
+import cProfile
+import json
+import os
+import re
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def _current():
+    if has_request_context():
+        return g.get("profile")
+    return None
+
+
+@contextmanager
+def phase(name):
+    """Time a block of request work under ``name``; a no-op when profiling is off."""
+    profile = _current()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile["phases"][name] = profile["phases"].get(name, 0.0) + time.perf_counter() - start
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current()
+    if profile is not None:
+        profile["sql_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current()
+    if profile is not None and "sql_started" in profile:
+        profile["sql_count"] += 1
+        profile["sql_time"] += time.perf_counter() - profile.pop("sql_started")
+
+
+def _start_request():
+    g.profile = {"start": time.perf_counter(), "sql_count": 0, "sql_time": 0.0, "phases": {}}
+    if current_app.config.get("PROFILE_DIR"):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        g.profile["cprofile"] = profiler
+
+
+def _dump_slow_profile(profiler, total_ms):
+    profile_dir = current_app.config["PROFILE_DIR"]
+    os.makedirs(profile_dir, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", request.path).strip("_") or "root"
+    filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{slug}-{int(total_ms)}ms.pstats"
+    profiler.dump_stats(os.path.join(profile_dir, filename))
+
+
+def _finish_request(response):
+    profile = g.pop("profile", None)
+    if profile is None:
+        return response
+
+    total = time.perf_counter() - profile["start"]
+    profiler = profile.get("cprofile")
+    if profiler is not None:
+        profiler.disable()
+        if total * 1000 >= current_app.config["PROFILE_SLOW_MS"]:
+            _dump_slow_profile(profiler, total * 1000)
+
+    phases = profile["phases"]
+    other = max(total - profile["sql_time"] - sum(phases.values()), 0.0)
+    timings = [f'sql;dur={profile["sql_time"] * 1000:.2f};desc="{profile["sql_count"]} queries"']
+    timings += [f"{name};dur={seconds * 1000:.2f}" for name, seconds in phases.items()]
+    timings += [f"app;dur={other * 1000:.2f}", f"total;dur={total * 1000:.2f}"]
+    response.headers.add("Server-Timing", ", ".join(timings))
+
+    current_app.logger.info(
+        "request_profile %s",
+        json.dumps(
+            {
+                "method": request.method,
+                "path": request.path,
+                "endpoint": request.endpoint,
+                "status": response.status_code,
+                "total_ms": round(total * 1000, 2),
+                "sql_ms": round(profile["sql_time"] * 1000, 2),
+                "sql_count": profile["sql_count"],
+                "phases_ms": {name: round(seconds * 1000, 2) for name, seconds in phases.items()},
+            }
+        ),
+    )
+    return response
+
+
+def _time_json_serialization(app):
+    provider = app.json
+    dumps = provider.dumps
+
+    def timed_dumps(obj, **kwargs):
+        with phase("serialize"):
+            return dumps(obj, **kwargs)
+
+    provider.dumps = timed_dumps
+
+
+_engine_events_installed = False
+
+
+def init_app(app):
+    """Register the profiling hooks when ``PROFILING_ENABLED`` is set."""
+    global _engine_events_installed
+
+    if not app.config.get("PROFILING_ENABLED"):
+        return
+    if not _engine_events_installed:
+        # Listening on the Engine class covers every engine the app creates.
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _engine_events_installed = True
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    _time_json_serialization(app)
@@ -0,0 +1,237 @@
+"""Trailing-window and exponentially weighted score metrics.
+
+All-time means never forget an outlier. ``/api/rolling`` adds averages over
+the last N plots and the last N days, read through the
+``(girl_id, plot_date)`` index, and an exponentially weighted moving average
+(EWMA) with weight ``ROLLING_EWMA_ALPHA`` on the newest plot.
+
+The EWMA is kept up to date rather than computed on read. Plots are folded
+in ``(plot_date, id)`` order; ``girl_stats`` holds the state after the
+girl's latest plot and every plot row holds a checkpoint: the state right
+after it. A new plot dated after the latest one is folded in O(1) and its
+checkpoint written with the insert. An older plot, an edit or a delete
+changes the average from that plot on, so only that suffix is refolded at
+commit, starting from the checkpoint before it. The effect of a change
+shrinks by ``1 - alpha`` per later plot, so the refold stops as soon as the
+recomputed checkpoints match the stored ones again.
+
+Both are read-modify-writes of the girl's state, so each first takes the
+write lock on her ``girl_stats`` row (on SQLite, the database's) with an
+UPDATE that changes nothing, then reads the state. A concurrent write for
+the same girl waits for the commit and folds on top of it instead of
+overwriting it.
+
+Changing ``ROLLING_EWMA_ALPHA`` makes the stored state stale; run
+``flask stats rebuild`` afterwards.
+"""
+from flask import current_app
+from sqlalchemy import and_, event, func, or_, select, true, update
+
+from app import db
+from app.database import RoutingSession
+from app.models import Girl, GirlStats, Plot
+
+
+# Stored checkpoints this close to the recomputed ones count as unchanged.
+TOLERANCE = 1e-9
+REFOLD_BATCH_SIZE = 500
+
+_DIRTY = "rolling_dirty"
+
+
+def _naive(value):
+    # SQLite hands back naive datetimes for values that were written as aware ones.
+    return value.replace(tzinfo=None) if value is not None else None
+
+
+def _fold(alpha, state, hot, crazy):
+    if state is None:
+        return hot, crazy
+    return alpha * hot + (1 - alpha) * state[0], alpha * crazy + (1 - alpha) * state[1]
+
+
+def _mark(girl_id, since, settle_after):
+    """Refold the girl's plots dated ``since`` or later at commit (``None``: all of them).
+
+    The refold may stop early only past ``settle_after``, the latest date a
+    plot was written or removed at.
+    """
+    dirty = db.session.info.setdefault(_DIRTY, {})
+    if girl_id in dirty:
+        old_since, old_settle_after = dirty[girl_id]
+        since = None if since is None or old_since is None else min(since, old_since)
+        settle_after = max(settle_after, old_settle_after)
+    dirty[girl_id] = (since, settle_after)
+
+
+def _lock_state(girl_id):
+    """Write-lock the girl's ``girl_stats`` row and read its EWMA state; ``None`` if she has none."""
+    db.session.execute(
+        update(GirlStats)
+        .where(GirlStats.girl_id == girl_id)
+        .values(ewma_plot_date=GirlStats.ewma_plot_date)
+        .execution_options(synchronize_session=False)
+    )
+    return db.session.execute(
+        select(GirlStats.plot_count, GirlStats.ewma_hot, GirlStats.ewma_crazy, GirlStats.ewma_plot_date)
+        .where(GirlStats.girl_id == girl_id)
+    ).first()
+
+
+def _store_state(girl_id, state, plot_date):
+    hot, crazy = state if state is not None else (None, None)
+    db.session.execute(
+        update(GirlStats)
+        .where(GirlStats.girl_id == girl_id)
+        .values(ewma_hot=hot, ewma_crazy=crazy, ewma_plot_date=plot_date)
+    )
+
+
+def plots_added(girl_id, rows):
+    """Fold new plots into the girl's EWMA; call before inserting them.
+
+    ``rows`` are the plot values about to be inserted (dicts with
+    ``hot_score``, ``crazy_score`` and ``plot_date``); plots newer than her
+    latest one get their ``ewma_hot``/``ewma_crazy`` checkpoint set here.
+    """
+    rows = sorted(rows, key=lambda row: _naive(row["plot_date"]))
+    if not rows:
+        return
+    first, last = _naive(rows[0]["plot_date"]), _naive(rows[-1]["plot_date"])
+    stats = _lock_state(girl_id)
+    if stats is None or (stats.ewma_plot_date is None and stats.plot_count):
+        # No state to continue from (a new girl_stats row, or one written
+        # before the EWMA existed).
+        _mark(girl_id, None, last)
+        return
+    if stats.ewma_plot_date is not None and first < _naive(stats.ewma_plot_date):
+        _mark(girl_id, first, last)
+        return
+
+    alpha = current_app.config["ROLLING_EWMA_ALPHA"]
+    state = (stats.ewma_hot, stats.ewma_crazy) if stats.ewma_plot_date is not None else None
+    for row in rows:
+        state = _fold(alpha, state, row["hot_score"], row["crazy_score"])
+        row["ewma_hot"], row["ewma_crazy"] = state
+    _store_state(girl_id, state, last)
+
+
+def plot_changed(girl_id, old_date, new_date):
+    _mark(girl_id, min(_naive(old_date), _naive(new_date)), max(_naive(old_date), _naive(new_date)))
+
+
+def plot_removed(girl_id, plot_date):
+    _mark(girl_id, _naive(plot_date), _naive(plot_date))
+
+
+def recompute(girl_id):
+    """Refold all of one girl's plots; the caller commits."""
+    _refold(girl_id, None, None)
+
+
+def rebuild():
+    """Refold every girl in the selected database; the caller commits."""
+    girl_ids = db.session.scalars(select(Girl.id)).all()
+    for girl_id in girl_ids:
+        _refold(girl_id, None, None)
+    return len(girl_ids)
+
+
+def _after(plot_date, plot_id):
+    return or_(Plot.plot_date > plot_date, and_(Plot.plot_date == plot_date, Plot.id > plot_id))
+
+
+def _refold(girl_id, since, settle_after):
+    if _lock_state(girl_id) is None:
+        return  # deleted in this transaction
+    alpha = current_app.config["ROLLING_EWMA_ALPHA"]
+
+    state = last_date = None
+    if since is not None:
+        previous = db.session.execute(
+            select(Plot.plot_date, Plot.ewma_hot, Plot.ewma_crazy)
+            .where(Plot.girl_id == girl_id, Plot.plot_date < since)
+            .order_by(Plot.plot_date.desc(), Plot.id.desc())
+            .limit(1)
+        ).first()
+        if previous is not None and previous.ewma_hot is None:
+            since = None  # no checkpoint to start from
+        elif previous is not None:
+            last_date, state = previous.plot_date, (previous.ewma_hot, previous.ewma_crazy)
+
+    condition = Plot.plot_date >= since if since is not None else true()
+    while True:
+        rows = db.session.execute(
+            select(Plot.id, Plot.plot_date, Plot.hot_score, Plot.crazy_score, Plot.ewma_hot, Plot.ewma_crazy)
+            .where(Plot.girl_id == girl_id, condition)
+            .order_by(Plot.plot_date, Plot.id)
+            .limit(REFOLD_BATCH_SIZE)
+        ).all()
+        changed = []
+        for row in rows:
+            state = _fold(alpha, state, row.hot_score, row.crazy_score)
+            if (
+                settle_after is not None
+                and _naive(row.plot_date) > settle_after
+                and row.ewma_hot is not None
+                and abs(row.ewma_hot - state[0]) <= TOLERANCE
+                and abs(row.ewma_crazy - state[1]) <= TOLERANCE
+            ):
+                # Converged: every later checkpoint and the girl's state still hold.
+                _write_checkpoints(changed)
+                return
+            changed.append({"id": row.id, "ewma_hot": state[0], "ewma_crazy": state[1]})
+            last_date = row.plot_date
+        _write_checkpoints(changed)
+        if len(rows) < REFOLD_BATCH_SIZE:
+            break
+        condition = _after(rows[-1].plot_date, rows[-1].id)
+
+    _store_state(girl_id, state, last_date)
+
+
+def _write_checkpoints(changed):
+    if changed:
+        db.session.execute(update(Plot), changed)
+
+
+@event.listens_for(RoutingSession, "before_commit")
+def _refold_dirty(session):
+    dirty = session.info.pop(_DIRTY, None)
+    if not dirty:
+        return
+    session.flush()
+    for girl_id, (since, settle_after) in dirty.items():
+        _refold(girl_id, since, settle_after)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _forget_dirty(session):
+    session.info.pop(_DIRTY, None)
+
+
+def trailing_plots(girl_id, window):
+    """Average of the girl's ``window`` latest plots: ``(count, avg_hot, avg_crazy)``."""
+    rows = db.session.execute(
+        select(Plot.hot_score, Plot.crazy_score)
+        .where(Plot.girl_id == girl_id)
+        .order_by(Plot.plot_date.desc(), Plot.id.desc())
+        .limit(window)
+    ).all()
+    if not rows:
+        return 0, None, None
+    return (
+        len(rows),
+        sum(row.hot_score for row in rows) / len(rows),
+        sum(row.crazy_score for row in rows) / len(rows),
+    )
+
+
+def trailing_days(girl_ids, since):
+    """Averages of plots dated ``since`` or later: ``{girl_id: (count, avg_hot, avg_crazy)}``."""
+    rows = db.session.execute(
+        select(Plot.girl_id, func.count(), func.avg(Plot.hot_score), func.avg(Plot.crazy_score))
+        .where(Plot.girl_id.in_(girl_ids), Plot.plot_date >= since)
+        .group_by(Plot.girl_id)
+    ).all()
+    return {row[0]: tuple(row[1:]) for row in rows}
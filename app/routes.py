@@ -1,90 +1,74 @@
-from datetime import datetime
-import re
+from datetime import datetime, timedelta
+from operator import itemgetter
 
-from flask import Blueprint, abort, jsonify, render_template, request
+from flask import Blueprint, Response, abort, current_app, g, jsonify, render_template, request, stream_with_context
 from flask_login import current_user, login_required
-from sqlalchemy import func
+import numpy as np
+from sqlalchemy import func, select
 
-from app import db
-from app.models import Girl, Plot
+from app import analytics, columnar, dataio, db, deletion, events, heatmap, ingest, pagination, rolling, search, stats, versioning, zones
+from app.models import Girl, GirlStats, Plot
+from app.validation import parse_date_param, parse_plot_date, validate_plot_data
 
 
 bp = Blueprint("main", __name__)
 
 
-# --- Helper for Validation ---
-def validate_plot_data(data, *, is_update: bool = False):
-    """Validate incoming plot payloads for create and update operations."""
-    errors = {}
-    cleaned = {}
-
-    if not is_update and "girl_id" not in data:
-        errors["girl_id"] = "girl_id is required."
+def parse_girl_ids():
+    """Parse the comma-separated ``girl_ids`` query parameter into integers."""
+    girl_ids_str = request.args.get("girl_ids", "")
+    try:
+        return [int(item) for item in girl_ids_str.split(",") if item]
+    except ValueError:
+        abort(400, description="Invalid girl_ids format. Must be comma-separated integers.")
 
-    # Validate scores
-    raw_hot_score = data.get("hot_score")
-    raw_crazy_score = data.get("crazy_score")
 
-    if raw_hot_score is None:
-        if not is_update:
-            errors["hot_score"] = "Hot score is required."
-    else:
-        try:
-            hot_score = float(raw_hot_score)
-        except (TypeError, ValueError):
-            errors["hot_score"] = "Hot score must be a valid number."
-        else:
-            if not 0 <= hot_score <= 10:
-                errors["hot_score"] = "Hot score must be between 0 and 10."
-            else:
-                cleaned["hot_score"] = hot_score
-
-    if raw_crazy_score is None:
-        if not is_update:
-            errors["crazy_score"] = "Crazy score is required."
-    else:
-        try:
-            crazy_score = float(raw_crazy_score)
-        except (TypeError, ValueError):
-            errors["crazy_score"] = "Crazy score must be a valid number."
-        else:
-            if not 4 <= crazy_score <= 10:
-                errors["crazy_score"] = "Crazy score must be between 4 and 10."
-            else:
-                cleaned["crazy_score"] = crazy_score
-
-    # Validate notes length/type
-    if "notes" in data:
-        notes = data["notes"]
-        if notes is None:
-            cleaned["notes"] = None
-        elif not isinstance(notes, str):
-            errors["notes"] = "Notes must be a string."
-        else:
-            trimmed_notes = notes.strip()
-            if len(trimmed_notes) > 500:
-                errors["notes"] = "Notes cannot exceed 500 characters."
-            else:
-                cleaned["notes"] = trimmed_notes
-
-    # Validate date format if provided
-    plot_date_str = data.get("plot_date")
-    if plot_date_str:
-        try:
-            if not re.match(
-                r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}(:\d{2}(\.\d*)?)?(Z|[+-]\d{2}:\d{2})?$",
-                plot_date_str,
-            ):
-                raise ValueError
-            datetime.fromisoformat(plot_date_str.replace("Z", "+00:00"))
-        except (TypeError, ValueError):
-            errors["plot_date"] = "Invalid date format. Please use ISO 8601 format."
+def girl_version(girl_id):
+    """ETag version for a single girl's resources; also the ownership check."""
+    girl = Girl.query.get_or_404(girl_id)
+    if girl.user_id != current_user.id:
+        abort(403)
+    # The session only holds weak references; keeping the girl on ``g`` lets
+    # the view's own get_or_404 hit the identity map instead of the database.
+    g.girl = girl
+    return f"u{current_user.id}.g{girl.id}.{girl.data_version}{ingest.pending_token(current_user.id)}"
 
-    if errors:
-        error_message = "; ".join(f"{field}: {message}" for field, message in errors.items())
-        abort(400, description=error_message)
 
-    return cleaned
+def parse_int_range(name, default, maximum):
+    """Parse an integer query parameter that must lie in ``1..maximum``."""
+    try:
+        value = int(request.args.get(name, default))
+    except ValueError:
+        abort(400, description=f"{name} must be an integer.")
+    if not 1 <= value <= maximum:
+        abort(400, description=f"{name} must be between 1 and {maximum}.")
+    return value
+
+
+def plot_date_window():
+    """The optional ``from`` (inclusive) and ``to`` (exclusive) dates."""
+    return parse_date_param("from"), parse_date_param("to")
+
+
+def plot_date_filters():
+    """Build filters for the optional ``from`` (inclusive) and ``to`` (exclusive) dates."""
+    filters = []
+    date_from, date_to = plot_date_window()
+    if date_from is not None:
+        filters.append(Plot.plot_date >= date_from)
+    if date_to is not None:
+        filters.append(Plot.plot_date < date_to)
+    return filters
+
+
+def serialize_plot(plot):
+    return {
+        "id": plot.id,
+        "x": plot.hot_score,
+        "y": plot.crazy_score,
+        "notes": plot.notes,
+        "date": plot.plot_date.isoformat(),
+    }
 
 
 @bp.route("/")
@@ -96,6 +80,7 @@ def dashboard():
 # --- Girl CRUD ---
 @bp.route("/api/girls", methods=["GET"])
 @login_required
+@versioning.conditional()
 def get_girls():
     girls = Girl.query.filter_by(user_id=current_user.id).order_by(Girl.name).all()
     return jsonify([{"id": girl.id, "name": girl.name} for girl in girls])
@@ -109,9 +94,11 @@ def create_girl():
     if not name or len(name) > 120:
         abort(400, description="Name is required and must be less than 120 characters.")
 
-    girl = Girl(name=name, owner=current_user)
+    girl = Girl(name=name, user_id=current_user.id, stats=GirlStats())
     db.session.add(girl)
+    versioning.bump(current_user.id)
     db.session.commit()
+    events.publish(current_user.id, "girl_created", girl={"id": girl.id, "name": girl.name})
     return jsonify({"id": girl.id, "name": girl.name}), 201
 
 
@@ -128,7 +115,9 @@ def update_girl(girl_id):
         abort(400, description="Name is required and must be less than 120 characters.")
 
     girl.name = name
+    versioning.bump(current_user.id, [girl.id])
     db.session.commit()
+    events.publish(current_user.id, "girl_renamed", girl_id=girl.id, name=girl.name)
     return jsonify({"id": girl.id, "name": girl.name})
 
 
@@ -139,39 +128,146 @@ def delete_girl(girl_id):
     if girl.user_id != current_user.id:
         abort(403)
 
-    db.session.delete(girl)
+    deletion.delete_girl(girl.id)
+    versioning.bump(current_user.id)
     db.session.commit()
+    events.publish(current_user.id, "girl_deleted", girl_id=girl_id)
     return "", 204
 
 
 # --- Plot CRUD ---
 @bp.route("/api/girls/<int:girl_id>/plots", methods=["GET"])
 @login_required
+@versioning.conditional(girl_version)
 def get_plots(girl_id):
+    """List a girl's plots, optionally limited to a ``from``/``to`` window.
+
+    Passing ``limit``, ``after`` or ``before`` switches to keyset pagination
+    and wraps the list in ``{"plots", "next", "prev"}`` with page cursors.
+    ``format=columnar`` returns the whole window as parallel arrays instead
+    (see ``app.columnar``); it can't be combined with pagination.
+    """
     girl = Girl.query.get_or_404(girl_id)
     if girl.user_id != current_user.id:
         abort(403)
 
-    plots = girl.plots.order_by(Plot.plot_date.asc()).all()
+    if columnar.wants_columnar():
+        if pagination.wants_page():
+            abort(400, description="format=columnar does not support limit, after or before.")
+        columns = columnar.plot_columns(girl.id, plot_date_filters())
+        pending = ingest.pending_plots(current_user.id, [girl.id], *plot_date_window())
+        return jsonify(columnar.with_pending(columns, pending.get(girl.id)))
+
+    query = girl.plots.filter(*plot_date_filters())
+    if not pagination.wants_page():
+        plots = query.order_by(Plot.plot_date.asc()).all()
+        pending = ingest.pending_plots(current_user.id, [girl.id], *plot_date_window())
+        return jsonify(
+            [serialize_plot(plot) for plot in plots]
+            + [ingest.serialize_record(record) for record in pending.get(girl.id, ())]
+        )
+
+    plots, next_cursor, prev_cursor = pagination.paginate_plots(query)
+    page_from, page_to = pagination.page_window(plots, next_cursor, prev_cursor)
+    date_from, date_to = plot_date_window()
+    records = [
+        record
+        for record in ingest.pending_plots(current_user.id, [girl.id], date_from, date_to).get(girl.id, ())
+        if (page_from is None or datetime.fromisoformat(record["plot_date"]) >= page_from)
+        and (page_to is None or datetime.fromisoformat(record["plot_date"]) < page_to)
+    ]
+    entries = [(plot.plot_date, 0, serialize_plot(plot)) for plot in plots] + [
+        (datetime.fromisoformat(record["plot_date"]), 1, ingest.serialize_record(record)) for record in records
+    ]
     return jsonify(
-        [
-            {
-                "id": plot.id,
-                "x": plot.hot_score,
-                "y": plot.crazy_score,
-                "notes": plot.notes,
-                "date": plot.plot_date.isoformat(),
-            }
-            for plot in plots
-        ]
+        {
+            "plots": [entry for _, _, entry in sorted(entries, key=itemgetter(0, 1))],
+            "next": next_cursor,
+            "prev": prev_cursor,
+        }
+    )
+
+
+@bp.route("/api/girls/<int:girl_id>/trend", methods=["GET"])
+@login_required
+@versioning.conditional(girl_version)
+def get_trend(girl_id):
+    """Summarize a girl's plot history for charting long time ranges.
+
+    ``mode=buckets`` (default) returns per-``bucket`` (day, week or month)
+    mean/min/max/count of both scores, aggregated in SQL. ``mode=lttb``
+    returns at most ``max_points`` raw plots chosen to keep the shape of the
+    series. Both honour the ``from``/``to`` window.
+    """
+    mode = request.args.get("mode", "buckets")
+    filters = plot_date_filters()
+
+    if mode == "buckets":
+        bucket = request.args.get("bucket", "week")
+        if bucket not in analytics.BUCKETS:
+            abort(400, description="Invalid bucket. Must be one of: " + ", ".join(analytics.BUCKETS))
+        return jsonify({"bucket": bucket, "buckets": analytics.bucketed_scores(girl_id, bucket, filters)})
+
+    if mode == "lttb":
+        try:
+            max_points = int(request.args.get("max_points", 500))
+        except ValueError:
+            abort(400, description="max_points must be an integer.")
+        if max_points < 3:
+            abort(400, description="max_points must be at least 3.")
+        plots, total = analytics.downsampled_plots(girl_id, max_points, filters)
+        return jsonify({"total": total, "plots": [serialize_plot(plot) for plot in plots]})
+
+    abort(400, description="Invalid mode. Must be buckets or lttb.")
+
+
+@bp.route("/api/plots", methods=["GET"])
+@login_required
+@versioning.conditional()
+def get_plots_batch():
+    """Return the plots of several girls at once, grouped by girl id.
+
+    Ownership is enforced by joining against ``Girl`` in the same query, so
+    ids belonging to other users are silently dropped, as in ``get_averages``.
+    Accepts the same ``from``/``to`` window and ``format`` as ``get_plots``.
+    """
+    girl_ids = parse_girl_ids()
+    as_columns = columnar.wants_columnar()
+    if not girl_ids:
+        return jsonify({})
+    pending = ingest.pending_plots(current_user.id, girl_ids, *plot_date_window())
+    if as_columns:
+        by_girl = columnar.plot_columns_by_girl(current_user.id, girl_ids, plot_date_filters())
+        for girl_id, records in pending.items():
+            by_girl[girl_id] = columnar.with_pending(by_girl.get(girl_id) or columnar.to_columns([]), records)
+        return jsonify(by_girl)
+
+    plots = (
+        Plot.query.join(Girl)
+        .filter(Girl.user_id == current_user.id, Plot.girl_id.in_(girl_ids), *plot_date_filters())
+        .order_by(Plot.girl_id, Plot.plot_date.asc())
+        .all()
     )
 
+    grouped = {}
+    for plot in plots:
+        grouped.setdefault(plot.girl_id, []).append(serialize_plot(plot))
+    for girl_id, records in pending.items():
+        grouped.setdefault(girl_id, []).extend(ingest.serialize_record(record) for record in records)
+    return jsonify(grouped)
+
 
 @bp.route("/api/plots", methods=["POST"])
 @login_required
 def create_plot():
+    """Create a plot; ``client_id`` makes retries safe.
+
+    In write-behind mode (``INGEST_WRITE_BEHIND``) the plot is journaled and
+    acknowledged with 202 and no ``id`` yet; see ``app.ingest``.
+    """
     data = request.get_json() or {}
     cleaned = validate_plot_data(data, is_update=False)
+    client_id = ingest.parse_client_id(data.get("client_id"), required=ingest.enabled())
 
     girl = Girl.query.get_or_404(data.get("girl_id"))
     if girl.user_id != current_user.id:
@@ -179,23 +275,69 @@ def create_plot():
 
     plot_date_str = data.get("plot_date")
     plot_date = (
-        datetime.fromisoformat(plot_date_str.replace("Z", "+00:00"))
+        parse_plot_date(plot_date_str)
         if plot_date_str
         else datetime.utcnow()
     )
 
     notes = cleaned.get("notes") if "notes" in cleaned else None
 
-    plot = Plot(
-        girl_id=girl.id,
-        hot_score=cleaned["hot_score"],
-        crazy_score=cleaned["crazy_score"],
-        notes=notes,
-        plot_date=plot_date,
-    )
+    if ingest.enabled():
+        ingest.enqueue(current_user.id, girl.id, dict(cleaned, notes=notes), plot_date, client_id)
+        return jsonify({"id": None, "client_id": client_id, "pending": True}), 202
+
+    if client_id is not None:
+        existing = db.session.execute(
+            select(Plot.id, Girl.user_id).join(Girl).where(Plot.client_id == client_id)
+        ).first()
+        if existing is not None:
+            if existing.user_id != current_user.id:
+                abort(409, description="client_id is already in use.")
+            return jsonify({"id": existing.id, "client_id": client_id})
+
+    values = {
+        "girl_id": girl.id,
+        "hot_score": cleaned["hot_score"],
+        "crazy_score": cleaned["crazy_score"],
+        "notes": notes,
+        "plot_date": plot_date,
+        "client_id": client_id,
+    }
+    rolling.plots_added(girl.id, [values])
+    plot = Plot(**values)
     db.session.add(plot)
+    stats.plot_added(girl.id, (plot.hot_score, plot.crazy_score, plot.plot_date))
+    versioning.bump(current_user.id, [girl.id])
     db.session.commit()
-    return jsonify({"id": plot.id}), 201
+    events.publish(
+        current_user.id, "plot_created",
+        girl_id=girl.id, plot=dict(serialize_plot(plot), client_id=client_id),
+        averages=stats.girl_summary(girl.id),
+    )
+    return jsonify({"id": plot.id, "client_id": client_id}), 201
+
+
+@bp.route("/api/plots/bulk", methods=["POST"])
+@login_required
+def import_plots():
+    """Bulk-insert plots from an NDJSON or CSV request body.
+
+    The format comes from ``?format=`` or, failing that, the Content-Type.
+    Rows that fail validation are listed in the response instead of
+    aborting the whole import.
+    """
+    import_format = request.args.get("format") or (
+        "csv" if request.mimetype == "text/csv" else "ndjson"
+    )
+    if import_format not in dataio.IMPORT_READERS:
+        abort(400, description="Invalid format. Must be one of: " + ", ".join(dataio.IMPORT_READERS))
+
+    records = dataio.read_import(request.stream, import_format)
+    report = dataio.import_plots(current_user.id, records)
+    if report["inserted"]:
+        # Too many points to send one by one; open dashboards reload instead.
+        events.publish(current_user.id, "resync")
+    return jsonify(report)
 
 
 @bp.route("/api/plots/<int:plot_id>", methods=["PUT"])
@@ -207,6 +349,7 @@ def update_plot(plot_id):
 
     data = request.get_json() or {}
     cleaned = validate_plot_data(data, is_update=True)
+    old_point = (plot.hot_score, plot.crazy_score, plot.plot_date)
 
     if "hot_score" in cleaned:
         plot.hot_score = cleaned["hot_score"]
@@ -220,9 +363,16 @@ def update_plot(plot_id):
 
     plot_date_str = data.get("plot_date")
     if plot_date_str:
-        plot.plot_date = datetime.fromisoformat(plot_date_str.replace("Z", "+00:00"))
+        plot.plot_date = parse_plot_date(plot_date_str)
 
+    stats.plot_changed(plot.girl_id, old_point, (plot.hot_score, plot.crazy_score, plot.plot_date))
+    rolling.plot_changed(plot.girl_id, old_point[2], plot.plot_date)
+    versioning.bump(current_user.id, [plot.girl_id])
     db.session.commit()
+    events.publish(
+        current_user.id, "plot_updated",
+        girl_id=plot.girl_id, plot=serialize_plot(plot), averages=stats.girl_summary(plot.girl_id),
+    )
     return jsonify({"id": plot.id})
 
 
@@ -233,48 +383,240 @@ def delete_plot(plot_id):
     if plot.girl.user_id != current_user.id:
         abort(403)
 
+    girl_id = plot.girl_id
     db.session.delete(plot)
+    stats.plot_removed(girl_id, (plot.hot_score, plot.crazy_score, plot.plot_date))
+    rolling.plot_removed(girl_id, plot.plot_date)
+    versioning.bump(current_user.id, [girl_id])
     db.session.commit()
+    events.publish(
+        current_user.id, "plot_deleted",
+        girl_id=girl_id, plot_id=plot_id, averages=stats.girl_summary(girl_id),
+    )
     return "", 204
 
 
 # --- Average Calculation ---
 @bp.route("/api/averages", methods=["GET"])
 @login_required
+@versioning.conditional()
 def get_averages():
-    girl_ids_str = request.args.get("girl_ids", "")
-
-    if not girl_ids_str:
-        return jsonify({})
-    try:
-        girl_ids = [int(item) for item in girl_ids_str.split(",") if item]
-    except ValueError:
-        abort(400, description="Invalid girl_ids format. Must be comma-separated integers.")
-
-    valid_girls = Girl.query.filter(
-        Girl.user_id == current_user.id,
-        Girl.id.in_(girl_ids),
-    ).all()
-    valid_girl_ids = {girl.id for girl in valid_girls}
-    if not valid_girl_ids:
+    girl_ids = parse_girl_ids()
+    if not girl_ids:
         return jsonify({})
 
+    # Averages and variances come from the running sums in girl_stats, so this
+    # is one indexed lookup per girl however long her plot history is.
     results = (
-        db.session.query(
-            Plot.girl_id,
-            func.avg(Plot.hot_score).label("avg_hot"),
-            func.avg(Plot.crazy_score).label("avg_crazy"),
+        db.session.query(GirlStats)
+        .join(Girl)
+        .filter(
+            Girl.user_id == current_user.id,
+            GirlStats.girl_id.in_(girl_ids),
+            GirlStats.plot_count > 0,
         )
-        .filter(Plot.girl_id.in_(valid_girl_ids))
-        .group_by(Plot.girl_id)
         .all()
     )
 
     averages = {
         result.girl_id: {
-            "avg_hot": round(result.avg_hot, 2),
-            "avg_crazy": round(result.avg_crazy, 2),
+            "avg_hot": round(result.hot_sum / result.plot_count, 2),
+            "avg_crazy": round(result.crazy_sum / result.plot_count, 2),
+            "var_hot": round(stats.variance(result.plot_count, result.hot_sum, result.hot_sq_sum), 2),
+            "var_crazy": round(stats.variance(result.plot_count, result.crazy_sum, result.crazy_sq_sum), 2),
+            "count": result.plot_count,
         }
         for result in results
     }
-    return jsonify(averages)
\ No newline at end of file
+    return jsonify(averages)
+
+
+def rolling_version(**view_args):
+    # The "last N days" window moves with the clock, not only with writes.
+    return f"{versioning.user_version()}.{datetime.utcnow():%Y%m%d%H%M}"
+
+
+def _window_average(window, count, avg_hot, avg_crazy):
+    return {
+        "window": window,
+        "count": count,
+        "avg_hot": round(avg_hot, 2) if count else None,
+        "avg_crazy": round(avg_crazy, 2) if count else None,
+    }
+
+
+@bp.route("/api/rolling", methods=["GET"])
+@login_required
+@versioning.conditional(rolling_version)
+def get_rolling():
+    """Recent form of each girl: her EWMA and averages over the last ``plots`` plots and ``days`` days.
+
+    The EWMA is stored (see ``app.rolling``); each window is one bounded
+    range read of the plot index.
+    """
+    girl_ids = parse_girl_ids()
+    window_plots = parse_int_range("plots", 10, current_app.config["ROLLING_MAX_PLOTS"])
+    window_days = parse_int_range("days", 30, 3650)
+    if not girl_ids:
+        return jsonify({})
+
+    summaries = (
+        db.session.query(GirlStats)
+        .join(Girl)
+        .filter(Girl.user_id == current_user.id, GirlStats.girl_id.in_(girl_ids))
+        .all()
+    )
+    if not summaries:
+        return jsonify({})
+    # Whole minutes, matching rolling_version.
+    since = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(days=window_days)
+    by_days = rolling.trailing_days([summary.girl_id for summary in summaries], since)
+
+    metrics = {}
+    for summary in summaries:
+        metrics[summary.girl_id] = {
+            "ewma": None if summary.ewma_plot_date is None else {
+                "hot": round(summary.ewma_hot, 2),
+                "crazy": round(summary.ewma_crazy, 2),
+                "alpha": current_app.config["ROLLING_EWMA_ALPHA"],
+            },
+            "last_plots": _window_average(window_plots, *rolling.trailing_plots(summary.girl_id, window_plots)),
+            "last_days": _window_average(window_days, *by_days.get(summary.girl_id, (0, None, None))),
+        }
+    return jsonify(metrics)
+
+
+# --- Zone Classification ---
+@bp.route("/api/zones", methods=["GET"])
+@login_required
+@versioning.conditional()
+def get_zones():
+    """Classify each girl's average position, from her girl_stats row.
+
+    ``histogram=1`` adds her plot count per zone, counted in SQL; that reads
+    every plot of the selected girls, so the dashboard doesn't ask for it.
+    """
+    girl_ids = parse_girl_ids()
+    if not girl_ids:
+        return jsonify({})
+
+    summaries = (
+        db.session.query(GirlStats)
+        .join(Girl)
+        .filter(
+            Girl.user_id == current_user.id,
+            GirlStats.girl_id.in_(girl_ids),
+            GirlStats.plot_count > 0,
+        )
+        .order_by(GirlStats.girl_id)
+        .all()
+    )
+    if not summaries:
+        return jsonify({})
+
+    owned_ids = [summary.girl_id for summary in summaries]
+    avg_hot = np.array([summary.hot_sum / summary.plot_count for summary in summaries])
+    avg_crazy = np.array([summary.crazy_sum / summary.plot_count for summary in summaries])
+    average_zones = zones.classify(avg_hot, avg_crazy)
+
+    result = {}
+    for index, girl_id in enumerate(owned_ids):
+        zone = zones.zone_for(average_zones[index])
+        result[girl_id] = {
+            "avg_hot": round(float(avg_hot[index]), 2),
+            "avg_crazy": round(float(avg_crazy[index]), 2),
+            "zone": zone.key if zone else None,
+            "label": zone.label if zone else None,
+        }
+
+    if request.args.get("histogram") == "1":
+        for girl_id in owned_ids:
+            result[girl_id]["histogram"] = {zone_def.key: 0 for zone_def in zones.ZONES}
+        zone = zones.sql_classify(Plot.hot_score, Plot.crazy_score).label("zone")
+        for girl_id, zone_index, count in db.session.execute(
+            select(Plot.girl_id, zone, func.count())
+            .where(Plot.girl_id.in_(owned_ids))
+            .group_by(Plot.girl_id, zone)
+        ):
+            if zone_index != zones.UNCLASSIFIED:
+                result[girl_id]["histogram"][zones.ZONES[zone_index].key] = count
+    return jsonify(result)
+
+
+# --- Density heatmap ---
+def parse_bins(name, default):
+    return parse_int_range(name, default, heatmap.MAX_BINS)
+
+
+@bp.route("/api/heatmap", methods=["GET"])
+@login_required
+@versioning.conditional()
+def get_heatmap():
+    """Bin the user's plots into a ``hot_bins`` x ``crazy_bins`` grid.
+
+    ``counts[i][j]`` is the number of plots in crazy row ``i`` (lowest
+    first) and hot column ``j``; ``zones`` counts the same plots per zone.
+    Limited to ``girl_ids`` when given, and to the ``from``/``to`` window.
+    """
+    girl_ids = parse_girl_ids()
+    hot_bins = parse_bins("hot_bins", 20)
+    crazy_bins = parse_bins("crazy_bins", 12)
+    return jsonify(
+        heatmap.cached_heatmap(
+            g.etag_version,
+            current_user.id,
+            girl_ids,
+            hot_bins,
+            crazy_bins,
+            filters=plot_date_filters(),
+            filter_key=(request.args.get("from"), request.args.get("to")),
+        )
+    )
+
+
+# --- Search ---
+@bp.route("/api/search", methods=["GET"])
+@login_required
+@versioning.conditional()
+def search_notes():
+    """Search the notes of all the user's plots, best matches first.
+
+    ``q`` holds the terms (all must match; ``term*`` matches a prefix).
+    Each result carries ``highlight``, the HTML-escaped note with matches
+    wrapped in ``<mark>``. Pass ``next`` back as ``after`` for more.
+    ``sort=newest`` orders by plot instead of relevance, which pages exactly
+    even while plots are written (see ``app.search``).
+    """
+    results, next_cursor = search.search_plots(
+        current_user.id, request.args.get("q"), pagination.page_limit(), request.args.get("after"),
+        request.args.get("sort", "relevance"),
+    )
+    return jsonify({"results": results, "next": next_cursor})
+
+
+# --- Live updates ---
+@bp.route("/api/stream", methods=["GET"])
+@login_required
+def stream_updates():
+    """Server-Sent Events carrying the user's changes as small JSON deltas."""
+    user_id = current_user.id
+    # The stream stays open for minutes; don't hold a pooled connection meanwhile.
+    db.session.close()
+    return events.stream_response(user_id)
+
+
+# --- Export ---
+@bp.route("/api/export", methods=["GET"])
+@login_required
+def export_data():
+    """Stream every girl and plot of the current user as NDJSON or CSV."""
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in dataio.EXPORT_FORMATS:
+        abort(400, description="Invalid format. Must be one of: " + ", ".join(dataio.EXPORT_FORMATS))
+
+    body = dataio.iter_export(current_user.id, export_format)
+    return Response(
+        stream_with_context(body),
+        mimetype=dataio.EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f"attachment; filename=hot-crazy-matrix.{export_format}"},
+    )
@@ -0,0 +1,196 @@
+"""Full-text search over plot notes.
+
+On SQLite, ``plot_fts`` (an FTS5 table kept in sync with ``plot`` by
+triggers) answers the query: every match is restricted to the user's own
+``owner`` token inside the index, ranked with bm25 and highlighted by FTS5,
+so the cost grows with the user's matching notes, not the whole table.
+Other databases fall back to an ``ILIKE`` per term, newest first.
+
+Results are paged with a keyset cursor over ``(score, plot id)``. bm25
+depends on statistics of the whole index, so any user's writes move every
+score between two page requests. The next page therefore starts from the
+cursor plot's current score (the one in the cursor only if that plot no
+longer matches). This keeps pages in step when scores shift together, but
+relevance paging stays best-effort: matches whose order flips meanwhile
+may be repeated or skipped. ``sort=newest`` pages by plot id, which never
+moves.
+"""
+import base64
+import binascii
+import re
+
+from flask import abort
+from markupsafe import escape
+from sqlalchemy import and_, column, func, literal_column, or_, select, table
+
+from app import db
+from app.models import Girl, Plot
+
+
+MAX_QUERY_LENGTH = 200
+MAX_TERMS = 10
+SORTS = ("relevance", "newest")
+
+# Private-use characters mark highlights inside the raw note, so the note
+# can be HTML-escaped before they are turned into <mark> tags.
+_MARK_START = "\ue000"
+_MARK_END = "\ue001"
+
+plot_fts = table("plot_fts", column("rowid"), column("notes"))
+_fts = literal_column("plot_fts")
+
+# The index and its triggers, as created by migration d7a3b9e2c410, which
+# owns the DDL; shard databases (see app.sharding) get them from here.
+# `flask check fts-schema` fails when the two drift apart.
+FTS_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS plot_fts USING fts5("
+    "notes, owner, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    """
+    CREATE TRIGGER IF NOT EXISTS plot_fts_after_insert AFTER INSERT ON plot
+    WHEN new.notes IS NOT NULL AND new.notes != ''
+    BEGIN
+        INSERT INTO plot_fts (rowid, notes, owner)
+        SELECT new.id, new.notes, 'u' || girl.user_id FROM girl WHERE girl.id = new.girl_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS plot_fts_after_delete AFTER DELETE ON plot
+    BEGIN
+        DELETE FROM plot_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS plot_fts_after_update AFTER UPDATE OF notes, girl_id ON plot
+    BEGIN
+        DELETE FROM plot_fts WHERE rowid = old.id;
+        INSERT INTO plot_fts (rowid, notes, owner)
+        SELECT new.id, new.notes, 'u' || girl.user_id FROM girl
+        WHERE girl.id = new.girl_id AND new.notes IS NOT NULL AND new.notes != '';
+    END
+    """,
+]
+
+
+def parse_terms(query):
+    """Split a user query into terms; a trailing ``*`` makes a prefix search."""
+    query = (query or "").strip()
+    if not query:
+        abort(400, description="q is required.")
+    if len(query) > MAX_QUERY_LENGTH:
+        abort(400, description=f"q must be at most {MAX_QUERY_LENGTH} characters.")
+    terms = [term for term in query.split() if term.strip("*")]
+    if not terms:
+        abort(400, description="q must contain a search term.")
+    if len(terms) > MAX_TERMS:
+        abort(400, description=f"q may contain at most {MAX_TERMS} terms.")
+    return terms
+
+
+def fts_query(user_id, terms):
+    """Build an FTS5 MATCH expression; every term is quoted, so none is syntax."""
+    phrases = []
+    for term in terms:
+        prefix = term.endswith("*")
+        phrase = '"' + term.rstrip("*").replace('"', '""') + '"'
+        phrases.append(phrase + "*" if prefix else phrase)
+    return f"owner:u{int(user_id)} AND notes:({' '.join(phrases)})"
+
+
+def encode_cursor(score, plot_id):
+    # float.hex round-trips exactly, unlike a decimal repr.
+    raw = f"{float(score).hex()}|{plot_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        score, plot_id = raw.rsplit("|", 1)
+        return float.fromhex(score), int(plot_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        abort(400, description="Invalid search cursor.")
+
+
+def render_highlight(marked):
+    """HTML-escape a note and wrap the marked matches in ``<mark>``."""
+    return str(escape(marked)).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def _mark_terms(notes, terms):
+    pattern = "|".join(re.escape(term.rstrip("*")) for term in terms)
+    return re.sub(f"({pattern})", f"{_MARK_START}\\1{_MARK_END}", notes, flags=re.IGNORECASE)
+
+
+def _fts_statement(user_id, terms, sort):
+    # bm25 is lower for better matches; the owner column gets no weight.
+    score = (func.bm25(_fts, 1.0, 0.0) if sort == "relevance" else -Plot.id).label("score")
+    statement = (
+        select(
+            Plot.id, Plot.girl_id, Girl.name, Plot.hot_score, Plot.crazy_score, Plot.plot_date,
+            func.highlight(_fts, 0, _MARK_START, _MARK_END), score,
+        )
+        .select_from(plot_fts)
+        .join(Plot, Plot.id == plot_fts.c.rowid)
+        .join(Girl, Girl.id == Plot.girl_id)
+        .where(_fts.op("MATCH")(fts_query(user_id, terms)), Girl.user_id == user_id)
+    )
+    return statement, score
+
+
+def _like_pattern(term):
+    literal = term.rstrip("*").replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{literal}%"
+
+
+def _like_statement(user_id, terms, sort):
+    # No relevance score: newest first either way, expressed as an ascending key.
+    score = (-Plot.id).label("score")
+    statement = (
+        select(
+            Plot.id, Plot.girl_id, Girl.name, Plot.hot_score, Plot.crazy_score, Plot.plot_date,
+            Plot.notes, score,
+        )
+        .join(Girl, Girl.id == Plot.girl_id)
+        .where(Girl.user_id == user_id, *[Plot.notes.ilike(_like_pattern(term), escape="\\") for term in terms])
+    )
+    return statement, score
+
+
+def search_plots(user_id, query, limit, after=None, sort="relevance"):
+    """Return ``(results, next_cursor)`` for a user's notes matching ``query``."""
+    terms = parse_terms(query)
+    if sort not in SORTS:
+        abort(400, description="sort must be one of: " + ", ".join(SORTS))
+    use_fts = db.engine.dialect.name == "sqlite"
+    statement, score = (_fts_statement if use_fts else _like_statement)(user_id, terms, sort)
+
+    if after is not None:
+        after_score, after_id = decode_cursor(after)
+        current = db.session.scalar(
+            statement.with_only_columns(score).where(Plot.id == after_id)
+        )
+        if current is not None:
+            after_score = current
+        statement = statement.where(
+            or_(score > after_score, and_(score == after_score, Plot.id > after_id))
+        )
+    rows = db.session.execute(statement.order_by(score, Plot.id).limit(limit + 1)).all()
+
+    results = [
+        {
+            "plot_id": row[0],
+            "girl_id": row[1],
+            "girl_name": row[2],
+            "x": row[3],
+            "y": row[4],
+            "date": row[5].isoformat(),
+            "highlight": render_highlight(row[6] if use_fts else _mark_terms(row[6], terms)),
+            "score": row[7],
+        }
+        for row in rows[:limit]
+    ]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last[7], last[0])
+    return results, next_cursor
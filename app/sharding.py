@@ -0,0 +1,510 @@
+"""Optional per-user sharding of girls and plots (``SHARD_COUNT`` > 0).
+
+The main database becomes a small catalog of users. Each user's girls,
+plots, summaries and data version live in one of ``SHARD_COUNT`` databases
+(``SHARD_URL_TEMPLATE``): the one in ``user.shard_id``, which is set at
+sign-up from a stable hash of the user id and changed only by moving the
+user. Every shard is its own SQLite file with its own write lock, so writes
+of users on different shards don't queue behind each other, and shards are
+vacuumed and backed up independently.
+
+``database.RoutingSession`` sits behind ``db.session``: statements on a
+sharded table go to the shard selected in ``g.shard``, everything else to
+the catalog. Requests select their user's shard before the view runs;
+background jobs and commands use ``use_shard``/``use_user_shard``.
+The user's ``data_version`` lives in the shard too (``user_data_version``),
+so a write never has to lock the catalog.
+
+Shards aren't managed by Alembic: ``flask shards init`` creates their tables
+from the models (minus the foreign key to ``user``, which lives in another
+file) plus the full-text index, and adds columns the models gained since.
+``import-catalog`` moves data written before sharding was switched on.
+
+``flask shards move`` and ``rebalance`` move users between shards. While a
+user's rows are copied their ``user_data_version`` row on the old shard is
+marked ``moving`` and their write requests get a 503. The check that
+nothing changed during the copy and the delete of the old rows happen in
+one transaction, which leaves a ``moved_to`` tombstone behind. Requests
+read that row before the view runs, so a worker whose identity cache still
+has the old ``shard_id`` follows the tombstone, and a write that slipped
+past the check fails when it bumps the version. Moved rows get new ids on
+their new shard; ``moved_girl`` maps the old girl ids so journaled plots
+(see ``app.ingest``) still find their girl, and the user's open dashboards
+are told to reload.
+"""
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+import zlib
+
+from flask import current_app, g, request
+from flask_login import current_user
+from sqlalchemy import Boolean, Column, Integer, MetaData, Table, delete, func, insert, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.schema import CreateColumn
+from werkzeug.exceptions import ServiceUnavailable
+
+from app import db, events, identity, search
+from app.database import shard_bind_key
+from app.models import Girl, GirlStats, Plot, User
+
+
+COPY_BATCH_SIZE = 5000
+MOVE_ATTEMPTS = 3
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+shard_metadata = MetaData()
+user_data_version = Table(
+    "user_data_version",
+    shard_metadata,
+    Column("user_id", Integer, primary_key=True),
+    Column("data_version", Integer, nullable=False, server_default="0"),
+    # Set while the user's rows are being copied to another shard.
+    Column("moving", Boolean),
+    # Set once they live on that shard; the user has no other rows here.
+    Column("moved_to", Integer),
+)
+moved_girls = Table(
+    "moved_girl",
+    shard_metadata,
+    Column("girl_id", Integer, primary_key=True),
+    Column("user_id", Integer, nullable=False, index=True),
+    Column("new_girl_id", Integer, nullable=False),
+)
+
+
+class UserMoving(ServiceUnavailable):
+    description = "Your data is being moved to another server. Please try again in a moment."
+
+
+def _shard_table(model):
+    """Copy a model's table into the shard schema, minus foreign keys to ``user``."""
+    table = model.__table__.to_metadata(shard_metadata)
+    for constraint in list(table.foreign_key_constraints):
+        if constraint.elements[0].target_fullname.startswith("user."):
+            for element in constraint.elements:
+                element.parent.foreign_keys.discard(element)
+                table.foreign_keys.discard(element)
+            table.constraints.discard(constraint)
+    return table
+
+
+girls, girl_stats, plots = (_shard_table(model) for model in (Girl, GirlStats, Plot))
+
+
+def configure_binds(app):
+    """Add one bind per shard to ``SQLALCHEMY_BINDS``; call before ``db.init_app``."""
+    binds = app.config.setdefault("SQLALCHEMY_BINDS", {})
+    for shard in range(app.config.get("SHARD_COUNT") or 0):
+        binds.setdefault(shard_bind_key(shard), app.config["SHARD_URL_TEMPLATE"].format(shard))
+
+
+def enabled():
+    return bool(current_app.config.get("SHARD_COUNT"))
+
+
+def _engine(shard):
+    return db.engines[shard_bind_key(shard)]
+
+
+def home_shard(user_id):
+    """Where a new user is placed: a hash of the id that is the same in every process."""
+    return zlib.crc32(str(user_id).encode()) % current_app.config["SHARD_COUNT"]
+
+
+def shard_for(user):
+    return user.shard_id if user.shard_id is not None else home_shard(user.id)
+
+
+def shard_of(user_id):
+    """Look up a user's shard in the catalog."""
+    shard_id = db.session.scalar(select(User.shard_id).where(User.id == user_id))
+    return shard_id if shard_id is not None else home_shard(user_id)
+
+
+@contextmanager
+def use_shard(shard):
+    """Route sharded tables to ``shard`` inside the block."""
+    previous = g.get("shard")
+    g.shard = shard
+    try:
+        yield
+    finally:
+        g.shard = previous
+
+
+def use_user_shard(user_id):
+    """Select ``user_id``'s shard for the block; does nothing when sharding is off."""
+    return use_shard(shard_of(user_id)) if enabled() else nullcontext()
+
+
+def each_shard():
+    """Iterate once per shard with it selected, or once with none when sharding is off."""
+    if not enabled():
+        yield None
+        return
+    for shard in range(current_app.config["SHARD_COUNT"]):
+        with use_shard(shard):
+            yield shard
+
+
+def group_by_shard(items, user_id_of):
+    """Split ``items`` into ``{shard: [item, ...]}`` by their user's shard."""
+    if not enabled():
+        return {None: list(items)}
+    shards = {}
+    groups = defaultdict(list)
+    for item in items:
+        user_id = user_id_of(item)
+        if user_id not in shards:
+            shards[user_id] = shard_of(user_id)
+        groups[shards[user_id]].append(item)
+    return dict(groups)
+
+
+def _upsert_version(dialect, values, changes):
+    statement = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}[dialect](user_data_version)
+    return statement.values(values).on_conflict_do_update(index_elements=["user_id"], set_=changes)
+
+
+def bump_user_version(user_id):
+    """Increment the user's data version in the selected shard.
+
+    Raises ``UserMoving`` if the user has moved to another shard since the
+    request selected this one, which rolls the write back.
+    """
+    dialect = db.session.get_bind(clause=user_data_version).dialect.name
+    moved_to = db.session.execute(
+        _upsert_version(
+            dialect, {"user_id": user_id, "data_version": 1}, {"data_version": user_data_version.c.data_version + 1}
+        ).returning(user_data_version.c.moved_to)
+    ).scalar()
+    if moved_to is not None:
+        raise UserMoving(retry_after=1)
+
+
+def read_user_version(user_id):
+    version = db.session.scalar(
+        select(user_data_version.c.data_version).where(user_data_version.c.user_id == user_id)
+    )
+    return version or 0
+
+
+def locate(user):
+    """The shard holding ``user``'s rows, and whether they are being moved.
+
+    ``user.shard_id`` may come from an identity cache that predates a move,
+    so the shard's ``user_data_version`` row is checked and a ``moved_to``
+    tombstone followed (dropping the stale cache entry on the way).
+    """
+    shard = shard_for(user)
+    for _ in range(current_app.config["SHARD_COUNT"]):
+        with use_shard(shard):
+            state = db.session.execute(
+                select(user_data_version.c.moving, user_data_version.c.moved_to)
+                .where(user_data_version.c.user_id == user.id)
+            ).first()
+        if state is None or state.moved_to is None:
+            return shard, bool(state and state.moving)
+        identity.invalidate(user.id)
+        shard = state.moved_to
+    return shard_of(user.id), False
+
+
+def group_journaled(records):
+    """Split journaled plots into ``{shard: [record, ...]}``, following moves.
+
+    A record names the shard its ``girl_id`` belongs to (older ones don't,
+    and go to their user's current shard). If the user has moved away from
+    it since, the record is sent on with the girl's id on the new shard;
+    plots of girls that weren't moved lose their girl and are dropped.
+    """
+    if not enabled():
+        return {None: list(records)}
+    waiting = defaultdict(list)
+    for record in records:
+        shard = record.get("shard")
+        waiting[shard if shard is not None else shard_of(record["user_id"])].append(record)
+    groups = defaultdict(list)
+    for _ in range(current_app.config["SHARD_COUNT"]):
+        forwarded = defaultdict(list)
+        for shard, shard_records in waiting.items():
+            with use_shard(shard):
+                moves = dict(
+                    db.session.execute(
+                        select(user_data_version.c.user_id, user_data_version.c.moved_to).where(
+                            user_data_version.c.user_id.in_(list({record["user_id"] for record in shard_records})),
+                            user_data_version.c.moved_to.is_not(None),
+                        )
+                    ).all()
+                )
+                new_ids = dict(
+                    db.session.execute(
+                        select(moved_girls.c.girl_id, moved_girls.c.new_girl_id).where(
+                            moved_girls.c.girl_id.in_(
+                                list({record["girl_id"] for record in shard_records if record["user_id"] in moves})
+                            )
+                        )
+                    ).all()
+                ) if moves else {}
+            for record in shard_records:
+                target = moves.get(record["user_id"])
+                if target is None:
+                    groups[shard].append(record)
+                else:
+                    forwarded[target].append(dict(record, shard=target, girl_id=new_ids.get(record["girl_id"])))
+        waiting = forwarded
+        if not waiting:
+            break
+    for shard, shard_records in waiting.items():
+        groups[shard].extend(shard_records)
+    return dict(groups)
+
+
+def create_schema(engine):
+    """Create the shard tables and, on SQLite, the full-text index; idempotent.
+
+    Columns the models gained since a shard was created are added to it
+    (they must be nullable); anything else needs a hand-written change.
+    """
+    shard_metadata.create_all(engine)
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in shard_metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    definition = CreateColumn(column).compile(dialect=engine.dialect)
+                    connection.exec_driver_sql(
+                        f"ALTER TABLE {engine.dialect.identifier_preparer.format_table(table)} ADD COLUMN {definition}"
+                    )
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as connection:
+            for statement in search.FTS_SCHEMA:
+                connection.exec_driver_sql(statement)
+
+
+def _copy_rows(source, target, user_id):
+    """Copy a user's girls, summaries and plots; the target assigns new ids.
+
+    Returns ``({old_girl_id: new_girl_id}, plots_copied)``.
+    """
+    girl_ids = {}
+    for row in source.execute(select(girls).where(girls.c.user_id == user_id)).mappings().all():
+        values = dict(row)
+        old_id = values.pop("id")
+        girl_ids[old_id] = target.execute(insert(girls).values(values)).inserted_primary_key[0]
+    if not girl_ids:
+        return girl_ids, 0
+
+    summaries = source.execute(select(girl_stats).where(girl_stats.c.girl_id.in_(list(girl_ids)))).mappings().all()
+    if summaries:
+        target.execute(insert(girl_stats), [dict(row, girl_id=girl_ids[row["girl_id"]]) for row in summaries])
+
+    copied = 0
+    last_id = 0
+    while True:
+        rows = source.execute(
+            select(plots)
+            .where(plots.c.girl_id.in_(list(girl_ids)), plots.c.id > last_id)
+            .order_by(plots.c.id)
+            .limit(COPY_BATCH_SIZE)
+        ).mappings().all()
+        if not rows:
+            return girl_ids, copied
+        last_id = rows[-1]["id"]
+        target.execute(
+            insert(plots),
+            [
+                {key: value for key, value in row.items() if key != "id"} | {"girl_id": girl_ids[row["girl_id"]]}
+                for row in rows
+            ],
+        )
+        copied += len(rows)
+
+
+def _delete_rows(connection, user_id, with_version=True):
+    girl_ids = select(girls.c.id).where(girls.c.user_id == user_id)
+    connection.execute(delete(plots).where(plots.c.girl_id.in_(girl_ids)))
+    connection.execute(delete(girl_stats).where(girl_stats.c.girl_id.in_(girl_ids)))
+    connection.execute(delete(girls).where(girls.c.user_id == user_id))
+    if with_version:
+        connection.execute(delete(moved_girls).where(moved_girls.c.user_id == user_id))
+        connection.execute(delete(user_data_version).where(user_data_version.c.user_id == user_id))
+
+
+class _UserWroteMeanwhile(Exception):
+    pass
+
+
+def _set_moving(engine, user_id, moving):
+    """Mark the user as moving (blocking their write requests) or clear the mark."""
+    with engine.begin() as connection:
+        if moving:
+            connection.execute(
+                _upsert_version(engine.dialect.name, {"user_id": user_id, "moving": True}, {"moving": True})
+            )
+        else:
+            connection.execute(
+                update(user_data_version)
+                .where(user_data_version.c.user_id == user_id, user_data_version.c.moved_to.is_(None))
+                .values(moving=None)
+            )
+
+
+def _retire(engine, user_id, version, target, girl_ids):
+    """Leave a tombstone and delete the user's rows, unless they wrote since ``version``.
+
+    The conditional update is the transaction's first statement, so it also
+    takes the shard's write lock before anything is deleted.
+    """
+    with engine.begin() as connection:
+        retired = connection.execute(
+            update(user_data_version)
+            .where(
+                user_data_version.c.user_id == user_id,
+                user_data_version.c.data_version == version,
+                user_data_version.c.moving.is_(True),
+            )
+            .values(moving=None, moved_to=target)
+        ).rowcount
+        if retired != 1:
+            raise _UserWroteMeanwhile
+        if girl_ids:
+            connection.execute(delete(moved_girls).where(moved_girls.c.girl_id.in_(list(girl_ids))))
+            connection.execute(
+                insert(moved_girls),
+                [{"girl_id": old, "user_id": user_id, "new_girl_id": new} for old, new in girl_ids.items()],
+            )
+        _delete_rows(connection, user_id, with_version=False)
+
+
+def _pin(user_id, shard):
+    db.session.execute(update(User).where(User.id == user_id).values(shard_id=shard))
+    db.session.commit()
+    identity.invalidate(user_id)
+
+
+def move_user(user_id, target):
+    """Move a user's rows to shard ``target``; returns the plots moved, or ``None`` if already there.
+
+    The user's write requests are refused while the rows are copied. Writes
+    that were already under way still commit; if the data version changed
+    by the end of the copy, it is thrown away and retried. Rerun an
+    interrupted move to finish it.
+    """
+    source = shard_of(user_id)
+    db.session.rollback()
+    source_engine, target_engine = _engine(source), _engine(target)
+    with source_engine.connect() as connection:
+        moved_to = connection.scalar(
+            select(user_data_version.c.moved_to).where(user_data_version.c.user_id == user_id)
+        )
+    if moved_to is not None:
+        # Interrupted after the rows were moved; the catalog wasn't updated yet.
+        _pin(user_id, moved_to)
+        return move_user(user_id, target)
+    if source == target:
+        return None
+
+    _set_moving(source_engine, user_id, True)
+    try:
+        for _ in range(MOVE_ATTEMPTS):
+            with source_engine.connect() as reader, target_engine.begin() as writer:
+                # Leftovers of an interrupted earlier attempt, if any.
+                _delete_rows(writer, user_id)
+                version = reader.scalar(
+                    select(user_data_version.c.data_version).where(user_data_version.c.user_id == user_id)
+                )
+                girl_ids, copied = _copy_rows(reader, writer, user_id)
+                writer.execute(insert(user_data_version).values(user_id=user_id, data_version=version + 1))
+            try:
+                _retire(source_engine, user_id, version, target, girl_ids)
+            except _UserWroteMeanwhile:
+                continue
+            break
+        else:
+            with target_engine.begin() as writer:
+                _delete_rows(writer, user_id)
+            raise RuntimeError(f"User {user_id} kept writing during {MOVE_ATTEMPTS} attempts to move them.")
+    finally:
+        _set_moving(source_engine, user_id, False)
+
+    _pin(user_id, target)
+    # Ids changed; open dashboards reload everything.
+    events.publish(user_id, "resync")
+    return copied
+
+
+def import_from_catalog(user_id):
+    """Move rows written to the catalog before sharding was on into the user's shard.
+
+    Run before serving traffic with sharding on. Returns the plots moved.
+    """
+    target = shard_of(user_id)
+    version = db.session.scalar(select(User.data_version).where(User.id == user_id)) or 0
+    db.session.rollback()
+    catalog = db.engines[None]
+    with catalog.connect() as reader, _engine(target).begin() as writer:
+        _delete_rows(writer, user_id)
+        _, copied = _copy_rows(reader, writer, user_id)
+        writer.execute(insert(user_data_version).values(user_id=user_id, data_version=version + 1))
+    _pin(user_id, target)
+    with catalog.begin() as connection:
+        _delete_rows(connection, user_id, with_version=False)
+    return copied
+
+
+def shard_loads():
+    """Plots per user on every shard: ``{shard: {user_id: plot_count}}``."""
+    loads = {}
+    for shard in each_shard():
+        loads[shard] = dict(
+            db.session.execute(
+                select(Girl.user_id, func.coalesce(func.sum(GirlStats.plot_count), 0))
+                .join(GirlStats, GirlStats.girl_id == Girl.id)
+                .group_by(Girl.user_id)
+            ).all()
+        )
+    db.session.rollback()
+    return loads
+
+
+def plan_rebalance(loads, tolerance):
+    """Moves ``[(user_id, from_shard, to_shard, plots)]`` that even out plot counts.
+
+    Repeatedly moves the user from the fullest to the emptiest shard that
+    best halves the gap between them, until every shard is within
+    ``tolerance`` (a fraction of the mean) of the others.
+    """
+    loads = {shard: dict(users) for shard, users in loads.items()}
+    totals = {shard: sum(users.values()) for shard, users in loads.items()}
+    mean = sum(totals.values()) / len(totals)
+    moves = []
+    while True:
+        heavy = max(totals, key=totals.get)
+        light = min(totals, key=totals.get)
+        gap = totals[heavy] - totals[light]
+        if gap <= tolerance * mean:
+            return moves
+        # Moving p plots changes the gap to |gap - 2p|; only 0 < p < gap narrows it.
+        candidates = [(abs(gap - 2 * count), user_id) for user_id, count in loads[heavy].items() if 0 < count < gap]
+        if not candidates:
+            return moves
+        _, user_id = min(candidates)
+        count = loads[heavy].pop(user_id)
+        loads[light][user_id] = count
+        totals[heavy] -= count
+        totals[light] += count
+        moves.append((user_id, heavy, light, count))
+
+
+def init_app(app):
+    if not app.config.get("SHARD_COUNT"):
+        return
+
+    @app.before_request
+    def select_user_shard():
+        if current_user.is_authenticated:
+            g.shard, moving = locate(current_user)
+            if moving and request.method not in SAFE_METHODS:
+                raise UserMoving(retry_after=5)
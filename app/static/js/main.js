@@ -3,6 +3,11 @@ document.addEventListener('DOMContentLoaded', () => {
     let chart;
     const colors = ['#36A2EB', '#FF6384', '#FFCE56', '#4BC0C0', '#9966FF', '#FF9F40'];
     let preloadedImages = {}; // Will store { light: Image, dark: Image }
+    const HISTORY_WINDOW_DAYS = 90;
+    // Start of the loaded time window; null once the full history has been fetched.
+    let historyStart = new Date(Date.now() - HISTORY_WINDOW_DAYS * 24 * 60 * 60 * 1000);
+    let zonesByGirl = {}; // Last /api/zones result, patched by live updates
+    let liveUpdates = false; // True while /api/stream is connected
 
     // --- DOM ELEMENT SELECTORS ---
     const htmlEl = document.documentElement;
@@ -33,6 +38,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const editPlotDateInput = document.getElementById('edit-plot-date');
     const editPlotNotesInput = document.getElementById('edit-plot-notes');
     const deletePlotBtn = document.getElementById('delete-plot-btn');
+    const loadHistoryBtn = document.getElementById('load-history-btn');
+    const heatmapToggle = document.getElementById('heatmap-toggle');
     const themeToggler = document.getElementById('theme-toggler');
     const lightIcon = document.getElementById('theme-light-icon');
     const darkIcon = document.getElementById('theme-dark-icon');
@@ -113,6 +120,10 @@ document.addEventListener('DOMContentLoaded', () => {
         return;
     }
 
+    // GET responses keyed by URL, revalidated with If-None-Match so unchanged
+    // data comes back as an empty 304 instead of being re-queried and re-sent.
+    const etagCache = new Map();
+
     async function apiRequest(url, method = 'GET', body = null) {
         const csrfToken = document.querySelector('meta[name="csrf-token"]').getAttribute('content');
         const options = {
@@ -124,15 +135,32 @@ document.addEventListener('DOMContentLoaded', () => {
         };
         if (body) options.body = JSON.stringify(body);
 
+        const cached = method === 'GET' ? etagCache.get(url) : null;
+        if (cached) {
+            options.headers['If-None-Match'] = cached.etag;
+            options.cache = 'no-store';
+        }
+
         const response = await fetch(url, options);
 
+        if (response.status === 304 && cached) {
+            return cached.data;
+        }
         if (!response.ok) {
             const errorData = await response.json().catch(() => ({
                 message: `Request failed with status: ${response.status}`
             }));
             throw new Error(errorData.message || response.statusText);
         }
-        return response.status === 204 ? null : response.json();
+        if (response.status === 204) {
+            return null;
+        }
+        const data = await response.json();
+        const etag = response.headers.get('ETag');
+        if (method === 'GET' && etag) {
+            etagCache.set(url, { etag, data });
+        }
+        return data;
     }
 
     // **** Image Inversion and Preloading Logic ****
@@ -153,14 +181,22 @@ document.addEventListener('DOMContentLoaded', () => {
         return invertedImage;
     }
 
+    function loadImage(url) {
+        return new Promise((resolve) => {
+            const img = new Image();
+            img.onload = () => resolve(img);
+            img.onerror = () => resolve(null);
+            img.src = url;
+        });
+    }
+
+    // imageUrls maps each zone to { light, dark } URLs; dark is null when the
+    // server has no pre-inverted copy, in which case it is inverted here.
     function preloadAllImages(imageUrls) {
-        const promises = Object.entries(imageUrls).map(([name, url]) => {
-            return new Promise((resolve) => {
-                const img = new Image();
-                img.onload = () => { const invertedImg = invertImage(img); resolve({ name, light: img, dark: invertedImg }); };
-                img.onerror = () => { console.warn(`Failed to load image: ${name}.`); resolve({ name, light: null, dark: null }); };
-                img.src = url;
-            });
+        const promises = Object.entries(imageUrls).map(async ([name, urls]) => {
+            const [light, prebuiltDark] = await Promise.all([loadImage(urls.light), urls.dark ? loadImage(urls.dark) : null]);
+            if (!light) { console.warn(`Failed to load image: ${name}.`); return { name, light: null, dark: null }; }
+            return { name, light, dark: prebuiltDark || invertImage(light) };
         });
         return Promise.all(promises).then(results => results.reduce((acc, { name, light, dark }) => { acc[name] = { light, dark }; return acc; }, {}));
     }
@@ -219,6 +255,33 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     };
 
+    // --- DENSITY HEATMAP PLUGIN ---
+    // Paints the binned counts from /api/heatmap over the zones; cell opacity
+    // grows with the square root of the count so sparse cells stay visible.
+    const heatmapPainter = {
+        id: 'heatmapPainter',
+        beforeDatasetsDraw(chart, args, options) {
+            const grid = options.grid;
+            if (!grid || !grid.max) { return; }
+            const { ctx, scales: { x, y } } = chart;
+            const hotStep = (grid.hot.max - grid.hot.min) / grid.hot.bins;
+            const crazyStep = (grid.crazy.max - grid.crazy.min) / grid.crazy.bins;
+            ctx.save();
+            grid.counts.forEach((row, i) => {
+                row.forEach((count, j) => {
+                    if (!count) { return; }
+                    const left = x.getPixelForValue(grid.hot.min + j * hotStep);
+                    const right = x.getPixelForValue(grid.hot.min + (j + 1) * hotStep);
+                    const top = y.getPixelForValue(grid.crazy.min + (i + 1) * crazyStep);
+                    const bottom = y.getPixelForValue(grid.crazy.min + i * crazyStep);
+                    ctx.fillStyle = `rgba(220, 20, 60, ${(0.15 + 0.8 * Math.sqrt(count / grid.max)).toFixed(3)})`;
+                    ctx.fillRect(left, top, right - left, bottom - top);
+                });
+            });
+            ctx.restore();
+        }
+    };
+
     // --- CHART THEME & INITIALIZATION ---
     function getThemeOptions() {
         const isDarkMode = document.documentElement.getAttribute('data-bs-theme') === 'dark';
@@ -314,9 +377,9 @@ document.addEventListener('DOMContentLoaded', () => {
         const themeOptions = getThemeOptions();
         const ctx = chartCanvas.getContext('2d');
         chart = new Chart(ctx, {
-            type: 'scatter', plugins: [chartAreaPainter],
+            type: 'scatter', plugins: [chartAreaPainter, heatmapPainter],
             data: { datasets: [ { type: 'line', label: 'Hot-Crazy Line', data: [{x: 0, y: 4}, {x: 10, y: 10}], borderColor: themeOptions.lineColor, borderWidth: 2, borderDash: [5, 5], pointRadius: 0, fill: false, tension: 0.1, order: 1 } ] },
-            options: { maintainAspectRatio: false, plugins: { chartAreaPainter: { zones: themeOptions.zones, textColor: themeOptions.textColor, images: preloadedImages, isDarkMode: themeOptions.isDarkMode }, tooltip: { filter: (item) => item.datasetIndex !== 0, callbacks: { label: function(context) { let label = context.dataset.label || ''; if (label) { label += ': '; } label += `(Hot: ${context.parsed.x}, Crazy: ${context.parsed.y})`; return label; }, afterBody: function(context) { const plotData = context[0].raw; const notes = plotData.notes; if (notes) { return '\nNotes: ' + notes; } return ''; } } } }, responsive: true, scales: { x: { min: 0, max: 10, title: { display: true, text: 'Hot', color: themeOptions.textColor }, grid: { color: themeOptions.gridColor }, ticks: { color: themeOptions.textColor } }, y: { min: 4, max: 10, title: { display: true, text: 'Crazy', color: themeOptions.textColor }, grid: { color: themeOptions.gridColor }, ticks: { color: themeOptions.textColor } } }, onClick: handleChartClick }
+            options: { maintainAspectRatio: false, plugins: { chartAreaPainter: { zones: themeOptions.zones, textColor: themeOptions.textColor, images: preloadedImages, isDarkMode: themeOptions.isDarkMode }, heatmapPainter: { grid: null }, tooltip: { filter: (item) => item.datasetIndex !== 0, callbacks: { label: function(context) { let label = context.dataset.label || ''; if (label) { label += ': '; } label += `(Hot: ${context.parsed.x}, Crazy: ${context.parsed.y})`; return label; }, afterBody: function(context) { const plotData = context[0].raw; const notes = plotData.notes; if (notes) { return '\nNotes: ' + notes; } return ''; } } } }, responsive: true, scales: { x: { min: 0, max: 10, title: { display: true, text: 'Hot', color: themeOptions.textColor }, grid: { color: themeOptions.gridColor }, ticks: { color: themeOptions.textColor } }, y: { min: 4, max: 10, title: { display: true, text: 'Crazy', color: themeOptions.textColor }, grid: { color: themeOptions.gridColor }, ticks: { color: themeOptions.textColor } } }, onClick: handleChartClick }
         });
     }
 
@@ -328,17 +391,24 @@ document.addEventListener('DOMContentLoaded', () => {
         else { addPlotForm.style.opacity = '0.5'; }
     }
 
+    // Plots arrive as parallel arrays (format=columnar); Chart.js wants one point object each.
+    function columnsToPoints(columns) {
+        if (!columns) { return []; }
+        return columns.ids.map((id, i) => ({ id, client_id: columns.client_ids ? columns.client_ids[i] : null, x: columns.hot[i], y: columns.crazy[i], notes: columns.notes[i], date: new Date(columns.dates[i]).toISOString() }));
+    }
+
     async function updateChart() {
         try {
             const selectedGirlIds = Array.from(document.querySelectorAll('.girl-checkbox:checked')).map(cb => cb.value);
-            const datasets = [];
-            for (const [index, id] of selectedGirlIds.entries()) {
-                const plots = await apiRequest(`/api/girls/${id}/plots`);
+            const windowParam = historyStart ? `&from=${historyStart.toISOString()}` : '';
+            const plotsByGirl = selectedGirlIds.length ? await apiRequest(`/api/plots?format=columnar&girl_ids=${selectedGirlIds.join(',')}${windowParam}`) : {};
+            const datasets = selectedGirlIds.map((id, index) => {
                 const girlName = document.querySelector(`label[for="girl-${id}"]`).textContent.trim();
-                datasets.push({ label: girlName, data: plots, backgroundColor: colors[index % colors.length], order: 2 });
-            }
+                return { label: girlName, girlId: id, data: columnsToPoints(plotsByGirl[id]), backgroundColor: colors[index % colors.length], order: 2, hidden: heatmapToggle.checked };
+            });
             chart.data.datasets = [chart.data.datasets[0], ...datasets];
             chart.update();
+            updateHeatmap();
             updateAverages();
             toggleAddPlotForm(selectedGirlIds.length === 1);
         } catch (error) {
@@ -346,39 +416,59 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // With the heatmap on, the selected girls' points (their whole history,
+    // not just the loaded window) are shown as binned density instead.
+    async function updateHeatmap() {
+        const selectedGirlIds = Array.from(document.querySelectorAll('.girl-checkbox:checked')).map(cb => cb.value);
+        let grid = null;
+        try {
+            grid = heatmapToggle.checked && selectedGirlIds.length ? await apiRequest(`/api/heatmap?girl_ids=${selectedGirlIds.join(',')}&hot_bins=40&crazy_bins=24`) : null;
+        } catch (error) {
+            alert(`Error loading heatmap: ${error.message}`);
+        }
+        chart.options.plugins.heatmapPainter.grid = grid;
+        chart.data.datasets.slice(1).forEach(dataset => { dataset.hidden = heatmapToggle.checked; });
+        chart.update();
+    }
+
+    async function loadOlderHistory() {
+        if (!historyStart) { return; }
+        const girlDatasets = chart.data.datasets.slice(1);
+        try {
+            if (girlDatasets.length) {
+                const ids = girlDatasets.map(dataset => dataset.girlId).join(',');
+                const olderByGirl = await apiRequest(`/api/plots?format=columnar&girl_ids=${ids}&to=${historyStart.toISOString()}`);
+                girlDatasets.forEach(dataset => {
+                    dataset.data = [...columnsToPoints(olderByGirl[dataset.girlId]), ...dataset.data];
+                });
+                chart.update();
+            }
+            historyStart = null;
+            loadHistoryBtn.classList.add('d-none');
+        } catch (error) {
+            alert(`Error loading history: ${error.message}`);
+        }
+    }
+
+    function renderGirl(girl) {
+        const div = document.createElement('div');
+        div.className = 'form-check d-flex justify-content-between align-items-center mb-2';
+        div.dataset.girlId = girl.id;
+        div.innerHTML = `<div><input class="form-check-input girl-checkbox" type="checkbox" value="${girl.id}" id="girl-${girl.id}"><label class="form-check-label" for="girl-${girl.id}">${girl.name}</label></div><div><button class="btn btn-sm btn-outline-primary edit-girl-btn" data-id="${girl.id}" data-name="${girl.name}"><i class="bi bi-pencil"></i></button><button class="btn btn-sm btn-outline-danger delete-girl-btn" data-id="${girl.id}"><i class="bi bi-trash"></i></button></div>`;
+        return div;
+    }
+
     async function fetchAndRenderGirls() {
         try {
             const girls = await apiRequest('/api/girls');
             girlListContainer.innerHTML = girls.length ? '' : '<p class="text-muted">No girls added yet.</p>';
-            girls.forEach(girl => {
-                const div = document.createElement('div');
-                div.className = 'form-check d-flex justify-content-between align-items-center mb-2';
-                div.innerHTML = `<div><input class="form-check-input girl-checkbox" type="checkbox" value="${girl.id}" id="girl-${girl.id}"><label class="form-check-label" for="girl-${girl.id}">${girl.name}</label></div><div><button class="btn btn-sm btn-outline-primary edit-girl-btn" data-id="${girl.id}" data-name="${girl.name}"><i class="bi bi-pencil"></i></button><button class="btn btn-sm btn-outline-danger delete-girl-btn" data-id="${girl.id}"><i class="bi bi-trash"></i></button></div>`;
-                girlListContainer.appendChild(div);
-            });
+            girls.forEach(girl => girlListContainer.appendChild(renderGirl(girl)));
         } catch(error) {
             alert(`Error fetching girls: ${error.message}`);
             girlListContainer.innerHTML = '<p class="text-danger">Could not load girls list.</p>';
         }
     }
 
-    function getZoneForPoint(hot, crazy) {
-        const themeOptions = getThemeOptions();
-        const zones = themeOptions.zones;
-        for (const zone of zones) {
-            let isInside = false;
-            for (let i = 0, j = zone.points.length - 1; i < zone.points.length; j = i++) {
-                const xi = zone.points[i].x, yi = zone.points[i].y;
-                const xj = zone.points[j].x, yj = zone.points[j].y;
-                const intersect = ((yi > crazy) !== (yj > crazy))
-                    && (hot < (xj - xi) * (crazy - yi) / (yj - yi) + xi);
-                if (intersect) isInside = !isInside;
-            }
-            if (isInside) return zone;
-        }
-        return null; // Should not happen if zones cover the whole chart
-    }
-
     async function updateAverages() {
         const selectedGirlIds = Array.from(document.querySelectorAll('.girl-checkbox:checked')).map(cb => cb.value);
         if (!selectedGirlIds.length) {
@@ -386,42 +476,48 @@ document.addEventListener('DOMContentLoaded', () => {
             return;
         }
         try {
-            const averages = await apiRequest(`/api/averages?girl_ids=${selectedGirlIds.join(',')}`);
-            averageScoresContainer.innerHTML = '';
-            selectedGirlIds.forEach(id => {
-                const girlName = document.querySelector(`label[for="girl-${id}"]`).textContent.trim();
-                const data = averages[id];
-                const p = document.createElement('p');
-                p.className = 'd-flex align-items-center mb-2';
-
-                if (data) {
-                    const zone = getZoneForPoint(data.avg_hot, data.avg_crazy);
-                    const isDarkMode = document.documentElement.getAttribute('data-bs-theme') === 'dark';
-
-                    let iconHtml = '';
-                    if (zone && zone.imageKey && preloadedImages[zone.imageKey]) {
-                        const imageSet = preloadedImages[zone.imageKey];
-                        const image = imageSet ? (isDarkMode ? imageSet.dark : imageSet.light) : null;
-                        if (image && image.complete) {
-                            iconHtml = `<img src="${image.src}" alt="${zone.label} icon" width="20" height="20" class="mx-2">`;
-                        }
-                    }
-
-                    const zoneLabel = zone ? zone.label : '';
-
-                    // Order: Name, Icon, Zone
-                    p.innerHTML = `<strong>${girlName}:</strong> ${iconHtml} ${zoneLabel}`;
-                } else {
-                    p.innerHTML = `<strong>${girlName}:</strong> No data points yet.`;
-                }
-                averageScoresContainer.appendChild(p);
-            });
+            // Zones are classified server-side from each girl's running averages.
+            zonesByGirl = await apiRequest(`/api/zones?girl_ids=${selectedGirlIds.join(',')}`);
+            renderAverages(selectedGirlIds);
         } catch(error) {
             alert(`Error fetching averages: ${error.message}`);
             averageScoresContainer.innerHTML = '<p class="text-danger">Could not load averages.</p>';
         }
     }
 
+    function renderAverages(selectedGirlIds) {
+        const themeZones = getThemeOptions().zones;
+        averageScoresContainer.innerHTML = '';
+        selectedGirlIds.forEach(id => {
+            const girlName = document.querySelector(`label[for="girl-${id}"]`).textContent.trim();
+            const data = zonesByGirl[id];
+            const p = document.createElement('p');
+            p.className = 'd-flex align-items-center mb-2';
+
+            if (data) {
+                const zone = themeZones.find(z => z.imageKey === data.zone) || null;
+                const isDarkMode = document.documentElement.getAttribute('data-bs-theme') === 'dark';
+
+                let iconHtml = '';
+                if (zone && zone.imageKey && preloadedImages[zone.imageKey]) {
+                    const imageSet = preloadedImages[zone.imageKey];
+                    const image = imageSet ? (isDarkMode ? imageSet.dark : imageSet.light) : null;
+                    if (image && image.complete) {
+                        iconHtml = `<img src="${image.src}" alt="${zone.label} icon" width="20" height="20" class="mx-2">`;
+                    }
+                }
+
+                const zoneLabel = zone ? zone.label : '';
+
+                // Order: Name, Icon, Zone
+                p.innerHTML = `<strong>${girlName}:</strong> ${iconHtml} ${zoneLabel}`;
+            } else {
+                p.innerHTML = `<strong>${girlName}:</strong> No data points yet.`;
+            }
+            averageScoresContainer.appendChild(p);
+        });
+    }
+
     addGirlForm.addEventListener('submit', async (e) => {
         e.preventDefault();
         const name = newGirlNameInput.value.trim();
@@ -429,7 +525,7 @@ document.addEventListener('DOMContentLoaded', () => {
             try {
                 await apiRequest('/api/girls', 'POST', { name });
                 newGirlNameInput.value = '';
-                await fetchAndRenderGirls();
+                if (!liveUpdates) { await fetchAndRenderGirls(); }
             } catch (error) {
                 alert(`Error adding girl: ${error.message}`);
             }
@@ -447,8 +543,10 @@ document.addEventListener('DOMContentLoaded', () => {
             if (confirm('Are you sure you want to delete this girl and all her data?')) {
                 try {
                     await apiRequest(`/api/girls/${deleteBtn.dataset.id}`, 'DELETE');
-                    await fetchAndRenderGirls();
-                    updateChart();
+                    if (!liveUpdates) {
+                        await fetchAndRenderGirls();
+                        updateChart();
+                    }
                 } catch (error) {
                     alert(`Error deleting girl: ${error.message}`);
                 }
@@ -468,19 +566,36 @@ document.addEventListener('DOMContentLoaded', () => {
             try {
                 await apiRequest(`/api/girls/${editGirlIdInput.value}`, 'PUT', { name });
                 editGirlModal.hide();
-                await fetchAndRenderGirls();
-                updateChart();
+                if (!liveUpdates) {
+                    await fetchAndRenderGirls();
+                    updateChart();
+                }
             } catch (error) {
                 alert(`Error updating girl: ${error.message}`);
             }
         }
     });
 
+    // In write-behind mode the server answers 202 before the plot is saved;
+    // show it right away and let the plots_saved event fill in its id.
+    async function createPlot(girlId, fields) {
+        const clientId = window.crypto && crypto.randomUUID ? crypto.randomUUID() : null;
+        const result = await apiRequest('/api/plots', 'POST', { girl_id: girlId, ...fields, client_id: clientId });
+        if (result && result.pending) {
+            upsertPoint(girlId, { id: null, client_id: result.client_id, x: fields.hot_score, y: fields.crazy_score, notes: fields.notes, date: fields.plot_date });
+        } else if (!liveUpdates) {
+            updateChart();
+        }
+    }
+
     async function handleChartClick(evt) {
         const elements = chart.getElementsAtEventForMode(evt, 'nearest', { intersect: true }, true).filter(e => e.datasetIndex !== 0);
         if (elements.length > 0) {
             const { datasetIndex, index } = elements[0];
             const plotData = chart.data.datasets[datasetIndex].data[index];
+            if (plotData.id === null) {
+                alert('This point is still being saved. Try again in a moment.'); return;
+            }
             editPlotIdInput.value = plotData.id; editHotScoreInput.value = plotData.x; editCrazyScoreInput.value = plotData.y;
             editHotValueDisplay.textContent = plotData.x; editCrazyValueDisplay.textContent = plotData.y;
             editPlotDateInput.value = plotData.date.slice(0, 16); editPlotNotesInput.value = plotData.notes;
@@ -495,8 +610,7 @@ document.addEventListener('DOMContentLoaded', () => {
             if (hotScore >= 0 && hotScore <= 10 && crazyScore >= 4 && crazyScore <= 10) {
                 if (confirm(`Add point (Hot: ${hotScore}, Crazy: ${crazyScore}) for the selected girl?`)) {
                     try {
-                        await apiRequest('/api/plots', 'POST', { girl_id: parseInt(selectedGirlIds[0]), hot_score: hotScore, crazy_score: crazyScore, plot_date: new Date().toISOString(), notes: '' });
-                        updateChart();
+                        await createPlot(parseInt(selectedGirlIds[0]), { hot_score: hotScore, crazy_score: crazyScore, plot_date: new Date().toISOString(), notes: '' });
                     } catch (error) {
                         alert(`Error adding point: ${error.message}`);
                     }
@@ -512,8 +626,7 @@ document.addEventListener('DOMContentLoaded', () => {
             alert("Please select exactly one girl from the list to add a point for."); return;
         }
         try {
-            await apiRequest('/api/plots', 'POST', { girl_id: parseInt(selectedGirlIds[0]), hot_score: parseFloat(hotScoreInput.value), crazy_score: parseFloat(crazyScoreInput.value), plot_date: plotDateInput.value ? new Date(plotDateInput.value).toISOString() : new Date().toISOString(), notes: plotNotesInput.value.trim() });
-            updateChart();
+            await createPlot(parseInt(selectedGirlIds[0]), { hot_score: parseFloat(hotScoreInput.value), crazy_score: parseFloat(crazyScoreInput.value), plot_date: plotDateInput.value ? new Date(plotDateInput.value).toISOString() : new Date().toISOString(), notes: plotNotesInput.value.trim() });
             plotNotesInput.value = '';
             plotDateInput.value = '';
         } catch (error) {
@@ -527,7 +640,7 @@ document.addEventListener('DOMContentLoaded', () => {
         try {
             await apiRequest(`/api/plots/${editPlotIdInput.value}`, 'PUT', plotData);
             editPlotModal.hide();
-            updateChart();
+            if (!liveUpdates) { updateChart(); }
         } catch (error) {
             alert(`Error updating point: ${error.message}`);
         }
@@ -539,7 +652,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 try {
                     await apiRequest(`/api/plots/${editPlotIdInput.value}`, 'DELETE');
                     editPlotModal.hide();
-                    updateChart();
+                    if (!liveUpdates) { updateChart(); }
                 } catch (error) {
                     alert(`Error deleting point: ${error.message}`);
                 }
@@ -547,6 +660,14 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    if (loadHistoryBtn) {
+        loadHistoryBtn.addEventListener('click', loadOlderHistory);
+    }
+
+    if (heatmapToggle) {
+        heatmapToggle.addEventListener('change', updateHeatmap);
+    }
+
     [hotScoreInput, crazyScoreInput, editHotScoreInput, editCrazyScoreInput].forEach(input => {
         input.addEventListener('input', () => {
             hotValueDisplay.textContent = hotScoreInput.value; crazyValueDisplay.textContent = crazyScoreInput.value;
@@ -554,13 +675,118 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     });
 
+    // --- LIVE UPDATES ---
+    // Every change of this user, made in this tab or any other, arrives on
+    // /api/stream as a small delta and is patched into the chart and lists.
+    // Handlers are idempotent, since this tab also sees its own changes.
+    function findGirlEntry(girlId) {
+        return girlListContainer.querySelector(`[data-girl-id="${girlId}"]`);
+    }
+
+    function girlDataset(girlId) {
+        return chart.data.datasets.find(dataset => String(dataset.girlId) === String(girlId));
+    }
+
+    function applyAverages(girlId, averages) {
+        if (averages) { zonesByGirl[girlId] = averages; } else { delete zonesByGirl[girlId]; }
+        const selectedGirlIds = Array.from(document.querySelectorAll('.girl-checkbox:checked')).map(cb => cb.value);
+        if (selectedGirlIds.includes(String(girlId))) { renderAverages(selectedGirlIds); }
+    }
+
+    function upsertPoint(girlId, plot) {
+        const dataset = girlDataset(girlId);
+        if (!dataset) { return; }
+        // Plot dates are naive UTC; store them like columnsToPoints does.
+        const point = { ...plot, date: new Date(plot.date.endsWith('Z') ? plot.date : `${plot.date}Z`).toISOString() };
+        // A saved plot replaces the pending point it was acknowledged as.
+        dataset.data = dataset.data.filter(existing => (point.id === null || existing.id !== point.id) && (!point.client_id || existing.client_id !== point.client_id));
+        // Points older than the loaded window would be a gap in the history.
+        if (!historyStart || new Date(point.date) >= historyStart) {
+            dataset.data.push(point);
+        }
+        chart.update();
+        if (heatmapToggle.checked) { updateHeatmap(); }
+    }
+
+    function removePoint(girlId, plotId) {
+        const dataset = girlDataset(girlId);
+        if (!dataset) { return; }
+        dataset.data = dataset.data.filter(point => point.id !== plotId);
+        chart.update();
+        if (heatmapToggle.checked) { updateHeatmap(); }
+    }
+
+    function resyncDashboard() {
+        fetchAndRenderGirls().then(updateChart);
+    }
+
+    const liveHandlers = {
+        girl_created: (event) => {
+            if (findGirlEntry(event.girl.id)) { return; }
+            const placeholder = girlListContainer.querySelector('p.text-muted');
+            if (placeholder) { placeholder.remove(); }
+            const entries = Array.from(girlListContainer.querySelectorAll('[data-girl-id]'));
+            const next = entries.find(entry => entry.querySelector('label').textContent.trim().localeCompare(event.girl.name) > 0);
+            girlListContainer.insertBefore(renderGirl(event.girl), next || null);
+        },
+        girl_renamed: (event) => {
+            const entry = findGirlEntry(event.girl_id);
+            if (!entry) { return; }
+            entry.querySelector('label').textContent = event.name;
+            entry.querySelector('.edit-girl-btn').dataset.name = event.name;
+            const dataset = girlDataset(event.girl_id);
+            if (dataset) { dataset.label = event.name; chart.update(); }
+            applyAverages(event.girl_id, zonesByGirl[event.girl_id]);
+        },
+        girl_deleted: (event) => {
+            const entry = findGirlEntry(event.girl_id);
+            if (entry) { entry.remove(); }
+            delete zonesByGirl[event.girl_id];
+            if (!girlListContainer.querySelector('[data-girl-id]')) {
+                girlListContainer.innerHTML = '<p class="text-muted">No girls added yet.</p>';
+            }
+            if (girlDataset(event.girl_id)) { updateChart(); }
+        },
+        plot_created: (event) => { upsertPoint(event.girl_id, event.plot); applyAverages(event.girl_id, event.averages); },
+        plot_updated: (event) => { upsertPoint(event.girl_id, event.plot); applyAverages(event.girl_id, event.averages); },
+        plot_deleted: (event) => { removePoint(event.girl_id, event.plot_id); applyAverages(event.girl_id, event.averages); },
+        plots_saved: (event) => {
+            event.plots.forEach(({ girl_id, plot }) => upsertPoint(girl_id, plot));
+            Object.entries(event.averages).forEach(([girlId, averages]) => applyAverages(girlId, averages));
+        },
+        resync: resyncDashboard,
+    };
+
+    function connectLiveUpdates() {
+        if (!window.EventSource) { return; }
+        const source = new EventSource('/api/stream');
+        let missedEvents = false;
+        source.addEventListener('open', () => {
+            // Events sent while disconnected are gone; reload once to catch up.
+            if (missedEvents) { resyncDashboard(); }
+            liveUpdates = true;
+        });
+        source.addEventListener('error', () => {
+            // EventSource reconnects by itself; refetch after mutations meanwhile.
+            liveUpdates = false;
+            missedEvents = true;
+        });
+        source.addEventListener('message', (message) => {
+            const event = JSON.parse(message.data);
+            const handler = liveHandlers[event.type];
+            if (handler) { handler(event); }
+        });
+    }
+
     // --- INITIALIZATION ---
     async function initializeApp() {
-        const imageUrls = { 'no-go-zone': '/static/images/no-go-zone.png', 'danger-zone': '/static/images/danger-zone.png', 'fun-zone': '/static/images/fun-zone.png', 'date-zone': '/static/images/date-zone.png', 'wife-zone': '/static/images/wife-zone.png', 'unicorn-zone': '/static/images/unicorn-zone.png', };
+        const zoneImagesEl = document.getElementById('zone-images');
+        const imageUrls = zoneImagesEl ? JSON.parse(zoneImagesEl.textContent) : {};
         preloadedImages = await preloadAllImages(imageUrls);
         initializeChart();
         await fetchAndRenderGirls();
         toggleAddPlotForm(false);
+        connectLiveUpdates();
     }
 
     initializeApp();
@@ -0,0 +1,182 @@
+"""Incremental maintenance of the ``girl_stats`` summary table.
+
+Every plot write calls one of the ``plot*`` functions below in the same
+session, before the commit, so the summary row and the plot rows are always
+committed together. Sums and counts are applied as SQL expressions, which
+keeps concurrent writers from overwriting each other's increments. A min/max
+or last date cannot be "un-applied", so removing a plot that held one of
+those values recomputes that single girl from her plots.
+
+A point is a ``(hot_score, crazy_score, plot_date)`` tuple.
+"""
+from sqlalchemy import case, delete, func, insert, select
+
+from app import db, zones
+from app.models import Girl, GirlStats, Plot
+
+
+def _lower(column, value):
+    return case((column.is_(None), value), (column <= value, column), else_=value)
+
+
+def _higher(column, value):
+    return case((column.is_(None), value), (column >= value, column), else_=value)
+
+
+def plots_added(girl_id, points):
+    """Fold newly inserted points into the girl's summary row."""
+    points = list(points)
+    if not points:
+        return
+    stats = db.session.get(GirlStats, girl_id)
+    if stats is None:
+        recompute(girl_id)
+        return
+
+    hots = [point[0] for point in points]
+    crazies = [point[1] for point in points]
+    stats.plot_count = GirlStats.plot_count + len(points)
+    stats.hot_sum = GirlStats.hot_sum + sum(hots)
+    stats.hot_sq_sum = GirlStats.hot_sq_sum + sum(h * h for h in hots)
+    stats.crazy_sum = GirlStats.crazy_sum + sum(crazies)
+    stats.crazy_sq_sum = GirlStats.crazy_sq_sum + sum(c * c for c in crazies)
+    stats.hot_min = _lower(GirlStats.hot_min, min(hots))
+    stats.hot_max = _higher(GirlStats.hot_max, max(hots))
+    stats.crazy_min = _lower(GirlStats.crazy_min, min(crazies))
+    stats.crazy_max = _higher(GirlStats.crazy_max, max(crazies))
+    stats.last_plot_date = _higher(GirlStats.last_plot_date, max(point[2] for point in points))
+
+
+def plot_added(girl_id, point):
+    plots_added(girl_id, [point])
+
+
+def plot_removed(girl_id, point):
+    """Take a deleted point out of the girl's summary row."""
+    stats = db.session.get(GirlStats, girl_id)
+    if stats is None or _touches_extreme(stats, point):
+        recompute(girl_id)
+        return
+
+    hot, crazy, _ = point
+    stats.plot_count = GirlStats.plot_count - 1
+    stats.hot_sum = GirlStats.hot_sum - hot
+    stats.hot_sq_sum = GirlStats.hot_sq_sum - hot * hot
+    stats.crazy_sum = GirlStats.crazy_sum - crazy
+    stats.crazy_sq_sum = GirlStats.crazy_sq_sum - crazy * crazy
+
+
+def plot_changed(girl_id, old_point, new_point):
+    """Replace ``old_point`` with ``new_point`` in the girl's summary row."""
+    stats = db.session.get(GirlStats, girl_id)
+    if stats is None or _touches_extreme(stats, old_point):
+        recompute(girl_id)
+        return
+
+    old_hot, old_crazy, _ = old_point
+    hot, crazy, plot_date = new_point
+    stats.hot_sum = GirlStats.hot_sum - old_hot + hot
+    stats.hot_sq_sum = GirlStats.hot_sq_sum - old_hot * old_hot + hot * hot
+    stats.crazy_sum = GirlStats.crazy_sum - old_crazy + crazy
+    stats.crazy_sq_sum = GirlStats.crazy_sq_sum - old_crazy * old_crazy + crazy * crazy
+    stats.hot_min = _lower(GirlStats.hot_min, hot)
+    stats.hot_max = _higher(GirlStats.hot_max, hot)
+    stats.crazy_min = _lower(GirlStats.crazy_min, crazy)
+    stats.crazy_max = _higher(GirlStats.crazy_max, crazy)
+    stats.last_plot_date = _higher(GirlStats.last_plot_date, plot_date)
+
+
+def _touches_extreme(stats, point):
+    hot, crazy, plot_date = point
+    return (
+        hot in (stats.hot_min, stats.hot_max)
+        or crazy in (stats.crazy_min, stats.crazy_max)
+        or _is_latest(plot_date, stats.last_plot_date)
+    )
+
+
+def _is_latest(plot_date, last_plot_date):
+    if plot_date is None or last_plot_date is None:
+        return True
+    # SQLite hands back naive datetimes for values that were written as aware ones.
+    return plot_date.replace(tzinfo=None) >= last_plot_date.replace(tzinfo=None)
+
+
+def _aggregate_columns():
+    return (
+        func.count(Plot.id),
+        func.coalesce(func.sum(Plot.hot_score), 0.0),
+        func.coalesce(func.sum(Plot.hot_score * Plot.hot_score), 0.0),
+        func.coalesce(func.sum(Plot.crazy_score), 0.0),
+        func.coalesce(func.sum(Plot.crazy_score * Plot.crazy_score), 0.0),
+        func.min(Plot.hot_score),
+        func.max(Plot.hot_score),
+        func.min(Plot.crazy_score),
+        func.max(Plot.crazy_score),
+        func.max(Plot.plot_date),
+    )
+
+
+_STAT_COLUMNS = (
+    "plot_count",
+    "hot_sum",
+    "hot_sq_sum",
+    "crazy_sum",
+    "crazy_sq_sum",
+    "hot_min",
+    "hot_max",
+    "crazy_min",
+    "crazy_max",
+    "last_plot_date",
+)
+
+
+def recompute(girl_id):
+    """Rebuild one girl's summary row from her plots."""
+    row = db.session.execute(select(*_aggregate_columns()).where(Plot.girl_id == girl_id)).one()
+    stats = db.session.get(GirlStats, girl_id)
+    if stats is None:
+        stats = GirlStats(girl_id=girl_id)
+        db.session.add(stats)
+    for column, value in zip(_STAT_COLUMNS, row):
+        setattr(stats, column, value)
+    return stats
+
+
+def rebuild():
+    """Recreate every summary row from scratch. Returns the number of girls covered."""
+    db.session.execute(delete(GirlStats))
+    aggregates = (
+        select(Girl.id, *_aggregate_columns())
+        .select_from(Girl)
+        .outerjoin(Plot, Plot.girl_id == Girl.id)
+        .group_by(Girl.id)
+    )
+    result = db.session.execute(
+        insert(GirlStats).from_select(["girl_id", *_STAT_COLUMNS], aggregates)
+    )
+    return result.rowcount
+
+
+def variance(count, total, squares):
+    if not count:
+        return None
+    mean = total / count
+    return max(squares / count - mean * mean, 0.0)
+
+
+def girl_summary(girl_id):
+    """Average position and zone of one girl, as pushed with live plot events."""
+    summary = db.session.get(GirlStats, girl_id)
+    if summary is None or not summary.plot_count:
+        return None
+    avg_hot = summary.hot_sum / summary.plot_count
+    avg_crazy = summary.crazy_sum / summary.plot_count
+    zone = zones.zone_for(zones.classify([avg_hot], [avg_crazy])[0])
+    return {
+        "avg_hot": round(avg_hot, 2),
+        "avg_crazy": round(avg_crazy, 2),
+        "count": summary.plot_count,
+        "zone": zone.key if zone else None,
+        "label": zone.label if zone else None,
+    }
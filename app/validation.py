@@ -0,0 +1,114 @@
+from datetime import datetime, timezone
+import re
+
+from flask import abort, request
+
+from app import profiling
+
+
+ISO_8601_RE = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}(:\d{2}(\.\d*)?)?(Z|[+-]\d{2}:\d{2})?$")
+
+
+def collect_plot_errors(data, *, is_update: bool = False):
+    """Validate a plot payload, returning ``(cleaned, errors)`` instead of aborting."""
+    errors = {}
+    cleaned = {}
+
+    if not is_update and "girl_id" not in data:
+        errors["girl_id"] = "girl_id is required."
+
+    # Validate scores
+    raw_hot_score = data.get("hot_score")
+    raw_crazy_score = data.get("crazy_score")
+
+    if raw_hot_score is None:
+        if not is_update:
+            errors["hot_score"] = "Hot score is required."
+    else:
+        try:
+            hot_score = float(raw_hot_score)
+        except (TypeError, ValueError):
+            errors["hot_score"] = "Hot score must be a valid number."
+        else:
+            if not 0 <= hot_score <= 10:
+                errors["hot_score"] = "Hot score must be between 0 and 10."
+            else:
+                cleaned["hot_score"] = hot_score
+
+    if raw_crazy_score is None:
+        if not is_update:
+            errors["crazy_score"] = "Crazy score is required."
+    else:
+        try:
+            crazy_score = float(raw_crazy_score)
+        except (TypeError, ValueError):
+            errors["crazy_score"] = "Crazy score must be a valid number."
+        else:
+            if not 4 <= crazy_score <= 10:
+                errors["crazy_score"] = "Crazy score must be between 4 and 10."
+            else:
+                cleaned["crazy_score"] = crazy_score
+
+    # Validate notes length/type
+    if "notes" in data:
+        notes = data["notes"]
+        if notes is None:
+            cleaned["notes"] = None
+        elif not isinstance(notes, str):
+            errors["notes"] = "Notes must be a string."
+        else:
+            trimmed_notes = notes.strip()
+            if len(trimmed_notes) > 500:
+                errors["notes"] = "Notes cannot exceed 500 characters."
+            else:
+                cleaned["notes"] = trimmed_notes
+
+    # Validate date format if provided
+    plot_date_str = data.get("plot_date")
+    if plot_date_str:
+        try:
+            if not ISO_8601_RE.match(plot_date_str):
+                raise ValueError
+            datetime.fromisoformat(plot_date_str.replace("Z", "+00:00"))
+        except (TypeError, ValueError):
+            errors["plot_date"] = "Invalid date format. Please use ISO 8601 format."
+
+    return cleaned, errors
+
+
+def format_plot_errors(errors):
+    return "; ".join(f"{field}: {message}" for field, message in errors.items())
+
+
+def validate_plot_data(data, *, is_update: bool = False):
+    """Validate incoming plot payloads for create and update operations."""
+    with profiling.phase("validate"):
+        cleaned, errors = collect_plot_errors(data, is_update=is_update)
+    if errors:
+        abort(400, description=format_plot_errors(errors))
+    return cleaned
+
+
+def parse_plot_date(plot_date_str):
+    """Parse an ISO 8601 string that has already passed validation."""
+    return datetime.fromisoformat(plot_date_str.replace("Z", "+00:00"))
+
+
+def parse_date_param(name):
+    """Parse an optional ISO 8601 query parameter into a naive UTC datetime.
+
+    Plot dates are stored as naive UTC, so aware values are converted before
+    they are compared against the column.
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        if not ISO_8601_RE.match(value):
+            raise ValueError
+        parsed = parse_plot_date(value)
+    except ValueError:
+        abort(400, description=f"Invalid {name} date. Please use ISO 8601 format.")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
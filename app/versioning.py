@@ -0,0 +1,81 @@
+"""Data version counters and conditional GET support for the JSON API.
+
+Every write bumps ``User.data_version`` (and ``Girl.data_version`` for the
+girls it touched) in the same transaction. With sharding on, the user's
+counter is ``user_data_version`` in their shard instead, so the write stays
+within one database. GET views wrapped in
+``conditional`` derive a weak ETag from the version before running, so a
+matching ``If-None-Match`` is answered with ``304 Not Modified`` without
+touching the plot tables or serializing anything.
+"""
+from functools import wraps
+import hashlib
+
+from flask import current_app, g, make_response, request
+from flask_login import current_user
+from sqlalchemy import select, update
+
+from app import db, ingest, sharding
+from app.models import Girl, User
+
+
+def bump(user_id, girl_ids=()):
+    """Invalidate the ETags of a user's resources and of the given girls."""
+    if sharding.enabled():
+        sharding.bump_user_version(user_id)
+    else:
+        db.session.execute(
+            update(User).where(User.id == user_id).values(data_version=User.data_version + 1)
+        )
+    girl_ids = [girl_id for girl_id in girl_ids if girl_id is not None]
+    if girl_ids:
+        db.session.execute(
+            update(Girl).where(Girl.id.in_(girl_ids)).values(data_version=Girl.data_version + 1)
+        )
+
+
+def user_version(**view_args):
+    # Read from the database: current_user may come from the identity cache,
+    # which doesn't hold data_version.
+    if sharding.enabled():
+        version = sharding.read_user_version(current_user.id)
+    else:
+        version = db.session.scalar(select(User.data_version).where(User.id == current_user.id))
+    # Journaled plots show up in responses before the version is bumped.
+    return f"u{current_user.id}.{version}{ingest.pending_token(current_user.id)}"
+
+
+def make_etag(version):
+    # The full path is part of the tag because the same version backs many
+    # different responses (other girl_ids, windows, formats, ...).
+    return hashlib.sha1(f"{version}|{request.full_path}".encode()).hexdigest()
+
+
+def conditional(version_of=user_version):
+    """Serve a GET view with an ETag and answer ``If-None-Match`` with 304.
+
+    ``version_of`` receives the view arguments and returns a string that
+    changes whenever the response could change. It runs before the view and
+    may abort (e.g. 404/403) like the view itself would. The view can read
+    the value as ``g.etag_version``, e.g. to key a cache on the same version
+    as the ETag.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            g.etag_version = version_of(**kwargs)
+            etag = make_etag(g.etag_version)
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+
+        return wrapper
+
+    return decorator
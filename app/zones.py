@@ -0,0 +1,86 @@
+"""The six regions of the Hot-Crazy Matrix and a vectorized point classifier.
+
+The polygons are the ones the dashboard draws. ``classify`` uses the same
+even-odd ray casting rule as the old client-side ``getZoneForPoint``, so a
+point on a shared edge lands in the same zone it always did, and points on
+the outer edge at hot = 10 fall outside every zone.
+"""
+from collections import namedtuple
+
+import numpy as np
+from sqlalchemy import and_, case, literal
+
+
+Zone = namedtuple("Zone", ["key", "label", "polygon"])
+
+ZONES = (
+    Zone("no-go-zone", "No-Go Zone", ((0, 10), (5, 10), (5, 4), (0, 4))),
+    Zone("danger-zone", "Danger Zone", ((5, 10), (10, 10), (8, 8.8), (5, 7))),
+    Zone("fun-zone", "Fun Zone", ((5, 7), (8, 8.8), (8, 4), (5, 4))),
+    Zone("date-zone", "Date Zone", ((8, 8.8), (10, 10), (10, 7), (8, 7))),
+    Zone("wife-zone", "Wife Zone", ((8, 7), (10, 7), (10, 5), (8, 5))),
+    Zone("unicorn-zone", "Unicorn Zone", ((8, 5), (10, 5), (10, 4), (8, 4))),
+)
+
+UNCLASSIFIED = -1
+
+
+def _edges(polygon):
+    """Yield the non-horizontal edges of a polygon as ``(xi, yi, xj, yj)``.
+
+    A horizontal edge can never straddle a point's y coordinate, so it never
+    contributes a crossing and can be skipped (which also avoids dividing by
+    zero below).
+    """
+    for i, (xi, yi) in enumerate(polygon):
+        xj, yj = polygon[i - 1]
+        if yi != yj:
+            yield xi, yi, xj, yj
+
+
+def _contains(polygon, hot, crazy):
+    inside = np.zeros(hot.shape, dtype=bool)
+    for xi, yi, xj, yj in _edges(polygon):
+        crosses = (yi > crazy) != (yj > crazy)
+        crosses &= hot < (xj - xi) * (crazy - yi) / (yj - yi) + xi
+        inside ^= crosses
+    return inside
+
+
+def classify(hot, crazy):
+    """Return the index into ``ZONES`` of every (hot, crazy) point.
+
+    Points outside every zone get ``UNCLASSIFIED``. When zones overlap on a
+    shared edge the first one in ``ZONES`` wins.
+    """
+    hot = np.asarray(hot, dtype=np.float64)
+    crazy = np.asarray(crazy, dtype=np.float64)
+    result = np.full(hot.shape, UNCLASSIFIED, dtype=np.int8)
+    for index, zone in enumerate(ZONES):
+        unassigned = result == UNCLASSIFIED
+        if not unassigned.any():
+            break
+        result[unassigned & _contains(zone.polygon, hot, crazy)] = index
+    return result
+
+
+def sql_classify(hot, crazy):
+    """SQL expression for ``classify`` of the ``hot``/``crazy`` columns.
+
+    Built from the same edges and arithmetic, so the database assigns the
+    same zone as the NumPy version, edge cases included.
+    """
+    whens = []
+    for index, zone in enumerate(ZONES):
+        crossings = literal(0)
+        for xi, yi, xj, yj in _edges(zone.polygon):
+            straddles = and_(crazy >= float(min(yi, yj)), crazy < float(max(yi, yj)))
+            left_of_edge = hot < literal(float(xj - xi)) * (crazy - float(yi)) / literal(float(yj - yi)) + float(xi)
+            crossings = crossings + case((and_(straddles, left_of_edge), 1), else_=0)
+        whens.append((crossings % 2 == 1, index))
+    return case(*whens, else_=UNCLASSIFIED)
+
+
+def zone_for(index):
+    return None if index == UNCLASSIFIED else ZONES[index]
+
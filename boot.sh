@@ -4,7 +4,39 @@
 echo "Running database migrations..."
 # Initialize and apply migrations
 flask db upgrade
+# Create the tables of any new shard (a no-op unless SHARD_COUNT is set).
+flask shards init
+
+# Save plots journaled by write-behind workers that didn't get to flush them.
+flask jobs flush-ingest
+
+# Fingerprint and precompress the static files served under /assets/.
+flask assets build
+
+# Finish deleting any large accounts a restart interrupted, without holding up startup.
+flask jobs purge-accounts &
+
+# /metrics is only served with METRICS_ENABLED=1; set METRICS_TOKEN too (sent
+# as "Authorization: Bearer <token>") unless the port is private.
+# Workers write their metrics to files in this directory and /metrics merges
+# them, so it must start empty (set after migrations so they don't write to it).
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus-multiproc}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# Shared backend of the login identity cache, so a password change or account
+# deletion in one worker is seen by the others.
+export IDENTITY_CACHE_DIR="${IDENTITY_CACHE_DIR:-/tmp/identity-cache}"
+rm -rf "$IDENTITY_CACHE_DIR"
+
+# Live update events are spooled here so every worker's streams see them.
+export EVENTS_SPOOL_DIR="${EVENTS_SPOOL_DIR:-/tmp/event-spool}"
+rm -rf "$EVENTS_SPOOL_DIR"
 
 echo "Starting Gunicorn..."
 # Start Gunicorn on port 8000, accessible from outside the container
-exec gunicorn --bind 0.0.0.0:8000 "run:app"
+# Workers share one SQLite file in WAL mode; GUNICORN_WORKERS sets how many.
+# Threaded workers, so open /api/stream connections don't take a whole worker
+# each; GUNICORN_THREADS sets the threads per worker.
+exec gunicorn --bind 0.0.0.0:8000 --workers "${GUNICORN_WORKERS:-2}" \
+    --worker-class gthread --threads "${GUNICORN_THREADS:-8}" "run:app"
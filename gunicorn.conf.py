@@ -0,0 +1,7 @@
+"""Gunicorn settings picked up automatically from the working directory."""
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges (pool connections) from /metrics.
+    multiprocess.mark_process_dead(worker.pid)
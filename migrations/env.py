@@ -90,13 +90,28 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # The full-text index (plot_fts and its FTS5 shadow tables) is created by
+    # hand in a migration; keep autogenerate from proposing to drop it.
+    def include_name(name, type_, parent_names):
+        return not (type_ == 'table' and name.startswith('plot_fts'))
+
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    conf_args.setdefault("include_name", include_name)
 
     connectable = get_engine()
 
     with connectable.connect() as connection:
+        # Batch migrations rebuild SQLite tables by dropping and renaming them,
+        # which must not trigger foreign key checks or ON DELETE CASCADE. The
+        # pragma is ignored inside a transaction, so set it before beginning one
+        # (and end the transaction SQLAlchemy implicitly began for it).
+        sqlite = connection.dialect.name == 'sqlite'
+        if sqlite:
+            connection.exec_driver_sql('PRAGMA foreign_keys = OFF')
+            connection.commit()
+
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
@@ -106,6 +121,10 @@ def run_migrations_online():
         with context.begin_transaction():
             context.run_migrations()
 
+        if sqlite:
+            connection.exec_driver_sql('PRAGMA foreign_keys = ON')
+            connection.commit()
+
 
 if context.is_offline_mode():
     run_migrations_offline()
@@ -0,0 +1,34 @@
+"""Add composite indexes on foreign key access paths
+
+Revision ID: 3c1d7e5b9a20
+Revises: 89a9f4f2aa8c
+Create Date: 2026-10-17 09:12:44.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1d7e5b9a20'
+down_revision = '89a9f4f2aa8c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # girl lists are always fetched per owner and ordered by name
+    with op.batch_alter_table('girl', schema=None) as batch_op:
+        batch_op.create_index('ix_girl_user_id_name', ['user_id', 'name'], unique=False)
+
+    # plots are always fetched per girl and ordered by date
+    with op.batch_alter_table('plot', schema=None) as batch_op:
+        batch_op.create_index('ix_plot_girl_id_plot_date', ['girl_id', 'plot_date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('plot', schema=None) as batch_op:
+        batch_op.drop_index('ix_plot_girl_id_plot_date')
+
+    with op.batch_alter_table('girl', schema=None) as batch_op:
+        batch_op.drop_index('ix_girl_user_id_name')
@@ -0,0 +1,62 @@
+"""Add girl_stats summary table
+
+Revision ID: 7f4b2c9e1d63
+Revises: 3c1d7e5b9a20
+Create Date: 2026-10-17 10:02:17.904415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f4b2c9e1d63'
+down_revision = '3c1d7e5b9a20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('girl_stats',
+    sa.Column('girl_id', sa.Integer(), nullable=False),
+    sa.Column('plot_count', sa.Integer(), nullable=False),
+    sa.Column('hot_sum', sa.Float(), nullable=False),
+    sa.Column('hot_sq_sum', sa.Float(), nullable=False),
+    sa.Column('crazy_sum', sa.Float(), nullable=False),
+    sa.Column('crazy_sq_sum', sa.Float(), nullable=False),
+    sa.Column('hot_min', sa.Float(), nullable=True),
+    sa.Column('hot_max', sa.Float(), nullable=True),
+    sa.Column('crazy_min', sa.Float(), nullable=True),
+    sa.Column('crazy_max', sa.Float(), nullable=True),
+    sa.Column('last_plot_date', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['girl_id'], ['girl.id'], ),
+    sa.PrimaryKeyConstraint('girl_id')
+    )
+
+    # Backfill from existing plots; girls without plots get an all-zero row.
+    op.execute(
+        """
+        INSERT INTO girl_stats (
+            girl_id, plot_count, hot_sum, hot_sq_sum, crazy_sum, crazy_sq_sum,
+            hot_min, hot_max, crazy_min, crazy_max, last_plot_date
+        )
+        SELECT
+            girl.id,
+            COUNT(plot.id),
+            COALESCE(SUM(plot.hot_score), 0.0),
+            COALESCE(SUM(plot.hot_score * plot.hot_score), 0.0),
+            COALESCE(SUM(plot.crazy_score), 0.0),
+            COALESCE(SUM(plot.crazy_score * plot.crazy_score), 0.0),
+            MIN(plot.hot_score),
+            MAX(plot.hot_score),
+            MIN(plot.crazy_score),
+            MAX(plot.crazy_score),
+            MAX(plot.plot_date)
+        FROM girl LEFT OUTER JOIN plot ON plot.girl_id = girl.id
+        GROUP BY girl.id
+        """
+    )
+
+
+def downgrade():
+    op.drop_table('girl_stats')
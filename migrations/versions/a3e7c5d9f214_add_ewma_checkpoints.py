@@ -0,0 +1,76 @@
+"""Add EWMA state to girl_stats and per-plot EWMA checkpoints
+
+Revision ID: a3e7c5d9f214
+Revises: f2c6d8a4b195
+Create Date: 2026-10-17 16:20:44.106382
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3e7c5d9f214'
+down_revision = 'f2c6d8a4b195'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain ALTER TABLE rather than batch mode: recreating plot would drop
+    # the triggers that keep plot_fts in sync.
+    op.add_column('plot', sa.Column('ewma_hot', sa.Float(), nullable=True))
+    op.add_column('plot', sa.Column('ewma_crazy', sa.Float(), nullable=True))
+    op.add_column('girl_stats', sa.Column('ewma_hot', sa.Float(), nullable=True))
+    op.add_column('girl_stats', sa.Column('ewma_crazy', sa.Float(), nullable=True))
+    op.add_column('girl_stats', sa.Column('ewma_plot_date', sa.DateTime(), nullable=True))
+
+    # Backfill: fold every girl's plots in (plot_date, id) order.
+    alpha = current_app.config.get('ROLLING_EWMA_ALPHA', 0.2)
+    connection = op.get_bind()
+    plot = sa.table('plot', sa.column('id'), sa.column('girl_id'), sa.column('plot_date', sa.DateTime),
+                    sa.column('hot_score'), sa.column('crazy_score'),
+                    sa.column('ewma_hot'), sa.column('ewma_crazy'))
+    girl_stats = sa.table('girl_stats', sa.column('girl_id'), sa.column('ewma_hot'),
+                          sa.column('ewma_crazy'), sa.column('ewma_plot_date', sa.DateTime))
+    update_plot = (
+        plot.update().where(plot.c.id == sa.bindparam('plot_id'))
+        .values(ewma_hot=sa.bindparam('hot'), ewma_crazy=sa.bindparam('crazy'))
+    )
+    rows = connection.execute(
+        sa.select(plot.c.id, plot.c.girl_id, plot.c.plot_date, plot.c.hot_score, plot.c.crazy_score)
+        .order_by(plot.c.girl_id, plot.c.plot_date, plot.c.id)
+    )
+
+    checkpoints, latest = [], {}
+    for row in rows:
+        state = latest.get(row.girl_id)
+        if state is None:
+            hot, crazy = row.hot_score, row.crazy_score
+        else:
+            hot = alpha * row.hot_score + (1 - alpha) * state[0]
+            crazy = alpha * row.crazy_score + (1 - alpha) * state[1]
+        latest[row.girl_id] = (hot, crazy, row.plot_date)
+        checkpoints.append({'plot_id': row.id, 'hot': hot, 'crazy': crazy})
+        if len(checkpoints) == 5000:
+            connection.execute(update_plot, checkpoints)
+            checkpoints = []
+    if checkpoints:
+        connection.execute(update_plot, checkpoints)
+    if latest:
+        connection.execute(
+            girl_stats.update().where(girl_stats.c.girl_id == sa.bindparam('stats_girl_id'))
+            .values(ewma_hot=sa.bindparam('hot'), ewma_crazy=sa.bindparam('crazy'),
+                    ewma_plot_date=sa.bindparam('plot_date')),
+            [{'stats_girl_id': girl_id, 'hot': hot, 'crazy': crazy, 'plot_date': plot_date}
+             for girl_id, (hot, crazy, plot_date) in latest.items()],
+        )
+
+
+def downgrade():
+    op.drop_column('girl_stats', 'ewma_plot_date')
+    op.drop_column('girl_stats', 'ewma_crazy')
+    op.drop_column('girl_stats', 'ewma_hot')
+    op.drop_column('plot', 'ewma_crazy')
+    op.drop_column('plot', 'ewma_hot')
@@ -0,0 +1,32 @@
+"""Add data_version counters to user and girl
+
+Revision ID: a8e3f1c64b07
+Revises: 7f4b2c9e1d63
+Create Date: 2026-10-17 11:21:36.170843
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8e3f1c64b07'
+down_revision = '7f4b2c9e1d63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_version', sa.Integer(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('girl', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('girl', schema=None) as batch_op:
+        batch_op.drop_column('data_version')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('data_version')
@@ -0,0 +1,60 @@
+"""Cascade deletes in the database and add user.pending_deletion
+
+Revision ID: c4f9a2d7e815
+Revises: a8e3f1c64b07
+Create Date: 2026-10-17 15:02:48.519304
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f9a2d7e815'
+down_revision = 'a8e3f1c64b07'
+branch_labels = None
+depends_on = None
+
+
+# The original foreign keys are unnamed; on SQLite batch mode names them with
+# this convention when it reflects the table, so they can be dropped.
+naming_convention = {
+    "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
+}
+
+CASCADES = [
+    ('girl', 'user_id', 'user'),
+    ('plot', 'girl_id', 'girl'),
+    ('girl_stats', 'girl_id', 'girl'),
+]
+
+
+def _foreign_key_name(table, column, referred):
+    for foreign_key in sa.inspect(op.get_bind()).get_foreign_keys(table):
+        if foreign_key['constrained_columns'] == [column] and foreign_key.get('name'):
+            return foreign_key['name']
+    return f'fk_{table}_{column}_{referred}'
+
+
+def _replace_foreign_keys(ondelete):
+    for table, column, referred in CASCADES:
+        name = _foreign_key_name(table, column, referred)
+        with op.batch_alter_table(table, schema=None, naming_convention=naming_convention) as batch_op:
+            batch_op.drop_constraint(name, type_='foreignkey')
+            batch_op.create_foreign_key(
+                f'fk_{table}_{column}_{referred}', referred, [column], ['id'], ondelete=ondelete
+            )
+
+
+def upgrade():
+    _replace_foreign_keys('CASCADE')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('pending_deletion', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('pending_deletion')
+
+    _replace_foreign_keys(None)
@@ -0,0 +1,74 @@
+"""Add FTS5 full-text index over plot notes
+
+Revision ID: d7a3b9e2c410
+Revises: c4f9a2d7e815
+Create Date: 2026-10-17 16:40:12.774051
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a3b9e2c410'
+down_revision = 'c4f9a2d7e815'
+branch_labels = None
+depends_on = None
+
+
+# ``owner`` holds one token, "u<user id>", so a search can be limited to a
+# user's notes inside the index (``owner:u42 AND ...``) instead of matching
+# every user's notes and filtering afterwards. The owner of a plot is its
+# girl's user, which never changes.
+TRIGGERS = [
+    """
+    CREATE TRIGGER plot_fts_after_insert AFTER INSERT ON plot
+    WHEN new.notes IS NOT NULL AND new.notes != ''
+    BEGIN
+        INSERT INTO plot_fts (rowid, notes, owner)
+        SELECT new.id, new.notes, 'u' || girl.user_id FROM girl WHERE girl.id = new.girl_id;
+    END
+    """,
+    """
+    CREATE TRIGGER plot_fts_after_delete AFTER DELETE ON plot
+    BEGIN
+        DELETE FROM plot_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER plot_fts_after_update AFTER UPDATE OF notes, girl_id ON plot
+    BEGIN
+        DELETE FROM plot_fts WHERE rowid = old.id;
+        INSERT INTO plot_fts (rowid, notes, owner)
+        SELECT new.id, new.notes, 'u' || girl.user_id FROM girl
+        WHERE girl.id = new.girl_id AND new.notes IS NOT NULL AND new.notes != '';
+    END
+    """,
+]
+
+
+def upgrade():
+    # Other databases search with ILIKE instead (see app.search).
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute(
+        "CREATE VIRTUAL TABLE plot_fts USING fts5("
+        "notes, owner, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    for trigger in TRIGGERS:
+        op.execute(trigger)
+    op.execute(
+        "INSERT INTO plot_fts (rowid, notes, owner) "
+        "SELECT plot.id, plot.notes, 'u' || girl.user_id FROM plot JOIN girl ON girl.id = plot.girl_id "
+        "WHERE plot.notes IS NOT NULL AND plot.notes != ''"
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    for name in ('plot_fts_after_update', 'plot_fts_after_delete', 'plot_fts_after_insert'):
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.execute("DROP TABLE IF EXISTS plot_fts")
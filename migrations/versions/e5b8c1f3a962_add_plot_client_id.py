@@ -0,0 +1,28 @@
+"""Add a client-generated id to plot
+
+Revision ID: e5b8c1f3a962
+Revises: d7a3b9e2c410
+Create Date: 2026-10-17 13:05:12.418297
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b8c1f3a962'
+down_revision = 'd7a3b9e2c410'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain ALTER TABLE rather than batch mode: recreating plot would drop
+    # the triggers that keep plot_fts in sync.
+    op.add_column('plot', sa.Column('client_id', sa.String(length=36), nullable=True))
+    op.create_index('ix_plot_client_id', 'plot', ['client_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_plot_client_id', table_name='plot')
+    op.drop_column('plot', 'client_id')
@@ -0,0 +1,24 @@
+"""Add the shard a user's data lives on
+
+Revision ID: f2c6d8a4b195
+Revises: e5b8c1f3a962
+Create Date: 2026-10-17 15:42:07.530914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c6d8a4b195'
+down_revision = 'e5b8c1f3a962'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user', sa.Column('shard_id', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('user', 'shard_id')
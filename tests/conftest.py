@@ -0,0 +1,51 @@
+"""Fixtures: apps on scratch SQLite files and clients logged in as fresh users."""
+from contextlib import ExitStack
+
+import pytest
+
+from app import db
+from app.cli import logged_in_client, scratch_app
+from app.models import User
+
+
+# Cheap hashes inline; the tests aren't about password strength.
+TEST_CONFIG = {"PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000", "PASSWORD_HASH_WORKERS": 0}
+
+
+@pytest.fixture
+def make_app():
+    """Build scratch apps with config overrides; all are removed after the test."""
+    with ExitStack() as stack:
+        yield lambda **overrides: stack.enter_context(scratch_app("test", **{**TEST_CONFIG, **overrides}))
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+def create_user(app, username, password="password123"):
+    with app.app_context():
+        user = User(username=username)
+        user.set_password(password)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+@pytest.fixture
+def login(app):
+    """``login(username)`` creates a user and returns a test client logged in as them."""
+    return lambda username="alice": logged_in_client(app, create_user(app, username))
+
+
+def add_girl(client, name="Subject"):
+    response = client.post("/api/girls", json={"name": name})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()["id"]
+
+
+def add_plot(client, girl_id, hot=7, crazy=6, **fields):
+    response = client.post("/api/plots", json={"girl_id": girl_id, "hot_score": hot, "crazy_score": crazy, **fields})
+    assert response.status_code in (201, 202), response.get_json()
+    return response.get_json()
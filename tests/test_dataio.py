@@ -0,0 +1,89 @@
+"""Streaming export and bulk import."""
+import csv
+import io
+import json
+
+from conftest import add_girl, add_plot
+
+
+def test_ndjson_export_lists_every_plot_and_empty_girls(login):
+    client = login()
+    girl_id = add_girl(client, "Plotted")
+    add_plot(client, girl_id, hot=8, crazy=5, notes="first", plot_date="2024-01-01T12:00:00Z")
+    empty_id = add_girl(client, "Empty")
+
+    response = client.get("/api/export")
+
+    assert response.mimetype == "application/x-ndjson"
+    assert "attachment" in response.headers["Content-Disposition"]
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert rows[0] == {
+        "girl_id": girl_id, "girl_name": "Plotted", "plot_id": rows[0]["plot_id"], "hot_score": 8.0,
+        "crazy_score": 5.0, "notes": "first", "plot_date": "2024-01-01T12:00:00",
+    }
+    assert rows[1]["girl_id"] == empty_id and rows[1]["plot_id"] is None
+
+
+def test_csv_export_has_a_header_row(login):
+    client = login()
+    add_plot(client, add_girl(client))
+
+    response = client.get("/api/export?format=csv")
+
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert response.mimetype == "text/csv"
+    assert rows[0][:3] == ["girl_id", "girl_name", "plot_id"] and len(rows) == 2
+
+
+def test_export_rejects_unknown_formats(login):
+    assert login().get("/api/export?format=xml").status_code == 400
+
+
+def test_export_round_trips_through_import(login):
+    client = login()
+    girl_id = add_girl(client)
+    for day in (1, 2):
+        add_plot(client, girl_id, notes=f"day {day}", plot_date=f"2024-01-0{day}T12:00:00Z")
+    add_girl(client, "Empty")
+    exported = client.get("/api/export").get_data()
+
+    report = client.post("/api/plots/bulk", data=exported, content_type="application/x-ndjson").get_json()
+
+    assert report == {"inserted": 2, "skipped": 1, "error_count": 0, "errors": []}
+    assert len(client.get(f"/api/girls/{girl_id}/plots").get_json()) == 4
+    assert client.get(f"/api/averages?girl_ids={girl_id}").get_json()[str(girl_id)]["count"] == 4
+
+
+def test_import_reports_bad_rows_and_keeps_the_rest(login):
+    alice, bob = login("alice"), login("bob")
+    girl_id = add_girl(alice)
+    bob_girl = add_girl(bob)
+    body = "\n".join([
+        json.dumps({"girl_id": girl_id, "hot_score": 7, "crazy_score": 6}),
+        "{not json",
+        json.dumps({"girl_id": girl_id, "hot_score": 11, "crazy_score": 6}),
+        json.dumps({"girl_id": bob_girl, "hot_score": 7, "crazy_score": 6}),
+        "",
+        json.dumps({"girl_id": girl_id, "hot_score": 3, "crazy_score": 9, "notes": "kept"}),
+    ])
+
+    report = alice.post("/api/plots/bulk", data=body, content_type="application/x-ndjson").get_json()
+
+    assert report["inserted"] == 2 and report["error_count"] == 3
+    assert [error["row"] for error in report["errors"]] == [2, 3, 4]
+    assert len(bob.get(f"/api/girls/{bob_girl}/plots").get_json()) == 0
+
+
+def test_csv_import_uses_the_content_type(login):
+    client = login()
+    girl_id = add_girl(client)
+    body = f"girl_id,hot_score,crazy_score,notes\n{girl_id},6,7,\n{girl_id},x,7,bad\n"
+
+    report = client.post("/api/plots/bulk", data=body, content_type="text/csv").get_json()
+
+    assert report["inserted"] == 1 and report["errors"][0]["row"] == 2
+    assert client.get(f"/api/girls/{girl_id}/plots").get_json()[0]["notes"] is None
+
+
+def test_import_rejects_unknown_formats(login):
+    assert login().post("/api/plots/bulk?format=xml", data="").status_code == 400
@@ -0,0 +1,80 @@
+"""Live updates over Server-Sent Events."""
+import json
+
+from app import events
+from app.cli import logged_in_client
+from conftest import add_girl, create_user
+
+
+def read_event(chunks):
+    """The next ``data:`` message of a stream, skipping keep-alives."""
+    for chunk in chunks:
+        if chunk.startswith(b"data: "):
+            return json.loads(chunk[len(b"data: "):])
+    raise AssertionError("Stream ended without an event.")
+
+
+def test_brokers_deliver_to_the_users_subscriptions_only(app):
+    with app.app_context():
+        broker = app.extensions["events"]
+        alice, bob = broker.subscribe(1), broker.subscribe(2)
+        try:
+            events.publish(1, "resync")
+
+            assert json.loads(alice.get_message(1)) == {"type": "resync"}
+            assert bob.get_message(0.05) is None
+        finally:
+            alice.close()
+            bob.close()
+
+
+def test_spool_broker_reaches_subscribers_of_another_app(make_app, tmp_path):
+    publisher = make_app(EVENTS_SPOOL_DIR=str(tmp_path))
+    subscriber = make_app(EVENTS_SPOOL_DIR=str(tmp_path))
+    subscription = subscriber.extensions["events"].subscribe(1)
+    try:
+        with publisher.app_context():
+            events.publish(1, "plot_deleted", plot_id=3)
+
+        assert json.loads(subscription.get_message(2)) == {"type": "plot_deleted", "plot_id": 3}
+    finally:
+        subscription.close()
+
+
+def test_stream_carries_the_users_writes(make_app):
+    app = make_app(EVENTS_KEEPALIVE_SECONDS=1, EVENTS_STREAM_SECONDS=5)
+    user_id = create_user(app, "alice")
+    client = logged_in_client(app, user_id)
+    girl_id = add_girl(client)
+
+    response = client.get("/api/stream")
+    chunks = iter(response.response)
+    try:
+        assert response.mimetype == "text/event-stream"
+        assert response.headers["Cache-Control"] == "no-cache"
+        # The first chunk subscribes.
+        assert next(chunks).startswith(b"retry:")
+        plot_id = logged_in_client(app, user_id).post(
+            "/api/plots", json={"girl_id": girl_id, "hot_score": 8, "crazy_score": 5}
+        ).get_json()["id"]
+
+        event = read_event(chunks)
+        assert event["type"] == "plot_created"
+        assert event["plot"]["id"] == plot_id and event["averages"]["count"] == 1
+    finally:
+        response.close()
+
+
+def test_streams_beyond_the_limit_get_503(make_app):
+    app = make_app(EVENTS_MAX_STREAMS=1)
+    client = logged_in_client(app, create_user(app, "alice"))
+
+    first = client.get("/api/stream")
+    try:
+        second = client.get("/api/stream")
+        assert second.status_code == 503
+    finally:
+        first.close()
+    third = client.get("/api/stream")
+    third.close()
+    assert third.status_code == 200
@@ -0,0 +1,55 @@
+"""/api/heatmap score density grid."""
+from conftest import add_girl, add_plot
+
+
+def test_heatmap_counts_every_plot_once(login):
+    client = login()
+    first, second = add_girl(client, "First"), add_girl(client, "Second")
+    for hot, crazy in ((0, 4), (10, 10), (5, 7)):
+        add_plot(client, first, hot=hot, crazy=crazy)
+    add_plot(client, second, hot=10, crazy=4)
+
+    heatmap = client.get("/api/heatmap?hot_bins=2&crazy_bins=2").get_json()
+
+    assert heatmap["total"] == 4
+    assert heatmap["counts"] == [[1, 1], [0, 2]]
+    assert heatmap["max"] == 2
+    assert sum(heatmap["zones"].values()) + heatmap["unclassified"] == 4
+
+
+def test_heatmap_is_limited_to_the_given_girls_and_dates(login):
+    client = login()
+    first, second = add_girl(client, "First"), add_girl(client, "Second")
+    add_plot(client, first, plot_date="2024-01-01T12:00:00Z")
+    add_plot(client, first, plot_date="2024-02-01T12:00:00Z")
+    add_plot(client, second, plot_date="2024-01-01T12:00:00Z")
+
+    assert client.get(f"/api/heatmap?girl_ids={first}").get_json()["total"] == 2
+    assert client.get(f"/api/heatmap?girl_ids={first}&to=2024-01-15T00:00:00Z").get_json()["total"] == 1
+
+
+def test_heatmap_reflects_writes_despite_the_cache(login):
+    client = login()
+    girl_id = add_girl(client)
+    add_plot(client, girl_id)
+    assert client.get("/api/heatmap").get_json()["total"] == 1
+
+    add_plot(client, girl_id)
+
+    assert client.get("/api/heatmap").get_json()["total"] == 2
+
+
+def test_heatmap_skips_other_users_plots(login):
+    alice, bob = login("alice"), login("bob")
+    add_plot(bob, add_girl(bob))
+
+    heatmap = alice.get("/api/heatmap").get_json()
+
+    assert heatmap["total"] == 0 and heatmap["max"] == 0
+
+
+def test_heatmap_rejects_bins_out_of_range(login):
+    client = login()
+
+    for query in ("hot_bins=0", "crazy_bins=1000", "hot_bins=x"):
+        assert client.get(f"/api/heatmap?{query}").status_code == 400, query
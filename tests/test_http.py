@@ -0,0 +1,116 @@
+"""Cross-cutting HTTP behaviour: compression, hashed assets, profiling, metrics, identity cache."""
+import gzip
+
+from sqlalchemy import text
+
+from app import assets, db
+from app.cli import logged_in_client
+from app.models import User
+from conftest import add_girl, add_plot, create_user
+
+
+def test_large_json_is_gzipped_for_clients_that_accept_it(login):
+    client = login()
+    girl_id = add_girl(client)
+    for day in range(1, 21):
+        add_plot(client, girl_id, notes=f"note number {day}", plot_date=f"2024-01-{day:02d}T12:00:00Z")
+    plain = client.get(f"/api/girls/{girl_id}/plots")
+
+    compressed = client.get(f"/api/girls/{girl_id}/plots", headers={"Accept-Encoding": "gzip"})
+
+    assert plain.headers.get("Content-Encoding") is None
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    assert gzip.decompress(compressed.data) == plain.data
+
+
+def test_small_and_html_responses_are_sent_as_is(login):
+    client = login()
+    add_girl(client)
+
+    for url in ("/api/girls", "/"):
+        response = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200 and "Content-Encoding" not in response.headers, url
+
+
+def test_streamed_exports_are_compressed(login):
+    client = login()
+    add_plot(client, add_girl(client))
+    plain = client.get("/api/export").data
+
+    compressed = client.get("/api/export", headers={"Accept-Encoding": "gzip"})
+
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(compressed.data) == plain
+
+
+def test_hashed_assets_are_served_immutable_and_precompressed(make_app, tmp_path):
+    static_dir, dist_dir = tmp_path / "static", tmp_path / "dist"
+    (static_dir / "js").mkdir(parents=True)
+    (static_dir / "js" / "app.js").write_text("console.log('hot crazy matrix');\n" * 100)
+    builder = make_app()
+    with builder.app_context():
+        manifest = assets.build(str(static_dir), str(dist_dir))
+    app = make_app(ASSETS_DIST_DIR=str(dist_dir))
+    client = app.test_client()
+
+    with app.test_request_context():
+        url = assets.asset_url("js/app.js")
+        assert url == f"/assets/{manifest['js/app.js']}"
+        assert assets.asset_url("css/style.css").startswith("/static/")
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Cache-Control"] == assets.IMMUTABLE
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data) == (static_dir / "js" / "app.js").read_bytes()
+    response.close()
+    assert client.get(f"/assets/{assets.MANIFEST}").status_code == 404
+    assert client.get("/assets/js/missing.0123456789.js").status_code == 404
+
+
+def test_profiling_adds_server_timing(make_app):
+    app = make_app(PROFILING_ENABLED=True)
+    client = logged_in_client(app, create_user(app, "alice"))
+
+    timing = client.get("/api/girls").headers["Server-Timing"]
+
+    assert timing.startswith("sql;dur=") and "total;dur=" in timing
+
+
+def test_profiling_is_off_by_default(login):
+    assert "Server-Timing" not in login().get("/api/girls").headers
+
+
+def test_metrics_are_off_by_default(app):
+    assert app.test_client().get("/metrics").status_code == 404
+
+
+def test_metrics_require_the_token(make_app):
+    app = make_app(METRICS_ENABLED=True, METRICS_TOKEN="s3cret")
+    client = app.test_client()
+
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert b"http_request" in response.data
+
+
+def test_password_changes_drop_the_cached_identity(app):
+    user_id = create_user(app, "alice")
+    client = logged_in_client(app, user_id)
+    client.get("/api/girls")
+    cache = app.extensions["identity_cache"]
+    assert cache.get(user_id) is not None
+
+    with app.app_context():
+        db.session.get(User, user_id).set_password("new-password")
+        db.session.commit()
+
+    assert cache.get(user_id) is None
+    assert client.get("/api/girls").status_code == 200
+
+
+def test_sqlite_connections_use_wal(app):
+    with app.app_context():
+        assert db.session.execute(text("PRAGMA journal_mode")).scalar() == "wal"
@@ -0,0 +1,75 @@
+"""Write-behind plot creation (INGEST_WRITE_BEHIND)."""
+import uuid
+
+import pytest
+
+from conftest import add_girl, add_plot
+
+
+@pytest.fixture
+def app(make_app):
+    # Nothing is flushed unless a test asks for it.
+    return make_app(INGEST_WRITE_BEHIND=True, INGEST_FLUSH_INTERVAL_MS=3_600_000)
+
+
+def flush(app):
+    with app.app_context():
+        app.extensions["ingest"].flush()
+
+
+def test_journaled_plot_is_acknowledged_and_listed_before_the_flush(app, login):
+    client = login()
+    girl_id = add_girl(client)
+    client_id = str(uuid.uuid4())
+
+    created = add_plot(client, girl_id, client_id=client_id)
+    assert created == {"id": None, "client_id": client_id, "pending": True}
+
+    listed = client.get(f"/api/girls/{girl_id}/plots").get_json()
+    assert [(plot["id"], plot["client_id"]) for plot in listed] == [(None, client_id)]
+
+    flush(app)
+    listed = client.get(f"/api/girls/{girl_id}/plots").get_json()
+    assert len(listed) == 1 and listed[0]["id"] is not None
+
+
+def test_pending_plots_change_the_etag(app, login):
+    client = login()
+    girl_id = add_girl(client)
+    etag = client.get(f"/api/girls/{girl_id}/plots").headers["ETag"]
+
+    add_plot(client, girl_id, client_id=str(uuid.uuid4()))
+
+    assert client.get(f"/api/girls/{girl_id}/plots", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_replaying_a_flushed_client_id_inserts_nothing(app, login):
+    client = login()
+    girl_id = add_girl(client)
+    client_id = str(uuid.uuid4())
+    add_plot(client, girl_id, client_id=client_id)
+    flush(app)
+    add_plot(client, girl_id, client_id=client_id)
+    flush(app)
+
+    assert len(client.get(f"/api/girls/{girl_id}/plots").get_json()) == 1
+
+
+def test_paginated_plots_include_pending_ones_on_the_page_they_sort_into(app, login):
+    client = login()
+    girl_id = add_girl(client)
+    for day in (1, 2, 3):
+        add_plot(client, girl_id, plot_date=f"2024-01-0{day}T12:00:00Z", client_id=str(uuid.uuid4()))
+    flush(app)
+    early = str(uuid.uuid4())
+    late = str(uuid.uuid4())
+    add_plot(client, girl_id, plot_date="2024-01-01T18:00:00Z", client_id=early)
+    add_plot(client, girl_id, plot_date="2024-01-05T12:00:00Z", client_id=late)
+
+    first = client.get(f"/api/girls/{girl_id}/plots?limit=2").get_json()
+    assert [plot.get("client_id") for plot in first["plots"]][1] == early
+    assert len(first["plots"]) == 3 and first["next"]
+
+    second = client.get(f"/api/girls/{girl_id}/plots?limit=2&after={first['next']}").get_json()
+    assert [plot["date"][:10] for plot in second["plots"]] == ["2024-01-03", "2024-01-05"]
+    assert second["plots"][-1]["client_id"] == late and second["next"] is None
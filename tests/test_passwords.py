@@ -0,0 +1,32 @@
+"""Password hashing on the bounded pool, and rehashing on login."""
+from app import db
+from app.models import User
+from conftest import create_user
+
+
+def test_login_rehashes_a_password_made_with_other_settings(make_app):
+    app = make_app(PASSWORD_HASH_WORKERS=1)
+    create_user(app, "alice")
+    app.extensions["password_hasher"].method = "pbkdf2:sha256:2000"
+
+    response = app.test_client().post("/auth/login", data={"username": "alice", "password": "password123"})
+
+    assert response.status_code == 302 and response.headers["Location"].endswith("/")
+    with app.app_context():
+        assert db.session.scalar(db.select(User.password_hash)).startswith("pbkdf2:sha256:2000$")
+
+
+def test_logins_beyond_the_pending_limit_are_shed_at_once(make_app):
+    app = make_app(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_MAX_PENDING=1)
+    create_user(app, "alice")
+    hasher = app.extensions["password_hasher"]
+    # Another login holds the only slot.
+    hasher._slots.acquire()
+    try:
+        response = app.test_client().post("/auth/login", data={"username": "alice", "password": "password123"})
+    finally:
+        hasher._slots.release()
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert app.test_client().post("/auth/login", data={"username": "alice", "password": "password123"}).status_code == 302
@@ -0,0 +1,105 @@
+"""Plot lists: the batch endpoint, keyset pages and the columnar format."""
+from conftest import add_girl, add_plot
+
+
+def add_days(client, girl_id, days):
+    return [add_plot(client, girl_id, hot=day % 10 + 1, plot_date=f"2024-01-{day:02d}T12:00:00Z")["id"] for day in days]
+
+
+def test_batch_groups_plots_by_girl_and_drops_other_users_girls(login):
+    alice, bob = login("alice"), login("bob")
+    first, second = add_girl(alice, "First"), add_girl(alice, "Second")
+    add_days(alice, first, (1, 2))
+    add_days(alice, second, (3,))
+    bob_girl = add_girl(bob)
+    add_plot(bob, bob_girl)
+
+    grouped = alice.get(f"/api/plots?girl_ids={first},{second},{bob_girl}").get_json()
+
+    assert sorted(grouped) == sorted([str(first), str(second)])
+    assert [plot["date"][:10] for plot in grouped[str(first)]] == ["2024-01-01", "2024-01-02"]
+    assert len(grouped[str(second)]) == 1
+
+
+def test_batch_rejects_malformed_girl_ids(login):
+    client = login()
+
+    assert client.get("/api/plots?girl_ids=1,two").status_code == 400
+    assert client.get("/api/plots").get_json() == {}
+
+
+def test_pages_cover_every_plot_once_in_both_directions(login):
+    client = login()
+    girl_id = add_girl(client)
+    ids = add_days(client, girl_id, range(1, 8))
+
+    seen, cursor = [], None
+    while True:
+        page = client.get(f"/api/girls/{girl_id}/plots?limit=3" + (f"&after={cursor}" if cursor else "")).get_json()
+        seen += [plot["id"] for plot in page["plots"]]
+        cursor = page["next"]
+        if cursor is None:
+            break
+    assert seen == ids
+
+    back = client.get(f"/api/girls/{girl_id}/plots?limit=3&before={page['prev']}").get_json()
+    assert [plot["id"] for plot in back["plots"]] == ids[-4:-1]
+    forward = client.get(f"/api/girls/{girl_id}/plots?limit=3&after={back['next']}").get_json()
+    assert [plot["id"] for plot in forward["plots"]] == ids[-1:]
+
+
+def test_pages_honour_the_date_window(login):
+    client = login()
+    girl_id = add_girl(client)
+    add_days(client, girl_id, range(1, 6))
+
+    page = client.get(f"/api/girls/{girl_id}/plots?limit=10&from=2024-01-02T00:00:00Z&to=2024-01-04T00:00:00Z").get_json()
+
+    assert [plot["date"][:10] for plot in page["plots"]] == ["2024-01-02", "2024-01-03"]
+    assert page["next"] is None
+
+
+def test_invalid_page_parameters_are_rejected(login):
+    client = login()
+    girl_id = add_girl(client)
+    cursor = client.get(f"/api/girls/{girl_id}/plots?limit=1").get_json()["next"] or "x"
+
+    for query in ("limit=0", "limit=5001", "limit=ten", "after=not-a-cursor", f"after={cursor}&before={cursor}"):
+        assert client.get(f"/api/girls/{girl_id}/plots?{query}").status_code == 400, query
+
+
+def test_plots_with_the_same_date_are_ordered_by_id(login):
+    client = login()
+    girl_id = add_girl(client)
+    ids = [add_plot(client, girl_id, hot=hot, plot_date="2024-01-01T12:00:00Z")["id"] for hot in (3, 9, 5)]
+
+    listed = client.get(f"/api/girls/{girl_id}/plots").get_json()
+    columns = client.get(f"/api/girls/{girl_id}/plots?format=columnar").get_json()
+    pages = [client.get(f"/api/girls/{girl_id}/plots?limit=1").get_json()]
+    while pages[-1]["next"]:
+        pages.append(client.get(f"/api/girls/{girl_id}/plots?limit=1&after={pages[-1]['next']}").get_json())
+
+    assert [plot["id"] for plot in listed] == ids
+    assert columns["ids"] == ids
+    assert [plot["id"] for page in pages for plot in page["plots"]] == ids
+
+
+def test_columnar_format_matches_the_plot_list(login):
+    client = login()
+    girl_id = add_girl(client)
+    add_days(client, girl_id, (1, 2, 3))
+
+    listed = client.get(f"/api/girls/{girl_id}/plots").get_json()
+    columns = client.get(f"/api/girls/{girl_id}/plots?format=columnar").get_json()
+    batch = client.get(f"/api/plots?girl_ids={girl_id}&format=columnar").get_json()[str(girl_id)]
+
+    assert columns["ids"] == [plot["id"] for plot in listed]
+    assert columns["hot"] == [plot["x"] for plot in listed]
+    assert batch == columns
+
+
+def test_columnar_format_cannot_be_paginated(login):
+    client = login()
+    girl_id = add_girl(client)
+
+    assert client.get(f"/api/girls/{girl_id}/plots?format=columnar&limit=10").status_code == 400
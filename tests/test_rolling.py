@@ -0,0 +1,100 @@
+"""Incrementally maintained EWMA and /api/rolling."""
+import threading
+import time
+
+import pytest
+from sqlalchemy import select
+
+from app import db, rolling
+from app.cli import logged_in_client
+from app.models import GirlStats, Plot
+from conftest import add_girl, add_plot, create_user
+
+
+def stored_ewma(app, girl_id):
+    with app.app_context():
+        stats = db.session.get(GirlStats, girl_id)
+        return stats.ewma_hot, stats.ewma_crazy
+
+
+def folded_ewma(app, girl_id):
+    """The EWMA recomputed from scratch, in (plot_date, id) order."""
+    with app.app_context():
+        alpha = app.config["ROLLING_EWMA_ALPHA"]
+        state = None
+        for hot, crazy in db.session.execute(
+            select(Plot.hot_score, Plot.crazy_score).where(Plot.girl_id == girl_id).order_by(Plot.plot_date, Plot.id)
+        ):
+            state = (hot, crazy) if state is None else (alpha * hot + (1 - alpha) * state[0],
+                                                        alpha * crazy + (1 - alpha) * state[1])
+        return state
+
+
+def test_ewma_follows_creates_backdated_plots_edits_and_deletes(app, login):
+    client = login()
+    girl_id = add_girl(client)
+    for day, hot in ((1, 5), (2, 9), (4, 3)):
+        add_plot(client, girl_id, hot=hot, plot_date=f"2024-01-0{day}T12:00:00Z")
+    assert stored_ewma(app, girl_id) == pytest.approx(folded_ewma(app, girl_id))
+
+    backdated = add_plot(client, girl_id, hot=10, crazy=9, plot_date="2024-01-03T12:00:00Z")["id"]
+    assert stored_ewma(app, girl_id) == pytest.approx(folded_ewma(app, girl_id))
+
+    assert client.put(f"/api/plots/{backdated}", json={"hot_score": 1}).status_code == 200
+    assert stored_ewma(app, girl_id) == pytest.approx(folded_ewma(app, girl_id))
+
+    assert client.delete(f"/api/plots/{backdated}").status_code == 204
+    assert stored_ewma(app, girl_id) == pytest.approx(folded_ewma(app, girl_id))
+
+
+def test_rolling_windows(app, login):
+    client = login()
+    girl_id = add_girl(client)
+    for hot in (2, 4, 6, 8):
+        add_plot(client, girl_id, hot=hot)
+
+    metrics = client.get(f"/api/rolling?girl_ids={girl_id}&plots=2&days=1").get_json()[str(girl_id)]
+
+    assert metrics["last_plots"] == {"window": 2, "count": 2, "avg_hot": 7.0, "avg_crazy": 6.0}
+    assert metrics["last_days"]["count"] == 4
+    assert metrics["ewma"]["hot"] == pytest.approx(folded_ewma(app, girl_id)[0], abs=0.01)
+
+
+def test_rolling_rejects_windows_out_of_range(login):
+    client = login()
+    girl_id = add_girl(client)
+
+    assert client.get(f"/api/rolling?girl_ids={girl_id}&plots=0").status_code == 400
+
+
+def test_interleaved_creates_for_one_girl_both_reach_the_ewma(app, monkeypatch):
+    user_id = create_user(app, "alice")
+    first, second = logged_in_client(app, user_id), logged_in_client(app, user_id)
+    girl_id = add_girl(first)
+    add_plot(first, girl_id, hot=5, crazy=5)
+
+    folding = threading.Event()
+    resume = threading.Event()
+    fold = rolling._fold
+
+    def paused_fold(*args):
+        # The first request stops between reading the state and writing it back.
+        if threading.current_thread().name == "first":
+            folding.set()
+            resume.wait(5)
+        return fold(*args)
+
+    monkeypatch.setattr(rolling, "_fold", paused_fold)
+    threads = [
+        threading.Thread(target=add_plot, args=(first, girl_id, 9, 9), name="first"),
+        threading.Thread(target=add_plot, args=(second, girl_id, 1, 4), name="second"),
+    ]
+    threads[0].start()
+    assert folding.wait(5)
+    threads[1].start()
+    time.sleep(0.3)
+    resume.set()
+    for thread in threads:
+        thread.join(10)
+
+    assert stored_ewma(app, girl_id) == pytest.approx(folded_ewma(app, girl_id))
@@ -0,0 +1,13 @@
+"""Run the `flask check` consistency checks as part of the test suite."""
+from app.cli import fts_schema_differences, query_plan_failures
+
+
+def test_api_queries_use_indexes():
+    count, failures = query_plan_failures()
+    assert count, "the replayed requests ran no SQL"
+    assert not failures, "Table scans found:\n" + "\n".join(failures)
+
+
+def test_shard_fts_schema_matches_migration():
+    differences = fts_schema_differences()
+    assert not differences, "\n".join(differences)
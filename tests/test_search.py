@@ -0,0 +1,65 @@
+"""/api/search over the FTS5 notes index."""
+from conftest import add_girl, add_plot
+
+
+def collect(client, query, limit):
+    """Every result of a search, page by page; returns the plot ids in order."""
+    ids, after = [], None
+    while True:
+        url = f"/api/search?q={query}&limit={limit}" + (f"&after={after}" if after else "")
+        page = client.get(url).get_json()
+        ids += [result["plot_id"] for result in page["results"]]
+        after = page["next"]
+        if after is None:
+            return ids
+
+
+def test_search_ranks_and_highlights_only_the_users_notes(login):
+    alice, bob = login("alice"), login("bob")
+    girl_id = add_girl(alice)
+    add_plot(alice, girl_id, notes="dinner <b>was</b> great")
+    add_plot(alice, girl_id, notes="great great dinner")
+    add_plot(bob, add_girl(bob), notes="great dinner too")
+
+    results = alice.get("/api/search?q=great").get_json()["results"]
+
+    assert [result["highlight"] for result in results] == [
+        "<mark>great</mark> <mark>great</mark> dinner",
+        "dinner &lt;b&gt;was&lt;/b&gt; <mark>great</mark>",
+    ]
+
+
+def test_search_requires_a_term(login):
+    client = login()
+    assert client.get("/api/search?q=%20").status_code == 400
+    assert client.get("/api/search?q=x&sort=oldest").status_code == 400
+
+
+def test_relevance_pages_stay_in_step_when_other_users_write_between_them(login):
+    alice, bob = login("alice"), login("bob")
+    girl_id = add_girl(alice)
+    for words in range(1, 7):
+        add_plot(alice, girl_id, notes="apple " + "pie " * words)
+    everything = collect(alice, "apple", 10)
+
+    first = alice.get("/api/search?q=apple&limit=3").get_json()
+    # Bob's notes change the index statistics behind every bm25 score.
+    bob_girl = add_girl(bob)
+    for _ in range(20):
+        add_plot(bob, bob_girl, notes="apple")
+    second = alice.get(f"/api/search?q=apple&limit=3&after={first['next']}").get_json()
+
+    ids = [result["plot_id"] for result in first["results"] + second["results"]]
+    assert ids == everything and second["next"] is None
+
+
+def test_newest_first_pages_exactly_while_the_user_writes(login):
+    client = login()
+    girl_id = add_girl(client)
+    created = [add_plot(client, girl_id, notes=f"apple {index}")["id"] for index in range(5)]
+
+    first = client.get("/api/search?q=apple&limit=2&sort=newest").get_json()
+    add_plot(client, girl_id, notes="apple late")
+    rest = client.get(f"/api/search?q=apple&limit=10&sort=newest&after={first['next']}").get_json()
+
+    assert [result["plot_id"] for result in first["results"] + rest["results"]] == created[::-1]
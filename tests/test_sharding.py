@@ -0,0 +1,118 @@
+"""Per-user shards and moving users between them."""
+import uuid
+
+import pytest
+from sqlalchemy import func, select, update
+
+from app import db, sharding
+from app.cli import logged_in_client
+from app.models import Plot, User
+from conftest import add_girl, add_plot, create_user
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(SHARD_COUNT=2)
+
+
+def plots_on(app, shard):
+    with app.app_context(), sharding.use_shard(shard):
+        return db.session.scalar(select(func.count()).select_from(Plot))
+
+
+def move(app, user_id):
+    """Move the user to the other shard; returns ``(source, target)``."""
+    with app.app_context():
+        source = sharding.shard_of(user_id)
+        sharding.move_user(user_id, 1 - source)
+        return source, 1 - source
+
+
+def test_users_data_lives_on_their_shard(app):
+    user_id = create_user(app, "alice")
+    client = logged_in_client(app, user_id)
+    girl_id = add_girl(client)
+    add_plot(client, girl_id)
+    add_plot(client, girl_id)
+
+    with app.app_context():
+        shard = sharding.shard_of(user_id)
+    assert (plots_on(app, shard), plots_on(app, 1 - shard)) == (2, 0)
+    assert client.get(f"/api/averages?girl_ids={girl_id}").get_json()[str(girl_id)]["count"] == 2
+
+
+def test_moved_users_are_served_from_the_new_shard(app):
+    user_id = create_user(app, "alice")
+    client = logged_in_client(app, user_id)
+    add_plot(client, add_girl(client), notes="moved along")
+    etag = client.get("/api/girls").headers["ETag"]
+
+    source, target = move(app, user_id)
+
+    assert (plots_on(app, source), plots_on(app, target)) == (0, 1)
+    girls = client.get("/api/girls", headers={"If-None-Match": etag})
+    assert girls.status_code == 200
+    girl_id = girls.get_json()[0]["id"]
+    assert [plot["notes"] for plot in client.get(f"/api/girls/{girl_id}/plots").get_json()] == ["moved along"]
+    assert client.get("/api/search?q=moved").get_json()["results"]
+    add_plot(client, girl_id)
+    assert plots_on(app, target) == 2
+
+
+def test_a_stale_shard_id_follows_the_tombstone(app):
+    user_id = create_user(app, "alice")
+    client = logged_in_client(app, user_id)
+    add_plot(client, add_girl(client))
+    source, target = move(app, user_id)
+    with app.app_context():
+        # As if this worker still had the user's old row.
+        db.session.execute(update(User).where(User.id == user_id).values(shard_id=source))
+        db.session.commit()
+
+    girl_id = client.get("/api/girls").get_json()[0]["id"]
+    add_plot(client, girl_id)
+
+    assert (plots_on(app, source), plots_on(app, target)) == (0, 2)
+
+
+def test_writes_are_refused_while_the_user_is_moving(app):
+    user_id = create_user(app, "alice")
+    client = logged_in_client(app, user_id)
+    girl_id = add_girl(client)
+    with app.app_context():
+        engine = sharding._engine(sharding.shard_of(user_id))
+    sharding._set_moving(engine, user_id, True)
+    try:
+        response = client.post("/api/plots", json={"girl_id": girl_id, "hot_score": 7, "crazy_score": 6})
+        assert response.status_code == 503 and response.headers["Retry-After"] == "5"
+        assert client.get("/api/girls").status_code == 200
+    finally:
+        sharding._set_moving(engine, user_id, False)
+    add_plot(client, girl_id)
+
+
+def test_journaled_plots_follow_their_girl_to_the_new_shard(make_app):
+    app = make_app(SHARD_COUNT=2, INGEST_WRITE_BEHIND=True, INGEST_FLUSH_INTERVAL_MS=3_600_000)
+    user_id = create_user(app, "alice")
+    client = logged_in_client(app, user_id)
+    girl_id = add_girl(client)
+    add_plot(client, girl_id, client_id=str(uuid.uuid4()))
+
+    source, target = move(app, user_id)
+    with app.app_context():
+        app.extensions["ingest"].flush()
+
+    assert (plots_on(app, source), plots_on(app, target)) == (0, 1)
+    new_girl_id = client.get("/api/girls").get_json()[0]["id"]
+    assert len(client.get(f"/api/girls/{new_girl_id}/plots").get_json()) == 1
+
+
+def test_rebalance_moves_users_from_the_fullest_shard():
+    loads = {0: {1: 50, 2: 40, 3: 10}, 1: {4: 5}}
+
+    moves = sharding.plan_rebalance(loads, tolerance=0.5)
+
+    assert moves == [(1, 0, 1, 50)]
+    assert sharding.plan_rebalance({0: {1: 10}, 1: {2: 9}}, tolerance=0.5) == []
+    # A single user can't be split, however uneven the shards are.
+    assert sharding.plan_rebalance({0: {1: 100}, 1: {}}, tolerance=0.1) == []
@@ -0,0 +1,111 @@
+"""girl_stats upkeep behind /api/averages, and set-based deletion."""
+import numpy as np
+import pytest
+from sqlalchemy import func, select
+
+from app import db, deletion
+from app.cli import logged_in_client
+from app.models import Girl, GirlStats, Plot, User
+from conftest import add_girl, add_plot, create_user
+
+
+def expected_averages(points):
+    hot, crazy = np.array(points, dtype=float).T
+    return {
+        "avg_hot": round(hot.mean(), 2),
+        "avg_crazy": round(crazy.mean(), 2),
+        "var_hot": round(hot.var(), 2),
+        "var_crazy": round(crazy.var(), 2),
+        "count": len(points),
+    }
+
+
+def row_counts(app):
+    with app.app_context():
+        return tuple(db.session.scalar(select(func.count()).select_from(model)) for model in (Girl, Plot, GirlStats))
+
+
+def test_averages_follow_creates_updates_and_deletes(login):
+    client = login()
+    girl_id = add_girl(client)
+    ids = [add_plot(client, girl_id, hot=hot, crazy=crazy)["id"] for hot, crazy in ((4, 6), (8, 4), (9, 7))]
+    assert client.get(f"/api/averages?girl_ids={girl_id}").get_json()[str(girl_id)] == pytest.approx(
+        expected_averages([(4, 6), (8, 4), (9, 7)])
+    )
+
+    assert client.put(f"/api/plots/{ids[1]}", json={"hot_score": 2, "crazy_score": 10}).status_code == 200
+    assert client.delete(f"/api/plots/{ids[0]}").status_code == 204
+
+    averages = client.get(f"/api/averages?girl_ids={girl_id}").get_json()
+    assert averages[str(girl_id)] == pytest.approx(expected_averages([(2, 10), (9, 7)]))
+
+
+def test_averages_omit_girls_without_plots(login):
+    client = login()
+    girl_id = add_girl(client)
+    plot_id = add_plot(client, girl_id)["id"]
+    client.delete(f"/api/plots/{plot_id}")
+
+    assert client.get(f"/api/averages?girl_ids={girl_id}").get_json() == {}
+
+
+def test_deleting_a_girl_removes_her_plots_and_summary(app, login):
+    client = login()
+    kept, deleted = add_girl(client, "Kept"), add_girl(client, "Deleted")
+    add_plot(client, kept)
+    for _ in range(3):
+        add_plot(client, deleted)
+
+    assert client.delete(f"/api/girls/{deleted}").status_code == 204
+
+    assert row_counts(app) == (1, 1, 1)
+    assert client.delete(f"/api/girls/{deleted}").status_code == 404
+
+
+def test_other_users_cannot_delete_a_girl(app, login):
+    alice, bob = login("alice"), login("bob")
+    girl_id = add_girl(alice)
+    add_plot(alice, girl_id)
+
+    assert bob.delete(f"/api/girls/{girl_id}").status_code == 403
+    assert row_counts(app) == (1, 1, 1)
+
+
+def test_small_accounts_are_deleted_inside_the_request(app, login):
+    client = login()
+    add_plot(client, add_girl(client))
+
+    response = client.post("/auth/delete_account", data={"password": "password123"})
+
+    assert response.status_code == 302
+    assert row_counts(app) == (0, 0, 0)
+    with app.app_context():
+        assert db.session.scalar(select(func.count()).select_from(User)) == 0
+
+
+def test_wrong_password_keeps_the_account(app, login):
+    client = login()
+    add_plot(client, add_girl(client))
+
+    client.post("/auth/delete_account", data={"password": "wrong-password"})
+
+    assert row_counts(app) == (1, 1, 1)
+
+
+def test_large_accounts_are_purged_in_batches(make_app, monkeypatch):
+    app = make_app(ACCOUNT_DELETE_INLINE_MAX_PLOTS=2, ACCOUNT_PURGE_BATCH_SIZE=2)
+    client = logged_in_client(app, create_user(app, "alice"))
+    girl_id = add_girl(client)
+    for _ in range(5):
+        add_plot(client, girl_id)
+    # Run the purge here rather than on the background thread.
+    monkeypatch.setattr(deletion, "start_background_purge", lambda: None)
+
+    client.post("/auth/delete_account", data={"password": "password123"})
+
+    with app.app_context():
+        assert db.session.scalar(select(User.pending_deletion)) is not None
+        assert deletion.purge_pending_accounts() == 1
+        assert db.session.scalar(select(func.count()).select_from(User)) == 0
+    assert row_counts(app) == (0, 0, 0)
+    assert client.get("/api/girls").status_code != 200
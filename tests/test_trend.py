@@ -0,0 +1,78 @@
+"""/api/girls/<id>/trend: SQL buckets and LTTB downsampling."""
+import numpy as np
+
+from app import analytics
+from conftest import add_girl, add_plot
+
+
+def test_buckets_aggregate_each_day(login):
+    client = login()
+    girl_id = add_girl(client)
+    for day, hot in ((1, 2), (1, 6), (2, 9)):
+        add_plot(client, girl_id, hot=hot, plot_date=f"2024-01-0{day}T0{hot}:00:00Z")
+
+    trend = client.get(f"/api/girls/{girl_id}/trend?bucket=day").get_json()
+
+    assert trend["bucket"] == "day"
+    assert [(bucket["start"][:10], bucket["count"]) for bucket in trend["buckets"]] == [
+        ("2024-01-01", 2), ("2024-01-02", 1),
+    ]
+    assert trend["buckets"][0]["hot"] == {"mean": 4.0, "min": 2, "max": 6}
+
+
+def test_buckets_honour_the_date_window(login):
+    client = login()
+    girl_id = add_girl(client)
+    for day in (1, 8, 15):
+        add_plot(client, girl_id, plot_date=f"2024-01-{day:02d}T12:00:00Z")
+
+    trend = client.get(f"/api/girls/{girl_id}/trend?bucket=week&from=2024-01-05T00:00:00Z").get_json()
+
+    assert sum(bucket["count"] for bucket in trend["buckets"]) == 2
+
+
+def test_invalid_trend_parameters_are_rejected(login):
+    client = login()
+    girl_id = add_girl(client)
+
+    for query in ("bucket=hour", "mode=spline", "mode=lttb&max_points=2", "mode=lttb&max_points=many"):
+        assert client.get(f"/api/girls/{girl_id}/trend?{query}").status_code == 400, query
+
+
+def test_lttb_returns_short_series_whole(login):
+    client = login()
+    girl_id = add_girl(client)
+    for day in (1, 2, 3):
+        add_plot(client, girl_id, plot_date=f"2024-01-0{day}T12:00:00Z")
+
+    trend = client.get(f"/api/girls/{girl_id}/trend?mode=lttb&max_points=3").get_json()
+
+    assert trend["total"] == 3 and len(trend["plots"]) == 3
+
+
+def test_lttb_keeps_the_ends_and_the_spike(login):
+    client = login()
+    girl_id = add_girl(client)
+    ids = [
+        add_plot(client, girl_id, hot=10 if day == 9 else 5, plot_date=f"2024-01-{day:02d}T12:00:00Z")["id"]
+        for day in range(1, 21)
+    ]
+
+    trend = client.get(f"/api/girls/{girl_id}/trend?mode=lttb&max_points=5").get_json()
+
+    sampled = [plot["id"] for plot in trend["plots"]]
+    assert trend["total"] == 20 and len(sampled) == 5
+    assert sampled[0] == ids[0] and sampled[-1] == ids[-1]
+    assert ids[8] in sampled
+    assert sampled == sorted(sampled)
+
+
+def test_lttb_picks_sorted_indices_within_the_threshold():
+    times = np.arange(100, dtype=float)
+    values = np.sin(times / 7)
+
+    indices = analytics.lttb(times, values, 10)
+
+    assert len(indices) == 10
+    assert indices[0] == 0 and indices[-1] == 99
+    assert list(indices) == sorted(set(indices))
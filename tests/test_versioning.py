@@ -0,0 +1,57 @@
+"""ETags and 304 Not Modified on the JSON API."""
+from conftest import add_girl, add_plot
+
+
+def test_unchanged_data_is_answered_with_304(login):
+    client = login()
+    girl_id = add_girl(client)
+    add_plot(client, girl_id)
+    response = client.get(f"/api/averages?girl_ids={girl_id}")
+    etag = response.headers["ETag"]
+
+    again = client.get(f"/api/averages?girl_ids={girl_id}", headers={"If-None-Match": etag})
+
+    assert etag.startswith("W/")
+    assert again.status_code == 304 and again.data == b""
+    assert again.headers["ETag"] == etag
+    assert again.headers["Cache-Control"] == "private, no-cache"
+
+
+def test_writes_change_the_etag(login):
+    client = login()
+    girl_id = add_girl(client)
+    plot_id = add_plot(client, girl_id)["id"]
+    urls = ("/api/girls", f"/api/girls/{girl_id}/plots", f"/api/plots?girl_ids={girl_id}")
+
+    for write in (
+        lambda: add_plot(client, girl_id),
+        lambda: client.put(f"/api/plots/{plot_id}", json={"notes": "edited"}),
+        lambda: client.delete(f"/api/plots/{plot_id}"),
+        lambda: client.put(f"/api/girls/{girl_id}", json={"name": "Renamed"}),
+    ):
+        etags = {url: client.get(url).headers["ETag"] for url in urls}
+        write()
+        for url, etag in etags.items():
+            assert client.get(url, headers={"If-None-Match": etag}).status_code == 200, url
+
+
+def test_writes_to_one_girl_keep_the_etag_of_another(login):
+    client = login()
+    first, second = add_girl(client, "First"), add_girl(client, "Second")
+    etag = client.get(f"/api/girls/{second}/plots").headers["ETag"]
+
+    add_plot(client, first)
+
+    assert client.get(f"/api/girls/{second}/plots", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_another_users_girl_is_forbidden_even_with_a_matching_etag(login):
+    alice, bob = login("alice"), login("bob")
+    girl_id = add_girl(alice)
+    etag = alice.get(f"/api/girls/{girl_id}/plots").headers["ETag"]
+
+    response = bob.get(f"/api/girls/{girl_id}/plots", headers={"If-None-Match": etag})
+
+    assert response.status_code == 403
+    assert "ETag" not in response.headers
+    assert alice.get("/api/girls/999/plots").status_code == 404
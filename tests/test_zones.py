@@ -0,0 +1,44 @@
+"""/api/zones and the zone polygons."""
+import numpy as np
+
+from app import zones
+from conftest import add_girl, add_plot
+
+
+def test_zones_classify_the_average_without_reading_plots(login):
+    client = login()
+    girl_id = add_girl(client)
+    add_plot(client, girl_id, hot=9, crazy=5)
+    add_plot(client, girl_id, hot=9, crazy=6)
+
+    result = client.get(f"/api/zones?girl_ids={girl_id}").get_json()[str(girl_id)]
+
+    expected = zones.zone_for(zones.classify(np.array([9.0]), np.array([5.5]))[0])
+    assert result["zone"] == (expected.key if expected else None)
+    assert (result["avg_hot"], result["avg_crazy"]) == (9.0, 5.5)
+    assert "histogram" not in result
+
+
+def test_zone_histogram_is_opt_in_and_matches_numpy(login):
+    client = login()
+    girl_id = add_girl(client)
+    points = [(1, 9), (5, 5), (8, 7), (9.5, 4.5), (3, 6), (7, 8), (10, 10)]
+    for hot, crazy in points:
+        add_plot(client, girl_id, hot=hot, crazy=crazy)
+
+    histogram = client.get(f"/api/zones?girl_ids={girl_id}&histogram=1").get_json()[str(girl_id)]["histogram"]
+
+    hot, crazy = np.array(points, dtype=float).T
+    expected = {zone.key: 0 for zone in zones.ZONES}
+    for index in zones.classify(hot, crazy):
+        if index != zones.UNCLASSIFIED:
+            expected[zones.ZONES[index].key] += 1
+    assert histogram == expected
+
+
+def test_zones_skip_girls_of_other_users(login):
+    alice, bob = login("alice"), login("bob")
+    bob_girl = add_girl(bob)
+    add_plot(bob, bob_girl)
+
+    assert alice.get(f"/api/zones?girl_ids={bob_girl}").get_json() == {}